@@ -3,58 +3,53 @@
 负责生成单篇完整的学习文章，根据主题类型灵活调整内容风格
 """
 import re
-import requests
+import asyncio
 from .base_agent import BaseAgent
-from config import AGENT_ROLES, ARTICLE_CONFIG, AI_CONFIG, IMAGE_CONFIG
+from . import llm_client, image_cache, context
+import image_store
+from config import AGENT_ROLES, ARTICLE_CONFIG, IMAGE_CONFIG
 
 
 class ArticleAgent(BaseAgent):
     """文章撰写专家Agent"""
     
-    def __init__(self):
+    use_cache = False  # 长文创作每次都重新生成
+    stateless = True  # 每次调用都是独立请求
+    
+    def __init__(self, config=None):
         role = AGENT_ROLES["article_writer"]
-        super().__init__(role["name"], role["system_prompt"])
+        super().__init__(role["name"], role["system_prompt"], config)
     
-    def _generate_image(self, prompt: str) -> str:
-        """调用图片生成API"""
-        try:
-            api_key = AI_CONFIG.get("api_key", "")
-            if not api_key:
-                return ""
-            
-            base_url = AI_CONFIG.get("api_base", "https://api.siliconflow.cn/v1")
-            
-            response = requests.post(
-                f"{base_url.rstrip('/')}/images/generations",
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": IMAGE_CONFIG.get("model", "black-forest-labs/FLUX.1-schnell"),
-                    "prompt": prompt,
-                    "image_size": IMAGE_CONFIG.get("image_size", "1024x576"),
-                    "num_inference_steps": IMAGE_CONFIG.get("num_inference_steps", 20)
-                },
-                timeout=90
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("images") and len(data["images"]) > 0:
-                    return data["images"][0].get("url", "")
-                if data.get("data") and len(data["data"]) > 0:
-                    return data["data"][0].get("url", "")
-            return ""
-        except Exception as e:
-            print(f"图片生成失败: {e}")
-            return ""
+    async def _agenerate_images(self, prompts: list) -> list:
+        """复用 llm_client.generate_image（共享连接池与单主机并发限制），最多同时生成 IMAGE_CONFIG["concurrency"] 张"""
+        semaphore = asyncio.Semaphore(IMAGE_CONFIG["concurrency"])
+        
+        async def generate(prompt: str) -> str:
+            # 上游URL会过期，下载到本地图片库后再缓存
+            url = await llm_client.generate_image(prompt, timeout=90.0, config=self.config)
+            return await asyncio.to_thread(image_store.mirror, url)
+        
+        async def run_one(prompt: str) -> str:
+            async with semaphore:
+                try:
+                    # 相同提示词命中缓存或与正在进行的相同请求合并
+                    return await image_cache.aget_or_generate(prompt, generate)
+                except Exception as e:
+                    print(f"图片生成失败: {e}")
+                    return ""
+        
+        return await asyncio.gather(*(run_one(prompt) for prompt in prompts))
     
-    def _insert_images_to_article(self, content: str, topic: str) -> str:
-        """在文章合适位置插入AI生成的图片"""
+    def _generate_images(self, prompts: list) -> list:
+        """并发生成多张图片，返回与 prompts 一一对应的URL列表（失败为空字符串）"""
+        if not prompts or not self.config.get("api_key"):
+            return [""] * len(prompts)
+        return llm_client.run_sync(self._agenerate_images(prompts))
+    
+    def _plan_images(self, content: str, topic: str):
+        """在文章合适位置插入配图占位符，返回 (带占位符的内容, [(占位符, 小节标题, 提示词), ...])"""
         lines = content.split('\n')
         result_lines = []
-        image_count = 0
         max_images = 2
         
         h2_positions = []
@@ -70,27 +65,52 @@ class ArticleAgent(BaseAgent):
         
         insert_after = sorted(set(insert_after))[:max_images]
         
+        images = []
         for i, line in enumerate(lines):
             result_lines.append(line)
             
-            if i in insert_after and image_count < max_images:
+            if i in insert_after:
                 section_title = line.replace('## ', '').strip() if line.startswith('## ') else topic
                 prompt = f"A professional illustration for '{topic}' article, section '{section_title}'. Modern, clean, no text, visually appealing."
-                
-                image_url = self._generate_image(prompt)
-                if image_url:
-                    result_lines.append('')
-                    result_lines.append(f'![{section_title}]({image_url})')
-                    result_lines.append('')
-                    image_count += 1
+                # HTML注释形式的占位符，Markdown渲染时不可见
+                marker = f"<!-- pending-image:{len(images)} -->"
+                result_lines.append(marker)
+                images.append((marker, section_title, prompt))
         
-        return '\n'.join(result_lines)
+        return '\n'.join(result_lines), images
+    
+    @staticmethod
+    def apply_images(content: str, images: list, urls: list) -> str:
+        """把占位符替换为图片（生成失败的占位符直接删除）"""
+        for (marker, section_title, _), url in zip(images, urls):
+            replacement = f'\n![{section_title}]({url})\n' if url else ''
+            content = content.replace(marker, replacement)
+        return content
+    
+    def _insert_images_to_article(self, content: str, topic: str) -> str:
+        """在文章合适位置插入AI生成的图片（多张图片并发生成）"""
+        content, images = self._plan_images(content, topic)
+        urls = self._generate_images([prompt for _, _, prompt in images])
+        return self.apply_images(content, images, urls)
+    
+    def fill_pending_images(self, article_id: str, images: list) -> int:
+        """延迟配图：文章保存后再生成图片，并把占位符替换回数据库中的文章，返回成功插入的图片数"""
+        import database as db
+        urls = self._generate_images([prompt for _, _, prompt in images])
+        article = db.get_article(article_id)
+        if not article:
+            return 0
+        content = self.apply_images(article.get("content") or "", images, urls)
+        db.update_article(article_id, article["title"], content)
+        return sum(1 for url in urls if url)
     
-    def generate_article(self, topic: str, description: str = "", extra_context: str = "", generate_images: bool = True) -> dict:
-        """生成完整的学习文章"""
+    def generate_article(self, topic: str, description: str = "", extra_context: str = "", generate_images: bool = True, on_delta=None) -> dict:
+        """生成完整的学习文章（传入 on_delta 时流式回调正文增量）"""
         context_section = ""
         if extra_context:
-            context_section = f"\n\n参考资料：\n{extra_context[:3000]}\n"
+            reference = context.pack(extra_context, context.budget_for("article_reference"),
+                                     query=f"{topic} {description}", model=self.config.get("model"))
+            context_section = f"\n\n参考资料：\n{reference}\n"
 
         prompt = f"""请撰写一篇关于「{topic}」的高质量深度学习文章。
 
@@ -140,11 +160,16 @@ class Singleton:
 
 直接输出文章内容："""
 
-        content = self.chat(prompt, temperature=0.8)
+        content = self.chat(prompt, temperature=0.8, on_delta=on_delta)
         
+        pending_images = []
         if generate_images:
             try:
-                content = self._insert_images_to_article(content, topic)
+                if IMAGE_CONFIG.get("deferred"):
+                    # 只插入占位符，由调用方在文章保存后调用 fill_pending_images
+                    content, pending_images = self._plan_images(content, topic)
+                else:
+                    content = self._insert_images_to_article(content, topic)
             except Exception as e:
                 print(f"插入图片时出错: {e}")
         
@@ -157,5 +182,6 @@ class Singleton:
             "title": title,
             "content": content,
             "topic": topic,
-            "word_count": len(content)
+            "word_count": len(content),
+            "pending_images": pending_images
         }
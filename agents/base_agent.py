@@ -3,98 +3,130 @@
 参考 AutoGen 框架的多智能体设计模式
 """
 import os
-import httpx
-from openai import OpenAI
-from config import AI_CONFIG
+import asyncio
+from config_service import get_ai_config
+from . import llm_client, llm_cache, context
 
 # 清除可能导致问题的代理环境变量
 for key in ['HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy', 'ALL_PROXY', 'all_proxy']:
     os.environ.pop(key, None)
 
 
-# 全局共享的HTTP客户端（连接池复用）
-_shared_http_client = None
-_shared_openai_client = None
-
-def get_shared_client():
-    """获取共享的OpenAI客户端（连接池复用）"""
-    global _shared_http_client, _shared_openai_client
-    
-    # 检查API配置是否变化，如果变化则重建客户端
-    current_key = AI_CONFIG.get("api_key", "")
-    current_base = AI_CONFIG.get("api_base", "")
-    
-    if _shared_openai_client is None or \
-       getattr(_shared_openai_client, '_cached_key', None) != current_key or \
-       getattr(_shared_openai_client, '_cached_base', None) != current_base:
-        
-        if _shared_http_client:
-            try:
-                _shared_http_client.close()
-            except:
-                pass
-        
-        _shared_http_client = httpx.Client(
-            timeout=httpx.Timeout(300.0, connect=30.0),
-            follow_redirects=True
-        )
-        _shared_openai_client = OpenAI(
-            api_key=current_key,
-            base_url=current_base,
-            http_client=_shared_http_client,
-            timeout=300.0
-        )
-        _shared_openai_client._cached_key = current_key
-        _shared_openai_client._cached_base = current_base
-    
-    return _shared_openai_client
-
-
 class BaseAgent:
     """基础Agent类，所有专业Agent的父类"""
     
-    def __init__(self, name: str, system_prompt: str):
+    # 是否默认使用响应缓存（创作类长文本Agent关闭，每次调用都应重新生成）
+    use_cache = True
+    # 无状态Agent不保存对话历史：每次调用都是独立的一次性请求，不重复发送之前的长文本
+    stateless = False
+    
+    def __init__(self, name: str, system_prompt: str, config=None):
         self.name = name
         self.system_prompt = system_prompt
         self.conversation_history = []
+        # 创建时取一份只读配置快照，Agent 生命周期内不受配置保存影响
+        self.config = config or get_ai_config()
+    
+    def _request_params(self, temperature: float = None):
+        """确保配置有效，返回 (model, temperature, max_tokens)"""
+        model = self.config.get("model") or "deepseek-ai/DeepSeek-V3"
+        temp = temperature or self.config.get("temperature", 0.7)
+        max_tokens = self.config.get("max_tokens", 65536)
+        return model, temp, max_tokens
+    
+    def _build_messages(self, message: str) -> list:
+        """组装请求消息，对话历史按 CONTEXT_CONFIG 的Token预算裁剪"""
+        system = {"role": "system", "content": self.system_prompt}
+        user = {"role": "user", "content": message}
+        history = []
+        if self.conversation_history:
+            model = self.config.get("model")
+            budget = context.history_budget(model, context.count_messages([system, user], model))
+            history = context.fit_history(self.conversation_history, budget, model)
+        return [system, *history, user]
     
-    def _get_client(self):
-        """获取共享OpenAI客户端"""
-        return get_shared_client()
+    def _remember(self, message: str, assistant_message: str):
+        """保存对话历史（无状态Agent不保存）"""
+        if self.stateless:
+            return
+        self.conversation_history.append({"role": "user", "content": message})
+        self.conversation_history.append({"role": "assistant", "content": assistant_message})
     
-    def chat(self, message: str, temperature: float = None) -> str:
-        """与Agent对话"""
-        client = self._get_client()
+    def _get_cache(self, use_cache: bool = None):
+        """本次调用使用的缓存（use_cache=False 可单次绕过缓存）"""
+        if use_cache is None:
+            use_cache = self.use_cache
+        return llm_cache.get_cache() if use_cache else None
+    
+    def chat(self, message: str, temperature: float = None, on_delta=None, use_cache: bool = None) -> str:
+        """与Agent对话（同步版本，在 llm_client 的共享事件循环中执行 achat/astream；传入 on_delta 回调时逐段回调增量文本）"""
+        if on_delta is None:
+            return llm_client.run_sync(self.achat(message, temperature, use_cache))
         
-        # 确保配置有效
-        model = AI_CONFIG.get("model") or "deepseek-ai/DeepSeek-V3"
-        temp = temperature or AI_CONFIG.get("temperature", 0.7)
-        max_tokens = AI_CONFIG.get("max_tokens", 65536)
+        async def consume() -> str:
+            parts = []
+            async for delta in self.astream(message, temperature, use_cache):
+                parts.append(delta)
+                on_delta(delta)
+            return "".join(parts)
         
-        messages = [
-            {"role": "system", "content": self.system_prompt},
-            *self.conversation_history,
-            {"role": "user", "content": message}
-        ]
+        return llm_client.run_sync(consume())
+    
+    async def _acache_get(self, cache, key: str):
+        # 磁盘/MySQL 后端放到线程中执行，避免阻塞事件循环
+        if cache.blocking:
+            return await asyncio.to_thread(cache.get, key)
+        return cache.get(key)
+    
+    async def _acache_set(self, cache, key: str, value: str):
+        if cache.blocking:
+            await asyncio.to_thread(cache.set, key, value)
+        else:
+            cache.set(key, value)
+    
+    async def achat(self, message: str, temperature: float = None, use_cache: bool = None) -> str:
+        """与Agent对话（异步，使用共享的 httpx.AsyncClient 连接池）"""
+        model, temp, max_tokens = self._request_params(temperature)
+        messages = self._build_messages(message)
         
-        response = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            temperature=temp,
-            max_tokens=max_tokens
-        )
+        cache = self._get_cache(use_cache)
+        cache_key = llm_cache.make_key(model, messages, temp) if cache else None
+        cached = await self._acache_get(cache, cache_key) if cache else None
+        if cached is not None:
+            self._remember(message, cached)
+            return cached
         
-        # 兼容不同API的响应格式（content 或 reasoning_content）
-        if not response or not response.choices:
-            raise Exception("AI API返回空响应")
-        msg = response.choices[0].message
-        assistant_message = getattr(msg, 'content', None) or getattr(msg, 'reasoning_content', '') or ''
+        assistant_message = await llm_client.chat_completion(
+            messages, model=model, temperature=temp, max_tokens=max_tokens, config=self.config
+        )
+        if cache and assistant_message:
+            await self._acache_set(cache, cache_key, assistant_message)
+        self._remember(message, assistant_message)
+        return assistant_message
+    
+    async def astream(self, message: str, temperature: float = None, use_cache: bool = None):
+        """与Agent对话（异步流式），逐段产出增量文本"""
+        model, temp, max_tokens = self._request_params(temperature)
+        messages = self._build_messages(message)
         
-        # 保存对话历史
-        self.conversation_history.append({"role": "user", "content": message})
-        self.conversation_history.append({"role": "assistant", "content": assistant_message})
+        cache = self._get_cache(use_cache)
+        cache_key = llm_cache.make_key(model, messages, temp) if cache else None
+        cached = await self._acache_get(cache, cache_key) if cache else None
+        if cached is not None:
+            self._remember(message, cached)
+            yield cached
+            return
         
-        return assistant_message
+        parts = []
+        async for delta in llm_client.stream_chat_completion(
+            messages, model=model, temperature=temp, max_tokens=max_tokens, config=self.config
+        ):
+            parts.append(delta)
+            yield delta
+        assistant_message = "".join(parts)
+        if cache and assistant_message:
+            await self._acache_set(cache, cache_key, assistant_message)
+        self._remember(message, assistant_message)
     
     def reset(self):
         """重置对话历史（不销毁共享客户端）"""
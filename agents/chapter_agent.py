@@ -2,6 +2,7 @@
 章节撰写Agent
 负责根据大纲生成具体章节内容，支持联网搜索权威资料
 """
+import asyncio
 from .base_agent import BaseAgent
 from .content_parser import ContentParser
 from config import AGENT_ROLES, DOCUMENT_CONFIG
@@ -10,14 +11,17 @@ from config import AGENT_ROLES, DOCUMENT_CONFIG
 class ChapterAgent(BaseAgent):
     """章节撰写专家Agent"""
     
-    def __init__(self):
+    use_cache = False  # 长文创作每次都重新生成
+    stateless = True  # 每次调用都是独立请求
+    
+    def __init__(self, config=None):
         role = AGENT_ROLES["chapter_writer"]
-        super().__init__(role["name"], role["system_prompt"])
+        super().__init__(role["name"], role["system_prompt"], config)
         self.parser = None
     
     def _get_parser(self):
         if self.parser is None:
-            self.parser = ContentParser()
+            self.parser = ContentParser(self.config)
         return self.parser
     
     def search_references(self, topic: str, keywords: list) -> str:
@@ -37,25 +41,14 @@ class ChapterAgent(BaseAgent):
             print(f"搜索参考资料失败: {e}")
         return ""
     
-    def generate_chapter(self, chapter_info: dict, document_context: dict, enable_search: bool = False) -> str:
-        """生成单个章节内容"""
-        self.reset()
-        
+    def _build_prompt(self, chapter_info: dict, document_context: dict, reference_content: str = "") -> str:
+        """构建章节撰写提示词"""
         chapters_overview = "\n".join([
             f"第{ch['id']}章: {ch['title']}" 
             for ch in document_context.get('chapters', [])
         ])
-        
-        # 搜索参考资料
-        reference_content = ""
-        if enable_search:
-            keywords = chapter_info.get('keywords', [chapter_info['title']])
-            reference_content = self.search_references(
-                document_context.get('topic', ''),
-                keywords
-            )
 
-        prompt = f"""撰写学习文档章节：
+        return f"""撰写学习文档章节：
 
 文档：{document_context.get('title', '')}
 目录：{chapters_overview}
@@ -114,9 +107,39 @@ class ChapterAgent(BaseAgent):
 
 直接输出章节内容。"""
 
+    def _search_for(self, chapter_info: dict, document_context: dict) -> str:
+        keywords = chapter_info.get('keywords', [chapter_info['title']])
+        return self.search_references(document_context.get('topic', ''), keywords)
+    
+    def generate_chapter(self, chapter_info: dict, document_context: dict, enable_search: bool = False) -> str:
+        """生成单个章节内容"""
+        self.reset()
+        
+        # 搜索参考资料
+        reference_content = self._search_for(chapter_info, document_context) if enable_search else ""
+        prompt = self._build_prompt(chapter_info, document_context, reference_content)
+        
         content = self.chat(prompt, temperature=0.7)
         return content
     
+    async def agenerate_chapter(self, chapter_info: dict, document_context: dict, enable_search: bool = False, on_delta=None) -> str:
+        """生成单个章节内容（异步，传入 on_delta 时流式回调增量）"""
+        self.reset()
+        
+        reference_content = ""
+        if enable_search:
+            reference_content = await asyncio.to_thread(self._search_for, chapter_info, document_context)
+        prompt = self._build_prompt(chapter_info, document_context, reference_content)
+        
+        if on_delta is None:
+            return await self.achat(prompt, temperature=0.7)
+        
+        parts = []
+        async for delta in self.astream(prompt, temperature=0.7):
+            parts.append(delta)
+            on_delta(delta)
+        return "".join(parts)
+    
     def generate_all_chapters(self, outline: dict, progress_callback=None) -> list:
         """批量生成所有章节（串行方式，用于兼容）"""
         chapters = []
@@ -8,13 +8,16 @@ import json
 import httpx
 from typing import List, Optional
 from .base_agent import BaseAgent
+from . import context
 from config import AI_CONFIG
 
 
 class ContentParser(BaseAgent):
     """内容解析专家Agent"""
     
-    def __init__(self):
+    stateless = True  # 每次调用都是独立请求，不累积对话历史
+    
+    def __init__(self, config=None):
         system_prompt = """你是一位专业的内容分析专家，擅长从各种来源提取和整理信息。
 你的任务是分析用户提供的内容，提取关键信息，并整理成结构化的学习资料。
 
@@ -23,15 +26,16 @@ class ContentParser(BaseAgent):
 2. 保持信息的完整性和准确性
 3. 整理成清晰的结构
 4. 标注信息来源"""
-        super().__init__("内容解析专家", system_prompt)
+        super().__init__("内容解析专家", system_prompt, config)
     
-    def parse_text_file(self, content: str, filename: str) -> dict:
-        """解析文本文件内容"""
+    def parse_text_file(self, content: str, filename: str, query: str = "") -> dict:
+        """解析文本文件内容（内容过长时优先保留与 query 相关的片段）"""
+        content = context.pack(content, context.budget_for("parse_file"), query, self.config.get("model"))
         prompt = f"""请分析以下文档内容，提取关键信息：
 
 文件名：{filename}
 内容：
-{content[:8000]}  # 限制长度
+{content}
 
 请提取：
 1. 文档主题
@@ -62,22 +66,23 @@ class ContentParser(BaseAgent):
         response = self.chat(prompt)
         return {"description": image_description, "analysis": response}
     
-    def parse_url(self, url: str) -> dict:
-        """解析网页链接内容"""
+    def parse_url(self, url: str, query: str = "") -> dict:
+        """解析网页链接内容（内容过长时优先保留与 query 相关的片段）"""
         try:
             # 简单获取网页内容
             with httpx.Client(timeout=30.0) as client:
                 response = client.get(url, follow_redirects=True)
                 content = response.text
             
-            # 简单提取文本（去除HTML标签）
+            # 简单提取文本（去除HTML标签，保留段落换行便于按段落切块）
             text = re.sub(r'<script[^>]*>[\s\S]*?</script>', '', content)
-            text = re.sub(r'<style[^>]*>[\s\S]*?</style>', '', content)
+            text = re.sub(r'<style[^>]*>[\s\S]*?</style>', '', text)
+            text = re.sub(r'</(p|div|li|h[1-6]|section|article|tr)>|<br\s*/?>', '\n\n', text, flags=re.I)
             text = re.sub(r'<[^>]+>', ' ', text)
-            text = re.sub(r'\s+', ' ', text).strip()
+            text = re.sub(r'[ \t\r\f\v]+', ' ', text)
+            text = re.sub(r'\s*\n\s*', '\n\n', text).strip()
             
-            # 限制长度
-            text = text[:5000]
+            text = context.pack(text, context.budget_for("parse_url"), query, self.config.get("model"))
             
             prompt = f"""请分析以下网页内容，提取关键学习信息：
 
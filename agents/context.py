@@ -0,0 +1,268 @@
+"""
+上下文窗口管理
+按模型计算Token数（安装 tiktoken 时精确计数，否则按字符粗估），
+发送前把对话历史裁剪到预算内：truncate 直接丢弃最早的轮次，summarize 把丢弃的轮次压缩成一条摘要消息；
+参考资料（文件、网页、搜索结果、文章正文）按相关度挑选片段装进Token预算
+"""
+import re
+import math
+import threading
+from config import CONTEXT_CONFIG
+from retrieval import tokenize
+
+try:
+    import tiktoken
+except ImportError:  # requirements.txt 已包含；未安装时按字符估算
+    tiktoken = None
+
+# 每条消息的格式开销（role、分隔符等）
+MESSAGE_OVERHEAD = 4
+CJK_PATTERN = re.compile(r"[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+_encodings = {}
+_encodings_lock = threading.Lock()
+
+
+def _get_encoding(model: str = None):
+    """按模型获取 tiktoken 编码（未安装或不认识的模型回退到 cl100k_base），不可用时返回 None"""
+    if tiktoken is None:
+        return None
+    name = model or ""
+    encoding = _encodings.get(name)
+    if encoding is None:
+        with _encodings_lock:
+            encoding = _encodings.get(name)
+            if encoding is None:
+                try:
+                    encoding = tiktoken.encoding_for_model(name)
+                except (KeyError, ValueError):
+                    encoding = _fallback_encoding()
+                except Exception as e:  # 编码文件下载失败等
+                    print(f"加载 tiktoken 编码失败，改为按字符估算Token: {e}")
+                    encoding = False
+                _encodings[name] = encoding
+    return encoding or None
+
+
+def _fallback_encoding():
+    """cl100k_base；编码文件无法获取（离线环境首次下载失败）时返回 False，之后按字符估算"""
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"加载 tiktoken 编码失败，改为按字符估算Token: {e}")
+        return False
+
+
+def count_tokens(text: str, model: str = None) -> int:
+    """计算文本的Token数；无 tiktoken 时中日韩字符按 1 字 ≈ 1 Token、其余按 4 字符 ≈ 1 Token 估算"""
+    if not text:
+        return 0
+    encoding = _get_encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_messages(messages: list, model: str = None) -> int:
+    """计算消息列表的Token数（含每条消息的格式开销）"""
+    return sum(count_tokens(m.get("content") or "", model) + MESSAGE_OVERHEAD for m in messages)
+
+
+def history_budget(model: str, fixed_tokens: int) -> int:
+    """对话历史可用的Token数：不超过 history_tokens，且与固定部分（系统提示 + 本次消息）合计不超出上下文窗口"""
+    available = CONTEXT_CONFIG["context_window"] - CONTEXT_CONFIG["reserve_output_tokens"] - fixed_tokens
+    return max(0, min(CONTEXT_CONFIG["history_tokens"], available))
+
+
+def _turns(history: list) -> list:
+    """把历史按 (user, assistant) 分成轮次，保持原顺序"""
+    turns, current = [], []
+    for message in history:
+        if message.get("role") == "user" and current:
+            turns.append(current)
+            current = []
+        current.append(message)
+    if current:
+        turns.append(current)
+    return turns
+
+
+def _summary_lines(turns: list) -> list:
+    """被丢弃轮次的抽取式摘要（每条消息截取开头，不额外调用模型）"""
+    limit = CONTEXT_CONFIG["summary_chars"]
+    lines = []
+    for turn in turns:
+        for message in turn:
+            text = " ".join((message.get("content") or "").split())
+            if len(text) > limit:
+                text = text[:limit] + "…"
+            lines.append(f"- {'用户' if message.get('role') == 'user' else '助手'}：{text}")
+    return lines
+
+
+def fit_history(history: list, budget: int, model: str = None, policy: str = None) -> list:
+    """
+    把对话历史裁剪到 budget 个Token以内，优先保留最近的轮次
+
+    Args:
+        history: 对话历史（user / assistant 交替）
+        budget: 历史可用的Token数
+        model: 计数所用的模型名
+        policy: truncate / summarize，默认取 CONTEXT_CONFIG["policy"]
+
+    Returns:
+        发送给模型的历史消息列表（不修改原列表）
+    """
+    if not history:
+        return []
+    policy = policy or CONTEXT_CONFIG["policy"]
+    turns = _turns(history)
+    if CONTEXT_CONFIG["max_turns"]:
+        turns_kept = turns[-CONTEXT_CONFIG["max_turns"]:]
+    else:
+        turns_kept = turns
+
+    used = sum(count_messages(turn, model) for turn in turns_kept)
+    while turns_kept and used > budget:
+        used -= count_messages(turns_kept[0], model)
+        turns_kept = turns_kept[1:]
+
+    messages = [m for turn in turns_kept for m in turn]
+    dropped = turns[:len(turns) - len(turns_kept)]
+    if dropped and policy == "summarize":
+        lines = _summary_lines(dropped)
+        # 摘要本身也占预算，放不下时从最早的一条开始去掉
+        while lines:
+            summary = {"role": "system", "content": "此前对话摘要（已省略细节）：\n" + "\n".join(lines)}
+            if count_messages([summary], model) <= budget - used:
+                messages.insert(0, summary)
+                break
+            lines = lines[1:]
+    return messages
+
+
+# ---------- 参考资料打包 ----------
+SENTENCE_END = re.compile(r"(?<=[。！？!?；;\n])|(?<=\. )")
+GAP_MARKER = "\n\n……\n\n"
+MAX_CHARS_PER_TOKEN = 16  # 单个Token对应字符数的上限估计（用于限定计数窗口）
+
+
+def budget_for(name: str) -> int:
+    """某类参考资料的Token预算（不超过当前模型上下文窗口的一半）"""
+    return min(CONTEXT_CONFIG["budgets"][name], CONTEXT_CONFIG["context_window"] // 2)
+
+
+def truncate_tokens(text: str, budget: int, model: str = None) -> str:
+    """截断到 budget 个Token以内（只编码/扫描一遍，长文本也是线性时间）"""
+    if budget <= 0 or not text:
+        return ""
+    encoding = _get_encoding(model)
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= budget:
+            return text
+        # 截断处可能落在多字节字符中间，去掉不完整的字符
+        head = encoding.decode(tokens[:budget]).rstrip("\ufffd")
+        return text[:len(head)] if text.startswith(head) else head
+    # 与 count_tokens 的估算一致：中日韩字符各 1 Token，其余字符每 4 个 1 Token
+    cjk = other = 0
+    for index, char in enumerate(text):
+        if CJK_PATTERN.match(char):
+            cjk += 1
+        else:
+            other += 1
+        if cjk + (other + 3) // 4 > budget:
+            return text[:index]
+    return text
+
+
+def split_chunks(text: str, chunk_tokens: int = None, model: str = None) -> list:
+    """按段落切块，相邻短段落合并、超长段落按句子再拆，每块不超过 chunk_tokens"""
+    chunk_tokens = chunk_tokens or CONTEXT_CONFIG["chunk_tokens"]
+    pieces = []  # (文本, 是否为新段落的开头)
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if count_tokens(paragraph, model) <= chunk_tokens:
+            pieces.append((paragraph, True))
+            continue
+        first = True
+        window = chunk_tokens * MAX_CHARS_PER_TOKEN
+        for sentence in SENTENCE_END.split(paragraph):
+            while sentence:
+                # 只对开头一段计数，没有句末标点的超长文本也不会反复编码整段剩余内容
+                head = truncate_tokens(sentence[:window], chunk_tokens, model) or sentence[:1]
+                pieces.append((head, first))
+                first = False
+                sentence = sentence[len(head):]
+
+    chunks, current, current_tokens = [], "", 0
+    for piece, new_paragraph in pieces:
+        tokens = count_tokens(piece, model)
+        # 新标题总是开启新块，便于按小节取舍
+        if current and (current_tokens + tokens > chunk_tokens or piece.startswith("#")):
+            chunks.append(current)
+            current, current_tokens = "", 0
+        if current:
+            current += "\n\n" + piece if new_paragraph else piece
+        else:
+            current = piece
+        current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def rank_chunks(chunks: list, query: str) -> list:
+    """按与 query 的相关度（词项频率 × 逆文档频率，越靠前略加分）返回块下标，相关度高的在前"""
+    query_terms = set(tokenize(query))
+    if not query_terms:
+        return list(range(len(chunks)))
+    chunk_terms = [tokenize(chunk) for chunk in chunks]
+    idf = {}
+    for term in query_terms:
+        df = sum(1 for terms in chunk_terms if term in terms)
+        idf[term] = math.log((len(chunks) + 1) / (df + 0.5))
+
+    def score(index: int) -> float:
+        terms = chunk_terms[index]
+        if not terms:
+            return 0.0
+        total = sum((1 + math.log(terms.count(term))) * idf[term] for term in query_terms if term in terms)
+        return total / math.sqrt(len(terms)) + 0.1 / (index + 1)
+
+    return sorted(range(len(chunks)), key=lambda i: (-score(i), i))
+
+
+def pack(text: str, budget: int, query: str = "", model: str = None) -> str:
+    """
+    把参考资料装进 budget 个Token以内
+
+    整体放得下时原样返回；否则切块后按与 query 的相关度挑选（没有 query 时按原文顺序），
+    选中的块按原文顺序拼接，不相邻处用省略号隔开
+    """
+    text = (text or "").strip()
+    if not text or count_tokens(text, model) <= budget:
+        return text
+    chunks = split_chunks(text, min(CONTEXT_CONFIG["chunk_tokens"], budget), model)
+    order = rank_chunks(chunks, query) if query else list(range(len(chunks)))
+
+    gap_tokens = count_tokens(GAP_MARKER, model)
+    selected, used = [], 0
+    for index in order:
+        cost = count_tokens(chunks[index], model) + gap_tokens
+        if used + cost <= budget:
+            selected.append(index)
+            used += cost
+        elif not query:
+            break  # 按原文顺序时不跳块，保持内容连贯
+    if not selected:
+        return truncate_tokens(chunks[order[0]], budget, model)
+
+    selected.sort()
+    parts = [chunks[selected[0]]]
+    for previous, index in zip(selected, selected[1:]):
+        parts.append(("\n\n" if index == previous + 1 else GAP_MARKER) + chunks[index])
+    return "".join(parts)
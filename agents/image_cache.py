@@ -0,0 +1,101 @@
+"""
+图片生成结果缓存
+按 (model, prompt, image_size, num_inference_steps) 缓存已本地化的图片URL，
+并发的相同请求通过单飞合并为一次上游调用
+"""
+import json
+import asyncio
+import hashlib
+import threading
+import image_store
+from config import IMAGE_CONFIG, IMAGE_CACHE_CONFIG
+from singleflight import SingleFlight
+from .llm_cache import MemoryCache, DiskCache
+
+_flight = SingleFlight()
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def make_key(prompt: str) -> str:
+    raw = json.dumps({
+        "model": IMAGE_CONFIG.get("model"),
+        "prompt": prompt,
+        "image_size": IMAGE_CONFIG.get("image_size"),
+        "num_inference_steps": IMAGE_CONFIG.get("num_inference_steps"),
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def get_cache():
+    """按 IMAGE_CACHE_CONFIG 创建缓存，backend 为 none 时返回 None"""
+    global _cache
+    backend = IMAGE_CACHE_CONFIG["backend"]
+    if _cache is None and backend != "none":
+        with _cache_lock:
+            if _cache is None:
+                max_entries, ttl = IMAGE_CACHE_CONFIG["max_entries"], IMAGE_CACHE_CONFIG["ttl"]
+                if backend == "disk":
+                    _cache = DiskCache(IMAGE_CACHE_CONFIG["disk_path"], max_entries, ttl)
+                else:
+                    _cache = MemoryCache(max_entries, ttl)
+    return _cache
+
+
+def _cacheable(url: str) -> bool:
+    # 只缓存本地图片：上游返回的临时URL很快会过期
+    return bool(url) and url.startswith(image_store.URL_PREFIX)
+
+
+def _lookup(cache, key: str):
+    url = cache.get(key)
+    if url and image_store.exists(url):
+        return url
+    return None
+
+
+def get_or_generate(prompt: str, generate) -> str:
+    """同步：命中缓存直接返回，否则调用 generate(prompt)（应返回本地化后的URL）"""
+    cache = get_cache()
+    key = make_key(prompt)
+    if cache:
+        url = _lookup(cache, key)
+        if url:
+            return url
+
+    def run():
+        url = generate(prompt)
+        if cache and _cacheable(url):
+            cache.set(key, url)
+        return url
+
+    return _flight.do(key, run)
+
+
+async def aget_or_generate(prompt: str, agenerate) -> str:
+    """异步版本：agenerate(prompt) 为协程函数"""
+    cache = get_cache()
+    key = make_key(prompt)
+    if cache:
+        url = await asyncio.to_thread(_lookup, cache, key) if cache.blocking else _lookup(cache, key)
+        if url:
+            return url
+
+    async def run():
+        url = await agenerate(prompt)
+        if cache and _cacheable(url):
+            if cache.blocking:
+                await asyncio.to_thread(cache.set, key, url)
+            else:
+                cache.set(key, url)
+        return url
+
+    return await _flight.ado(key, run)
+
+
+def get_stats() -> dict:
+    cache = get_cache()
+    stats = {"backend": IMAGE_CACHE_CONFIG["backend"], "single_flight": _flight.stats()}
+    if cache:
+        stats.update(size=cache.size(), **cache.stats.to_dict())
+    return stats
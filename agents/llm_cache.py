@@ -0,0 +1,208 @@
+"""
+LLM响应缓存
+按 (model, system_prompt, messages, temperature) 的哈希缓存助手回复，
+后端可选内存LRU / 磁盘(SQLite) / MySQL，支持TTL与条目数上限
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from config import LLM_CACHE_CONFIG
+
+
+def make_key(model: str, messages: list, temperature: float) -> str:
+    """缓存键：请求内容的 SHA-256（messages 第一条即 system_prompt）"""
+    raw = json.dumps(
+        {"model": model, "messages": messages, "temperature": temperature},
+        ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class CacheStats:
+    """命中率统计"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def record(self, field: str, count: int = 1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + count)
+
+    def to_dict(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class MemoryCache:
+    """进程内LRU缓存"""
+    blocking = False
+
+    def __init__(self, max_entries: int, ttl: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._data.get(key)
+            if item and item[0] > time.time():
+                self._data.move_to_end(key)
+                self.stats.record("hits")
+                return item[1]
+            if item:
+                del self._data[key]
+        self.stats.record("misses")
+        return None
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._data[key] = (time.time() + self.ttl, value)
+            self._data.move_to_end(key)
+            evicted = 0
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                evicted += 1
+        self.stats.record("writes")
+        if evicted:
+            self.stats.record("evictions", evicted)
+
+    def size(self) -> int:
+        return len(self._data)
+
+
+class DiskCache:
+    """SQLite文件缓存（单机多进程共享，重启不丢失）"""
+    blocking = True
+
+    def __init__(self, path: str, max_entries: int, ttl: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY, value TEXT, expires_at REAL, accessed_at REAL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_accessed ON llm_cache (accessed_at)')
+        self._conn.commit()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT value, expires_at FROM llm_cache WHERE key = ?', (key,)).fetchone()
+            if row and row[1] > now:
+                self._conn.execute('UPDATE llm_cache SET accessed_at = ? WHERE key = ?', (now, key))
+                self._conn.commit()
+                self.stats.record("hits")
+                return row[0]
+        self.stats.record("misses")
+        return None
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO llm_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)',
+                (key, value, now + self.ttl, now)
+            )
+            # 先删过期条目，再按最近访问时间淘汰超出上限的条目
+            evicted = self._conn.execute('DELETE FROM llm_cache WHERE expires_at <= ?', (now,)).rowcount
+            evicted += self._conn.execute('''
+                DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_entries,)).rowcount
+            self._conn.commit()
+        self.stats.record("writes")
+        if evicted:
+            self.stats.record("evictions", evicted)
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM llm_cache').fetchone()[0]
+
+
+class MySQLCache:
+    """MySQL表缓存（多节点共享）"""
+    blocking = True
+
+    def __init__(self, max_entries: int, ttl: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._writes_since_trim = 0
+
+    def get(self, key: str):
+        import database as db
+        value = db.get_llm_cache(key)
+        self.stats.record("hits" if value is not None else "misses")
+        return value
+
+    def set(self, key: str, value: str):
+        import database as db
+        db.set_llm_cache(key, value, self.ttl)
+        self.stats.record("writes")
+        # 每写入一定次数清理一次过期/超限条目，避免每次写都扫表
+        self._writes_since_trim += 1
+        if self._writes_since_trim >= 50:
+            self._writes_since_trim = 0
+            self.stats.record("evictions", db.trim_llm_cache(self.max_entries))
+
+    def size(self) -> int:
+        import database as db
+        return db.count_llm_cache()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """按 LLM_CACHE_CONFIG 创建全局缓存，backend 为 none 时返回 None"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                backend = LLM_CACHE_CONFIG["backend"]
+                max_entries, ttl = LLM_CACHE_CONFIG["max_entries"], LLM_CACHE_CONFIG["ttl"]
+                if backend == "none":
+                    return None
+                if backend == "disk":
+                    _cache = DiskCache(LLM_CACHE_CONFIG["disk_path"], max_entries, ttl)
+                elif backend == "mysql":
+                    _cache = MySQLCache(max_entries, ttl)
+                else:
+                    _cache = MemoryCache(max_entries, ttl)
+    return _cache
+
+
+def get_stats() -> dict:
+    """缓存指标（供 /api/metrics 使用）"""
+    cache = get_cache()
+    if cache is None:
+        return {"backend": "none"}
+    try:
+        size = cache.size()
+    except Exception:
+        size = None
+    return {"backend": LLM_CACHE_CONFIG["backend"], "size": size, **cache.stats.to_dict()}
@@ -0,0 +1,272 @@
+"""
+异步LLM客户端
+全局共享的 httpx.AsyncClient（连接池 + HTTP/2 + 单主机并发限制），
+供 FastAPI 接口和 Agent 的 achat/astream 直接 await 调用；
+同步代码（生成线程、asyncio.to_thread 中的 Agent）通过 run_sync 在共享事件循环中执行，走同一个连接池和并发限制
+"""
+import json
+import asyncio
+import weakref
+import threading
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+import httpx
+from config import IMAGE_CONFIG, HTTP_CONFIG, RATE_LIMIT_CONFIG
+from config_service import get_ai_config, aget_ai_config
+from . import rate_limiter
+
+
+class LLMError(Exception):
+    """上游API返回非200响应"""
+
+    def __init__(self, message: str, status_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+# 每个事件循环一个客户端（httpx 连接与创建它的事件循环绑定）
+_async_clients = weakref.WeakKeyDictionary()
+_host_semaphores = weakref.WeakKeyDictionary()
+
+
+def _build_async_client() -> httpx.AsyncClient:
+    """创建带连接池限制的异步HTTP客户端"""
+    limits = httpx.Limits(
+        max_connections=HTTP_CONFIG["max_connections"],
+        max_keepalive_connections=HTTP_CONFIG["max_keepalive_connections"],
+        keepalive_expiry=HTTP_CONFIG["keepalive_expiry"]
+    )
+    timeout = httpx.Timeout(HTTP_CONFIG["timeout"], connect=HTTP_CONFIG["connect_timeout"])
+    try:
+        return httpx.AsyncClient(http2=HTTP_CONFIG["http2"], limits=limits, timeout=timeout, follow_redirects=True)
+    except ImportError:
+        # 未安装 h2 时退回 HTTP/1.1
+        return httpx.AsyncClient(limits=limits, timeout=timeout, follow_redirects=True)
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """获取当前事件循环共享的异步HTTP客户端"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = _build_async_client()
+        _async_clients[loop] = client
+    return client
+
+
+async def close_async_client():
+    """关闭当前事件循环的共享客户端（应用关闭或独立事件循环结束时调用）"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.pop(loop, None)
+    _host_semaphores.pop(loop, None)
+    if client is not None:
+        await client.aclose()
+
+
+# 同步调用使用的事件循环：应用进程绑定主事件循环，独立进程（worker）按需启动后台事件循环线程
+_sync_loop = None
+_sync_loop_lock = threading.Lock()
+
+
+def bind_loop(loop):
+    """绑定主事件循环（应用启动时调用，关闭时传 None），同步调用与接口共用客户端和单主机并发限制"""
+    global _sync_loop
+    with _sync_loop_lock:
+        _sync_loop = loop
+
+
+def _get_sync_loop():
+    global _sync_loop
+    with _sync_loop_lock:
+        if _sync_loop is None or _sync_loop.is_closed():
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="llm-client-loop", daemon=True).start()
+            _sync_loop = loop
+        return _sync_loop
+
+
+def run_sync(coro):
+    """在共享事件循环中执行协程并阻塞等待结果（不能在该事件循环的线程内调用）"""
+    loop = _get_sync_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        coro.close()
+        raise RuntimeError("run_sync 不能在共享事件循环中调用，请直接 await")
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+@asynccontextmanager
+async def _host_slot(url: str):
+    """按主机限制并发连接数，避免单个上游占满整个连接池"""
+    loop = asyncio.get_running_loop()
+    semaphores = _host_semaphores.setdefault(loop, {})
+    host = urlsplit(url).netloc
+    semaphore = semaphores.get(host)
+    if semaphore is None:
+        semaphore = semaphores[host] = asyncio.Semaphore(HTTP_CONFIG["max_connections_per_host"])
+    async with semaphore:
+        yield
+
+
+async def request(method: str, url: str, **kwargs) -> httpx.Response:
+    """通过共享客户端发送请求"""
+    async with _host_slot(url):
+        return await get_async_client().request(method, url, **kwargs)
+
+
+@asynccontextmanager
+async def stream(method: str, url: str, **kwargs):
+    """通过共享客户端发送流式请求"""
+    async with _host_slot(url):
+        async with get_async_client().stream(method, url, **kwargs) as response:
+            yield response
+
+
+def _api_settings(config: dict = None):
+    config = config or get_ai_config()
+    api_base = (config.get("api_base") or "https://api.siliconflow.cn/v1").rstrip('/')
+    headers = {
+        "Authorization": f"Bearer {config.get('api_key', '')}",
+        "Content-Type": "application/json"
+    }
+    return api_base, headers
+
+
+def _limiter_for(config: dict, kind: str = "chat"):
+    return rate_limiter.get_limiter(config.get("api_base", ""), config.get("api_key", ""), kind)
+
+
+def _retry_delay(response: httpx.Response, attempt: int, outcome: dict) -> float:
+    """非200响应：可重试（429/5xx）时返回退避秒数，否则抛出 LLMError"""
+    status = response.status_code
+    retry_after = rate_limiter.parse_retry_after(response.headers)
+    if status == 429:
+        outcome["throttled"] = True
+        outcome["retry_after"] = retry_after
+    elif status >= 500:
+        outcome["failed"] = True
+    if status not in rate_limiter.RETRYABLE_STATUS or attempt >= RATE_LIMIT_CONFIG["max_retries"]:
+        raise LLMError(f"API错误: {status}", status)
+    return rate_limiter.backoff_delay(attempt, retry_after)
+
+
+def _extract_message(data: dict) -> str:
+    """兼容不同API的响应格式（content 或 reasoning_content）"""
+    if not data or not data.get("choices"):
+        raise LLMError("AI API返回空响应")
+    msg = data["choices"][0].get("message") or {}
+    return msg.get("content") or msg.get("reasoning_content") or ""
+
+
+async def chat_completion(messages: list, model: str = None, temperature: float = 0.7,
+                          max_tokens: int = None, timeout: float = None, config: dict = None) -> str:
+    """非流式对话补全，返回助手回复文本"""
+    config = config or await aget_ai_config()
+    api_base, headers = _api_settings(config)
+    limiter = _limiter_for(config)
+    est_tokens = rate_limiter.estimate_tokens(messages)
+    for attempt in range(RATE_LIMIT_CONFIG["max_retries"] + 1):
+        async with rate_limiter.aslot(limiter, est_tokens) as outcome:
+            response = await request(
+                "POST",
+                f"{api_base}/chat/completions",
+                headers=headers,
+                json={
+                    "model": model or config.get("model") or "deepseek-ai/DeepSeek-V3",
+                    "messages": messages,
+                    "temperature": temperature,
+                    "max_tokens": max_tokens or config.get("max_tokens", 65536)
+                },
+                timeout=timeout or HTTP_CONFIG["timeout"]
+            )
+            if response.status_code == 200:
+                outcome["succeeded"] = True
+                data = response.json()
+                outcome["used_tokens"] = (data.get("usage") or {}).get("total_tokens")
+                return _extract_message(data)
+            delay = _retry_delay(response, attempt, outcome)
+        await asyncio.sleep(delay)
+
+
+async def stream_chat_completion(messages: list, model: str = None, temperature: float = 0.7,
+                                 max_tokens: int = None, timeout: float = None, config: dict = None):
+    """流式对话补全，逐段产出增量文本"""
+    config = config or await aget_ai_config()
+    api_base, headers = _api_settings(config)
+    limiter = _limiter_for(config)
+    est_tokens = rate_limiter.estimate_tokens(messages)
+    for attempt in range(RATE_LIMIT_CONFIG["max_retries"] + 1):
+        async with rate_limiter.aslot(limiter, est_tokens) as outcome:
+            async with stream(
+                "POST",
+                f"{api_base}/chat/completions",
+                headers=headers,
+                json={
+                    "model": model or config.get("model") or "deepseek-ai/DeepSeek-V3",
+                    "messages": messages,
+                    "stream": True,
+                    "temperature": temperature,
+                    "max_tokens": max_tokens or config.get("max_tokens", 65536)
+                },
+                timeout=timeout or HTTP_CONFIG["timeout"]
+            ) as response:
+                if response.status_code != 200:
+                    await response.aread()
+                    delay = _retry_delay(response, attempt, outcome)
+                else:
+                    outcome["succeeded"] = True
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[5:].lstrip()
+                        if data == "[DONE]":
+                            break
+                        try:
+                            chunk = json.loads(data)
+                        except json.JSONDecodeError:
+                            continue
+                        if chunk.get("choices"):
+                            delta = chunk["choices"][0].get("delta") or {}
+                            content = delta.get("content") or delta.get("reasoning_content") or ""
+                            if content:
+                                yield content
+                    return
+        await asyncio.sleep(delay)
+
+
+async def generate_image(prompt: str, timeout: float = 90.0, config: dict = None) -> str:
+    """调用图片生成API，返回图片URL（失败返回空字符串）"""
+    config = config or await aget_ai_config()
+    api_base, headers = _api_settings(config)
+    limiter = _limiter_for(config, "image")
+    for attempt in range(RATE_LIMIT_CONFIG["max_retries"] + 1):
+        async with rate_limiter.aslot(limiter) as outcome:
+            response = await request(
+                "POST",
+                f"{api_base}/images/generations",
+                headers=headers,
+                json={
+                    "model": IMAGE_CONFIG.get("model", "black-forest-labs/FLUX.1-schnell"),
+                    "prompt": prompt,
+                    "image_size": IMAGE_CONFIG.get("image_size", "1024x576"),
+                    "num_inference_steps": IMAGE_CONFIG.get("num_inference_steps", 20)
+                },
+                timeout=timeout
+            )
+            if response.status_code == 200:
+                outcome["succeeded"] = True
+                break
+            try:
+                delay = _retry_delay(response, attempt, outcome)
+            except LLMError:
+                return ""
+        await asyncio.sleep(delay)
+    data = response.json()
+    if data.get("images") and len(data["images"]) > 0:
+        return data["images"][0].get("url", "")
+    if data.get("data") and len(data["data"]) > 0:
+        return data["data"][0].get("url", "")
+    return ""
@@ -11,17 +11,20 @@ from config import AGENT_ROLES, DOCUMENT_CONFIG
 class OutlineAgent(BaseAgent):
     """大纲生成专家Agent"""
     
-    def __init__(self):
+    stateless = True  # 每次调用都是独立请求，不累积对话历史
+    
+    def __init__(self, config=None):
         role = AGENT_ROLES["outline_generator"]
-        super().__init__(role["name"], role["system_prompt"])
+        super().__init__(role["name"], role["system_prompt"], config)
     
-    def generate_outline(self, topic: str, description: str = "") -> dict:
+    def generate_outline(self, topic: str, description: str = "", use_cache: bool = None) -> dict:
         """
         生成学习大纲
         
         Args:
             topic: 学习主题
             description: 补充描述
+            use_cache: 是否使用响应缓存（默认使用，热门主题直接命中）
             
         Returns:
             包含章节列表的字典
@@ -53,7 +56,7 @@ class OutlineAgent(BaseAgent):
 
 只返回JSON，不要其他内容。"""
 
-        response = self.chat(prompt, temperature=0.7)
+        response = self.chat(prompt, temperature=0.7, use_cache=use_cache)
         
         # 解析JSON
         try:
@@ -94,4 +97,5 @@ class OutlineAgent(BaseAgent):
 
 请生成一个更符合用户需求的学习目录，严格按照JSON格式返回。"""
 
-        return self.generate_outline(topic, feedback)
+        # 用户要求重新生成，不能返回缓存中的旧大纲
+        return self.generate_outline(topic, feedback, use_cache=False)
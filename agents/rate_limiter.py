@@ -0,0 +1,232 @@
+"""
+上游LLM调用限流
+按 (API地址, API Key) 共享的令牌桶（请求数/分钟 + Token数/分钟）与 AIMD 自适应并发控制：
+成功时并发上限缓慢增加，遇到 429 时减半并按 Retry-After 暂停整个提供方的请求，
+5xx、超时和连接错误同样减半（不暂停），其他失败（如 4xx）不调整
+"""
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from email.utils import parsedate_to_datetime
+from config import RATE_LIMIT_CONFIG
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """按分钟额度匀速补充的令牌桶"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """还需等待多少秒才能取出 amount 个令牌（超过容量的请求按容量计）"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount: float):
+        """按实际用量修正预估（amount 为负时补扣）"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class ProviderLimiter:
+    """单个提供方/API Key 的限流器，线程与协程共用"""
+
+    def __init__(self, rpm: int, tpm: int, max_concurrency: int, min_concurrency: int, initial_concurrency: int):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(min(initial_concurrency, max_concurrency))
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.throttled = 0
+        self.failed = 0
+        self._cond = threading.Condition()
+
+    def _try_acquire(self, est_tokens: int) -> float:
+        """尝试占用一个并发槽，成功返回 0，否则返回建议等待秒数（需持有锁）"""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.in_flight >= int(self.limit):
+            return 0.05
+        wait = self.requests.wait_time(1)
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(est_tokens))
+        if wait > 0:
+            return wait
+        self.requests.consume(1)
+        if self.tokens is not None:
+            self.tokens.consume(est_tokens)
+        self.in_flight += 1
+        return 0.0
+
+    def acquire(self, est_tokens: int = 0):
+        with self._cond:
+            while True:
+                wait = self._try_acquire(est_tokens)
+                if wait == 0:
+                    return
+                self._cond.wait(min(wait, 1.0))
+
+    async def aacquire(self, est_tokens: int = 0):
+        while True:
+            with self._cond:
+                wait = self._try_acquire(est_tokens)
+            if wait == 0:
+                return
+            await asyncio.sleep(min(wait, 0.5))
+
+    def release(self, throttled: bool = False, retry_after: float = None, est_tokens: int = 0, used_tokens: int = None,
+                succeeded: bool = True, failed: bool = False):
+        """释放并发槽：throttled 为 429，failed 为 5xx/超时/连接错误，succeeded 为拿到正常响应"""
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                # 乘性减：并发上限减半，并按 Retry-After 暂停该提供方的所有请求
+                self.throttled += 1
+                self.limit = max(float(self.min_concurrency), self.limit / 2)
+                if retry_after:
+                    self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            elif failed:
+                # 上游过载或网络故障：同样乘性减，但不暂停
+                self.failed += 1
+                self.limit = max(float(self.min_concurrency), self.limit / 2)
+            elif succeeded:
+                # 加性增：每个成功请求增加 1/limit，约等于每轮并发 +1
+                self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+            if used_tokens is not None and self.tokens is not None:
+                self.tokens.refund(est_tokens - used_tokens)
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        return {
+            "concurrency_limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "throttled": self.throttled,
+            "failed": self.failed,
+            "paused_for": max(0.0, round(self.paused_until - time.monotonic(), 2)),
+        }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(api_base: str, api_key: str, kind: str = "chat") -> ProviderLimiter:
+    """获取 (API地址, API Key, 调用类型) 对应的共享限流器"""
+    key_hash = hashlib.sha256((api_key or "").encode()).hexdigest()[:12]
+    key = ((api_base or "").rstrip('/'), key_hash, kind)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            cfg = RATE_LIMIT_CONFIG
+            limiter = _limiters[key] = ProviderLimiter(
+                cfg["images_per_minute"] if kind == "image" else cfg["requests_per_minute"],
+                0 if kind == "image" else cfg["tokens_per_minute"],
+                cfg["max_concurrency"], cfg["min_concurrency"], cfg["initial_concurrency"]
+            )
+        return limiter
+
+
+def _new_outcome() -> dict:
+    # 调用方拿到正常响应时设置 succeeded，5xx 设置 failed，429 设置 throttled 与 retry_after
+    return {"throttled": False, "retry_after": None, "used_tokens": None, "succeeded": False, "failed": False}
+
+
+def _mark_exception(outcome: dict, error: Exception):
+    """槽内抛出的异常：带 status_code 的（LLMError 等）按状态码归类，其余（超时、连接错误）按上游故障处理"""
+    if not hasattr(error, "status_code"):
+        outcome["failed"] = True
+    elif error.status_code is not None and error.status_code >= 500:
+        outcome["failed"] = True
+
+
+def _release(limiter: ProviderLimiter, outcome: dict, est_tokens: int):
+    limiter.release(outcome["throttled"], outcome["retry_after"], est_tokens, outcome["used_tokens"],
+                    outcome["succeeded"], outcome["failed"])
+
+
+@contextmanager
+def slot(limiter: ProviderLimiter, est_tokens: int = 0):
+    """同步占用并发槽，异常时按限流失败释放由调用方负责重试"""
+    limiter.acquire(est_tokens)
+    outcome = _new_outcome()
+    try:
+        yield outcome
+    except Exception as e:
+        _mark_exception(outcome, e)
+        raise
+    finally:
+        _release(limiter, outcome, est_tokens)
+
+
+@asynccontextmanager
+async def aslot(limiter: ProviderLimiter, est_tokens: int = 0):
+    await limiter.aacquire(est_tokens)
+    outcome = _new_outcome()
+    try:
+        yield outcome
+    except Exception as e:
+        _mark_exception(outcome, e)
+        raise
+    finally:
+        _release(limiter, outcome, est_tokens)
+
+
+def estimate_tokens(messages: list) -> int:
+    """粗略估计本次请求消耗的Token数（输入 + 预期输出）"""
+    chars = sum(len(m.get("content") or "") for m in messages)
+    return chars // 2 + RATE_LIMIT_CONFIG["expected_output_tokens"]
+
+
+def parse_retry_after(headers) -> float:
+    """解析 Retry-After（秒数或HTTP日期），无法解析返回 None"""
+    if not headers:
+        return None
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, retry_after: float = None) -> float:
+    """带抖动的指数退避（第 attempt 次重试前的等待秒数），服务端给出 Retry-After 时不早于该时间"""
+    cfg = RATE_LIMIT_CONFIG
+    delay = min(cfg["backoff_max"], cfg["backoff_base"] * (2 ** attempt))
+    delay = random.uniform(delay / 2, delay)
+    if retry_after:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def get_stats() -> dict:
+    with _limiters_lock:
+        return {f"{base}#{key_hash}#{kind}": limiter.stats() for (base, key_hash, kind), limiter in _limiters.items()}
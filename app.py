@@ -4,7 +4,7 @@ FastAPI后端服务
 """
 from fastapi import FastAPI, HTTPException, Depends, Request, UploadFile, File, Form
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, StreamingResponse, JSONResponse
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.encoders import jsonable_encoder
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
@@ -14,15 +14,24 @@ import tempfile
 import shutil
 import uuid
 import json
+import copy
 import os
 import hashlib
-import threading
+import asyncio
 import httpx
 from datetime import datetime
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from agents import OutlineAgent, ArticleAgent, ChapterAgent, ContentParser
-from config import AI_CONFIG
+from agents import OutlineAgent, llm_client, llm_cache, image_cache, rate_limiter, context
+import config_service
+from progress_bus import bus as progress_bus
+from generation import tasks_memory, PROGRESS_FIELDS, UPLOAD_DIR, article_flight
+from progress_writer import writer as progress_writer
+import job_queue
+import migrations
+import async_db as adb
+import sessions
+import image_store
+from singleflight import SingleFlight, make_key as make_flight_key
 import database as db
 
 app = FastAPI(title="LearnFlow AI")
@@ -40,46 +49,23 @@ if os.path.exists("static"):
     app.mount("/assets", StaticFiles(directory="static/assets"), name="assets")
     app.mount("/static", StaticFiles(directory="static"), name="static")
 
-# 内存中的任务状态（用于实时更新）
-tasks_memory = {}
-TASK_MEMORY_MAX_SIZE = 100  # 最大缓存任务数
-
-def cleanup_tasks_memory():
-    """清理已完成的旧任务，防止内存泄漏"""
-    if len(tasks_memory) > TASK_MEMORY_MAX_SIZE:
-        completed_tasks = [k for k, v in tasks_memory.items() 
-                          if v.get('status') in ('completed', 'failed')]
-        # 删除最旧的一半已完成任务
-        for task_id in completed_tasks[:len(completed_tasks)//2]:
-            del tasks_memory[task_id]
-
-# 并发线程池
-executor = ThreadPoolExecutor(max_workers=12)
-
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
 
-def generate_token(username: str) -> str:
-    return hashlib.sha256(f"{username}{datetime.now().isoformat()}{uuid.uuid4()}".encode()).hexdigest()
-
-def load_ai_config():
-    try:
-        config = db.get_all_config() or {}
-    except Exception as e:
-        print(f"加载配置失败: {e}")
-        config = {}
-    AI_CONFIG["api_key"] = config.get("api_key", "")
-    AI_CONFIG["api_base"] = config.get("api_base", "https://api.siliconflow.cn/v1")
-    AI_CONFIG["model"] = config.get("model", "deepseek-ai/DeepSeek-V3")
-
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     if not credentials:
         raise HTTPException(status_code=401, detail="未登录")
-    user = db.get_user_by_token(credentials.credentials)
+    user = await sessions.aresolve(credentials.credentials)
     if not user:
         raise HTTPException(status_code=401, detail="无效的登录凭证")
     return user
 
+async def get_stream_user(token: Optional[str] = None, credentials: HTTPAuthorizationCredentials = Depends(security)):
+    """SSE连接的认证（浏览器 EventSource 无法设置请求头，允许通过 ?token= 传递）"""
+    if not credentials and token:
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    return await get_current_user(credentials)
+
 # 请求模型
 class UserRegister(BaseModel):
     username: str
@@ -142,22 +128,21 @@ class AnswerInterviewRequest(BaseModel):
 # ========== 认证接口 ==========
 @app.post("/api/auth/register")
 async def register(request: UserRegister):
-    if db.get_user(request.username):
+    if await adb.get_user(request.username):
         raise HTTPException(status_code=400, detail="用户名已存在")
     if len(request.password) < 6:
         raise HTTPException(status_code=400, detail="密码至少6位")
     
-    db.create_user(request.username, request.email, hash_password(request.password))
+    await adb.create_user(request.username, request.email, hash_password(request.password))
     return {"success": True, "message": "注册成功"}
 
 @app.post("/api/auth/login")
 async def login(request: UserLogin):
-    user = db.get_user(request.username)
+    user = await adb.get_user(request.username)
     if not user or user["password"] != hash_password(request.password):
         raise HTTPException(status_code=401, detail="用户名或密码错误")
     
-    token = generate_token(request.username)
-    db.update_user_token(request.username, token)
+    token = await adb.run(sessions.issue_token, request.username)
     
     return {"success": True, "user": {"username": user["username"], "email": user["email"], "token": token}}
 
@@ -181,7 +166,7 @@ def check_deep_think_support(model: str) -> bool:
 
 @app.get("/api/config")
 async def get_config():
-    config = db.get_all_config()
+    config = await config_service.aget_all()
     current_provider = config.get("provider", "siliconflow")
     # 获取当前服务商的API Key
     api_key = config.get(f"api_key_{current_provider}", config.get("api_key", ""))
@@ -205,9 +190,10 @@ async def get_config():
 
 @app.post("/api/config")
 async def save_config(request: ConfigRequest, user: dict = Depends(get_current_user)):
-    config = db.get_all_config()
+    config = await config_service.aget_all()
     
     # 处理API Key
+    values = {}
     if request.api_key == "__USE_EXISTING__":
         # 使用已存储的该服务商的API Key
         api_key = config.get(f"api_key_{request.provider}", "")
@@ -216,16 +202,71 @@ async def save_config(request: ConfigRequest, user: dict = Depends(get_current_u
     else:
         # 新输入的API Key，按服务商存储
         api_key = request.api_key
-        db.set_config(f"api_key_{request.provider}", api_key)
+        values[f"api_key_{request.provider}"] = api_key
     
-    # 更新当前使用的api_key（兼容旧逻辑）
-    db.set_config("api_key", api_key)
-    db.set_config("api_base", request.api_base)
-    db.set_config("model", request.model)
-    db.set_config("provider", request.provider)
-    load_ai_config()
+    # 更新当前使用的api_key（兼容旧逻辑），写入后递增配置版本号使缓存失效
+    values.update({
+        "api_key": api_key,
+        "api_base": request.api_base,
+        "model": request.model,
+        "provider": request.provider,
+    })
+    await adb.run(config_service.save, values)
     return {"success": True, "message": "配置已保存"}
 
+@app.on_event("startup")
+async def start_background_services():
+    progress_bus.bind_loop(asyncio.get_running_loop())
+    llm_client.bind_loop(asyncio.get_running_loop())
+    # 结构已是最新时只查一次版本号
+    await asyncio.to_thread(migrations.ensure_schema)
+    job_queue.start_embedded_workers()
+
+@app.on_event("shutdown")
+async def stop_background_services():
+    job_queue.stop_embedded_workers()
+    await asyncio.to_thread(progress_writer.flush)
+    await asyncio.to_thread(adb.shutdown)
+    llm_client.bind_loop(None)
+    await llm_client.close_async_client()
+
+# ========== 运行指标 ==========
+@app.get("/api/metrics")
+async def get_metrics(user: dict = Depends(get_current_user)):
+    # 缓存统计会查询 MySQL / 磁盘后端，放到数据库线程池
+    llm_cache_stats, image_cache_stats = await asyncio.gather(
+        adb.run(llm_cache.get_stats), adb.run(image_cache.get_stats)
+    )
+    return {
+        "llm_cache": llm_cache_stats,
+        "image_cache": image_cache_stats,
+        "single_flight": {
+            "outline": outline_flight.stats(),
+            "article": article_flight.stats(),
+            "ask": ask_flight.stats(),
+        },
+        "rate_limits": rate_limiter.get_stats(),
+        "sessions": sessions.get_stats(),
+        "db": db.get_query_stats(),
+        "db_pool": db.get_pool_stats(),
+        "progress_writer": progress_writer.stats(),
+    }
+
+# ========== 图片资源 ==========
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+@app.get("/api/images/{name}")
+async def get_image(name: str, request: Request, thumb: bool = False):
+    """本地图片库（文件名即内容哈希，内容不会变化，可长期缓存）"""
+    found = await asyncio.to_thread(image_store.resolve, name, thumb)
+    if not found:
+        raise HTTPException(status_code=404, detail="图片不存在")
+    path, media_type, etag = found
+    headers = {"Cache-Control": IMAGE_CACHE_CONTROL, "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers)
+
 # ========== 页面路由 ==========
 @app.get("/")
 async def index():
@@ -235,183 +276,12 @@ async def index():
 async def article_page(article_id: str):
     return FileResponse("static/index.html", headers={"Cache-Control": "no-cache"})
 
-# ========== 后台任务生成 ==========
-MAX_RETRY_ATTEMPTS = 2  # 章节生成最大重试次数
-
-def generate_single_chapter_sync(chapter: dict, outline: dict, enable_search: bool = False) -> dict:
-    """生成单个章节，带重试机制"""
-    last_error = None
-    for attempt in range(MAX_RETRY_ATTEMPTS + 1):
-        try:
-            agent = ChapterAgent()
-            content = agent.generate_chapter(chapter, outline, enable_search)
-            return {"id": chapter["id"], "title": chapter["title"], "content": content, "status": "success"}
-        except Exception as e:
-            last_error = e
-            if attempt < MAX_RETRY_ATTEMPTS:
-                import time
-                time.sleep(2)  # 重试前等待2秒
-                continue
-    return {"id": chapter["id"], "title": chapter["title"], "content": f"生成失败: {str(last_error)}", "status": "failed"}
-
-def run_article_generation(task_id: str, topic: str, description: str, username: str, enable_search: bool, links: list = None, file_ids: list = None):
-    tasks_memory[task_id] = {"status": "running", "steps": [], "current_step": "🚀 开始生成文章..."}
-    
-    def add_step(step: str):
-        tasks_memory[task_id]["steps"].append(step)
-        tasks_memory[task_id]["current_step"] = step
-        db.update_task(task_id, status="running", current_step=step)
-    
-    try:
-        add_step("🚀 开始生成文章...")
-        extra_context = ""
-        
-        # 处理上传的文件
-        if file_ids and len(file_ids) > 0:
-            add_step(f"📄 正在解析 {len(file_ids)} 个上传文件...")
-            file_content = process_uploaded_files(file_ids)
-            if file_content:
-                extra_context += f"\n\n### 参考文件内容\n{file_content}"
-                add_step("✅ 文件解析完成")
-        
-        if links and len(links) > 0:
-            add_step(f"🔗 正在解析 {len(links)} 个参考链接...")
-            parser = ContentParser()
-            link_results = []
-            for i, link in enumerate(links):
-                add_step(f"📄 解析链接 ({i+1}/{len(links)})...")
-                try:
-                    result = parser.parse_url(link)
-                    link_results.append(result)
-                except Exception as e:
-                    add_step(f"⚠️ 链接解析失败: {link[:50]}...")
-            if link_results:
-                add_step("📝 整合链接内容...")
-                extra_context += parser.combine_sources(topic, link_results)
-        
-        if enable_search:
-            add_step("🌐 正在联网搜索相关资料...")
-            parser = ContentParser()
-            search_results = parser.web_search(f"{topic} {description}")
-            if search_results:
-                add_step("📚 整理搜索结果...")
-                for r in search_results:
-                    if isinstance(r, dict) and r.get('results'):
-                        extra_context += f"\n\n### 搜索资料\n{r['results'][:2000]}"
-        
-        add_step("✍️ AI正在撰写文章内容...")
-        agent = ArticleAgent()
-        result = agent.generate_article(topic, description, extra_context)
-        
-        add_step("✅ 文章生成完成，正在保存...")
-        article_id = str(uuid.uuid4())[:8]
-        article_data = {
-            "id": article_id, "title": result.get("title", topic), "content": result.get("content", ""),
-            "topic": topic, "type": "article", "user": username, "created_at": datetime.now().isoformat()
-        }
-        db.create_article(article_data)
-        
-        tasks_memory[task_id]["status"] = "completed"
-        tasks_memory[task_id]["current_step"] = "🎉 文章已保存到文章列表"
-        db.update_task(task_id, status="completed", current_step="🎉 文章已保存到文章列表")
-        
-    except Exception as e:
-        tasks_memory[task_id]["status"] = "failed"
-        tasks_memory[task_id]["error"] = str(e)
-        db.update_task(task_id, status="failed", error=str(e))
-    finally:
-        cleanup_tasks_memory()  # 清理旧任务
-
-def run_document_generation(task_id: str, outline: dict, username: str, enable_search: bool):
-    chapters = outline.get("chapters", [])
-    total = len(chapters)
-    tasks_memory[task_id] = {"status": "running", "steps": [], "current_step": "🚀 开始生成文档...", "completed": 0, "total": total}
-    
-    def add_step(step: str):
-        tasks_memory[task_id]["steps"].append(step)
-        tasks_memory[task_id]["current_step"] = step
-        db.update_task(task_id, current_step=step)
-    
-    add_step("🚀 开始生成学习文档...")
-    add_step(f"📝 开始并发生成 {total} 个章节...")
-    
-    futures = {executor.submit(generate_single_chapter_sync, ch, outline, enable_search): ch["id"] for ch in chapters}
-    
-    results = []
-    completed = 0
-    
-    for future in as_completed(futures):
-        result = future.result()
-        results.append(result)
-        completed += 1
-        tasks_memory[task_id]["completed"] = completed
-        db.update_task(task_id, completed=completed)
-        add_step(f"✅ 第{result['id']}章「{result['title']}」完成 ({completed}/{total})")
-    
-    add_step("💾 正在保存文档...")
-    
-    doc_id = str(uuid.uuid4())[:8]
-    sorted_chapters = sorted(results, key=lambda x: x["id"])
-    
-    doc_data = {
-        "id": doc_id, "title": outline.get("title", ""), "description": outline.get("description", ""),
-        "topic": outline.get("topic", ""), "chapters": sorted_chapters, "user": username,
-        "created_at": datetime.now().isoformat()
-    }
-    db.create_document(doc_data)
-    
-    for chapter in sorted_chapters:
-        article_id = f"{doc_id}-{chapter['id']}"
-        article_data = {
-            "id": article_id, "title": chapter["title"], "content": chapter["content"],
-            "topic": outline.get("topic", ""), "document_id": doc_id, "chapter_id": chapter["id"],
-            "type": "chapter", "user": username, "created_at": datetime.now().isoformat()
-        }
-        db.create_article(article_data)
-    
-    tasks_memory[task_id]["status"] = "completed"
-    tasks_memory[task_id]["current_step"] = "🎉 文档已保存到学习文档列表"
-    db.update_task(task_id, status="completed", current_step="🎉 文档已保存到学习文档列表")
-    cleanup_tasks_memory()  # 清理旧任务
+# ========== 后台任务 ==========
+TASK_STREAM_INTERVAL = 0.3  # 任务增量推送间隔（秒）
+TASK_EVENTS_KEEPALIVE = 15  # 任务事件SSE心跳间隔（秒）
+TASK_DB_POLL_INTERVAL = 2  # 任务不在本进程时读取数据库进度的间隔（秒，/api/task/{id}/stream 与 /api/tasks/events 共用）
 
 # ========== 文件上传处理 ==========
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-
-def parse_uploaded_file(file_path: str, filename: str) -> str:
-    """解析上传的文件内容"""
-    try:
-        ext = filename.lower().split('.')[-1]
-        
-        if ext in ('txt', 'md'):
-            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                return f.read()[:10000]  # 限制长度
-        
-        elif ext == 'pdf':
-            try:
-                import PyPDF2
-                with open(file_path, 'rb') as f:
-                    reader = PyPDF2.PdfReader(f)
-                    text = ""
-                    for page in reader.pages[:20]:  # 最多20页
-                        text += page.extract_text() or ""
-                    return text[:10000]
-            except ImportError:
-                return f"[PDF文件: {filename}，需要安装PyPDF2库]"
-        
-        elif ext in ('doc', 'docx'):
-            try:
-                import docx
-                doc = docx.Document(file_path)
-                text = "\n".join([para.text for para in doc.paragraphs])
-                return text[:10000]
-            except ImportError:
-                return f"[Word文件: {filename}，需要安装python-docx库]"
-        
-        return f"[不支持的文件类型: {ext}]"
-    except Exception as e:
-        return f"[文件解析失败: {str(e)}]"
-
 @app.post("/api/upload/files")
 async def upload_files(
     files: List[UploadFile] = File(...),
@@ -435,21 +305,15 @@ async def upload_files(
     
     return {"success": True, "files": file_ids}
 
-def process_uploaded_files(file_ids: List[dict]) -> str:
-    """处理上传的文件，提取内容"""
-    contents = []
-    for file_info in file_ids:
-        if isinstance(file_info, dict) and file_info.get('path'):
-            content = parse_uploaded_file(file_info['path'], file_info.get('name', ''))
-            if content:
-                contents.append(f"### 文件: {file_info.get('name', '未知')}\n{content}")
-    return "\n\n".join(contents)
-
 # ========== 生成接口 ==========
+# 并发的相同请求合并为一次生成（文章生成的合并在 generation.article_flight）
+outline_flight = SingleFlight()
+ask_flight = SingleFlight()
+
 @app.post("/api/generate/article")
 async def generate_article(request: TopicRequest, user: dict = Depends(get_current_user)):
-    load_ai_config()
-    if not AI_CONFIG.get("api_key"):
+    ai_config = await config_service.aget_ai_config()
+    if not ai_config.get("api_key"):
         raise HTTPException(status_code=400, detail="请先配置API Key")
     
     topic = request.topic.strip()
@@ -461,20 +325,17 @@ async def generate_article(request: TopicRequest, user: dict = Depends(get_curre
         "id": task_id, "type": "article", "status": "pending", "topic": topic,
         "user": user["username"], "current_step": "准备中...", "created_at": datetime.now().isoformat()
     }
-    db.create_task(task_data)
-    
-    thread = threading.Thread(
-        target=run_article_generation,
-        args=(task_id, topic, request.description or "", user["username"], request.enableSearch, request.links or [], request.fileIds or [])
-    )
-    thread.start()
+    await adb.run(job_queue.enqueue, task_data, {
+        "topic": topic, "description": request.description or "", "enable_search": request.enableSearch,
+        "links": request.links or [], "file_ids": request.fileIds or []
+    })
     
     return {"success": True, "task_id": task_id}
 
 @app.post("/api/generate/outline")
 async def generate_outline(request: TopicRequest, user: dict = Depends(get_current_user)):
-    load_ai_config()
-    if not AI_CONFIG.get("api_key"):
+    ai_config = await config_service.aget_ai_config()
+    if not ai_config.get("api_key"):
         raise HTTPException(status_code=400, detail="请先配置API Key")
     
     topic = request.topic.strip()
@@ -482,8 +343,11 @@ async def generate_outline(request: TopicRequest, user: dict = Depends(get_curre
         raise HTTPException(status_code=400, detail="请输入学习主题")
     
     try:
-        agent = OutlineAgent()
-        outline = agent.generate_outline(topic, request.description or "")
+        # 同一时间提交的相同主题只生成一次，每个用户各自保存一份大纲
+        agent = OutlineAgent(ai_config)
+        flight_key = make_flight_key("outline", topic, request.description or "")
+        outline = await outline_flight.ado(flight_key, asyncio.to_thread, agent.generate_outline, topic, request.description or "")
+        outline = copy.deepcopy(outline)
         
         outline_id = str(uuid.uuid4())[:8]
         outline_data = {
@@ -491,21 +355,21 @@ async def generate_outline(request: TopicRequest, user: dict = Depends(get_curre
             "links": request.links or [], "enableSearch": request.enableSearch,
             "user": user["username"], "created_at": datetime.now().isoformat()
         }
-        db.create_outline(outline_data)
+        await adb.create_outline(outline_data)
         return {"success": True, "outline": outline_data}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"生成失败: {str(e)}")
 
 @app.post("/api/regenerate/outline")
 async def regenerate_outline(request: OutlineRequest, user: dict = Depends(get_current_user)):
-    load_ai_config()
-    original = db.get_outline(request.outline_id)
+    ai_config = await config_service.aget_ai_config()
+    original = await adb.get_outline(request.outline_id)
     if not original:
         raise HTTPException(status_code=404, detail="大纲不存在")
     
     try:
-        agent = OutlineAgent()
-        outline = agent.regenerate_outline(original.get("topic", ""), request.feedback or "")
+        agent = OutlineAgent(ai_config)
+        outline = await asyncio.to_thread(agent.regenerate_outline, original.get("topic", ""), request.feedback or "")
         
         outline_id = str(uuid.uuid4())[:8]
         outline_data = {
@@ -513,28 +377,28 @@ async def regenerate_outline(request: OutlineRequest, user: dict = Depends(get_c
             "links": original.get("links", []), "enableSearch": original.get("enableSearch", False),
             "user": user["username"], "created_at": datetime.now().isoformat()
         }
-        db.create_outline(outline_data)
+        await adb.create_outline(outline_data)
         return {"success": True, "outline": outline_data}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"重新生成失败: {str(e)}")
 
 @app.post("/api/update/outline")
 async def update_outline(request: OutlineUpdateRequest, user: dict = Depends(get_current_user)):
-    outline = db.get_outline(request.outline_id)
+    outline = await adb.get_outline(request.outline_id)
     if not outline:
         raise HTTPException(status_code=404, detail="大纲不存在")
     
-    db.update_outline(request.outline_id, request.chapters, request.feedback)
-    updated = db.get_outline(request.outline_id)
+    await adb.update_outline(request.outline_id, request.chapters, request.feedback)
+    updated = await adb.get_outline(request.outline_id)
     return {"success": True, "outline": updated}
 
 @app.post("/api/generate/document")
 async def generate_document(request: DocumentRequest, user: dict = Depends(get_current_user)):
-    load_ai_config()
-    if not AI_CONFIG.get("api_key"):
+    ai_config = await config_service.aget_ai_config()
+    if not ai_config.get("api_key"):
         raise HTTPException(status_code=400, detail="请先配置API Key")
     
-    outline = db.get_outline(request.outline_id)
+    outline = await adb.get_outline(request.outline_id)
     if not outline:
         raise HTTPException(status_code=404, detail="大纲不存在")
     
@@ -544,32 +408,190 @@ async def generate_document(request: DocumentRequest, user: dict = Depends(get_c
         "topic": outline.get("topic", ""), "user": user["username"],
         "total": len(outline.get("chapters", [])), "created_at": datetime.now().isoformat()
     }
-    db.create_task(task_data)
-    
-    thread = threading.Thread(
-        target=run_document_generation,
-        args=(task_id, outline, user["username"], outline.get("enableSearch", True))
-    )
-    thread.start()
+    await adb.run(job_queue.enqueue, task_data, {"outline": serialize_datetime(outline), "enable_search": outline.get("enableSearch", True)})
     
     return {"success": True, "task_id": task_id}
 
+def task_snapshot(task: dict, include_partial: bool = False) -> dict:
+    """任务状态快照，默认不带正在生成的增量内容（体积大，由 /stream 推送）"""
+    snapshot = {k: v for k, v in task.items() if k != "partial"}
+    if include_partial:
+        snapshot["partial"] = {str(part): "".join(chunks) for part, chunks in list(task.get("partial", {}).items())}
+    return snapshot
+
+async def get_owned_task(task_id: str, username: str, include_partial: bool = False):
+    """当前用户的任务（优先取本进程内存中的实时状态），不存在或不属于该用户时返回 404"""
+    task = tasks_memory.get(task_id)
+    if task is None:
+        task = await adb.get_task(task_id, include_partial=include_partial)
+    if not task or task.get("user") != username:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return task
+
 @app.get("/api/task/{task_id}")
-async def get_task_status(task_id: str):
+async def get_task_status(task_id: str, include_partial: bool = False, user: dict = Depends(get_stream_user)):
+    task = await get_owned_task(task_id, user["username"], include_partial)
     if task_id in tasks_memory:
-        return tasks_memory[task_id]
-    task = db.get_task(task_id)
-    if not task:
-        raise HTTPException(status_code=404, detail="任务不存在")
+        return task_snapshot(task, include_partial)
     return task
 
+def partial_events(partial: dict, sent: dict) -> list:
+    """数据库中的增量快照 {part: 已生成的文本} 转为 delta/reset 事件，sent 记录每段已推送的文本（None 表示内容无法对齐）"""
+    events = []
+    for part, text in partial.items():
+        prev = sent.get(part, "")
+        if prev is None or not text.startswith(prev):
+            # 重新生成（或之前由本进程内存推送）的段落，客户端先清空再接收完整内容
+            events.append({"type": "reset", "part": part})
+            prev = ""
+        if len(text) > len(prev):
+            events.append({"type": "delta", "part": part, "content": text[len(prev):]})
+        sent[part] = text
+    return events
+
+@app.get("/api/task/{task_id}/stream")
+async def stream_task(task_id: str, user: dict = Depends(get_stream_user)):
+    """SSE推送任务进度和生成中的增量内容（仅任务所属用户）"""
+    await get_owned_task(task_id, user["username"])
+    
+    async def generate():
+        sent = {}  # part -> (chunks, 已发送的分段数)
+        sent_text = {}  # 从数据库快照推送的段落：str(part) -> 已推送的文本
+        last_step = None
+        while True:
+            task = tasks_memory.get(task_id)
+            if task is None:
+                # 任务在其他进程执行（或尚未被领取），低频读取数据库中的进度和增量快照
+                row = await adb.get_task(task_id, include_partial=True)
+                if not row:
+                    yield f"data: {json.dumps({'type': 'error', 'error': '任务不存在'})}\n\n"
+                    return
+                for part in sent:
+                    sent_text[str(part)] = None
+                sent.clear()
+                for event in partial_events(row.get("partial") or {}, sent_text):
+                    yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+                if row.get("status") in ("completed", "failed"):
+                    yield f"data: {json.dumps({'type': 'done', 'status': row.get('status'), 'error': row.get('error')}, ensure_ascii=False)}\n\n"
+                    return
+                if row.get("current_step") != last_step:
+                    last_step = row.get("current_step")
+                    event = {"type": "step", "current_step": last_step, "completed": row.get("completed"), "total": row.get("total")}
+                    yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+                await asyncio.sleep(TASK_DB_POLL_INTERVAL)
+                continue
+            
+            # 先读状态再读增量，保证任务结束前的最后一段内容不会漏发
+            status = task.get("status")
+            for part, chunks in list(task.get("partial", {}).items()):
+                seen, offset = sent.get(part, (None, 0))
+                if seen is not chunks:
+                    # 之前推送过该段（本进程内存或数据库快照）时，客户端先清空
+                    if seen is not None or str(part) in sent_text:
+                        sent_text.pop(str(part), None)
+                        yield f"data: {json.dumps({'type': 'reset', 'part': part})}\n\n"
+                    offset = 0
+                count = len(chunks)
+                if count > offset:
+                    delta = "".join(chunks[offset:count])
+                    yield f"data: {json.dumps({'type': 'delta', 'part': part, 'content': delta}, ensure_ascii=False)}\n\n"
+                sent[part] = (chunks, count)
+            
+            if task.get("current_step") != last_step:
+                last_step = task.get("current_step")
+                event = {"type": "step", "current_step": last_step, "completed": task.get("completed"), "total": task.get("total")}
+                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+            
+            if status in ("completed", "failed"):
+                yield f"data: {json.dumps({'type': 'done', 'status': status, 'error': task.get('error')}, ensure_ascii=False)}\n\n"
+                return
+            await asyncio.sleep(TASK_STREAM_INTERVAL)
+    
+    return StreamingResponse(generate(), media_type="text/event-stream")
+
+@app.post("/api/task/{task_id}/resume")
+async def resume_task(task_id: str, user: dict = Depends(get_current_user)):
+    """续传失败的文档生成任务：只重新生成缺失或失败的章节"""
+    task = await adb.get_task(task_id)
+    if not task or task["user"] != user["username"]:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if task["type"] != "document" or task["status"] != "failed":
+        raise HTTPException(status_code=400, detail="只能续传失败的文档生成任务")
+    
+    checkpoints = await adb.get_chapter_checkpoints(task_id)
+    finished = sum(1 for row in checkpoints if row["status"] == "success")
+    if not await adb.run(job_queue.requeue, task_id):
+        raise HTTPException(status_code=409, detail="任务状态已变化，请刷新后重试")
+    tasks_memory.pop(task_id, None)
+    return {"success": True, "task_id": task_id, "finished": finished, "remaining": (task.get("total") or 0) - finished}
+
+@app.get("/api/tasks/events")
+async def task_events(user: dict = Depends(get_stream_user)):
+    """SSE推送当前用户所有任务的进度（一个连接复用所有任务，替代轮询 /api/task/{id}）"""
+    username = user["username"]
+    
+    async def generate():
+        queue = progress_bus.subscribe(username)
+        # 事件总线只覆盖本进程执行的任务；worker.py 等其他进程执行的任务定期从数据库读取进度
+        remote = {}  # task_id -> 最近推送的进度
+        
+        async def poll_remote():
+            try:
+                rows = await adb.get_task_progress(username, list(remote))
+            except Exception as e:
+                print(f"读取任务进度失败: {e}")
+                return []
+            events = []
+            for row in rows:
+                task_id = row["id"]
+                progress = {k: v for k, v in row.items() if k != "id"}
+                if task_id in tasks_memory or remote.get(task_id) == progress:
+                    continue
+                events.append({"event": "progress", "task_id": task_id, **progress})
+                if progress["status"] in ("completed", "failed"):
+                    remote.pop(task_id, None)
+                else:
+                    remote[task_id] = progress
+            return events
+        
+        try:
+            # 先推送当前进行中任务的状态快照
+            for task_id, task in list(tasks_memory.items()):
+                if task.get("user") == username:
+                    snapshot = {"event": "progress", "task_id": task_id, **{k: task.get(k) for k in PROGRESS_FIELDS if k in task}}
+                    yield f"data: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+            loop = asyncio.get_running_loop()
+            next_poll = last_sent = loop.time()
+            for event in await poll_remote():
+                yield f"data: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+            while True:
+                now = loop.time()
+                if now >= next_poll:
+                    next_poll = now + TASK_DB_POLL_INTERVAL
+                    for event in await poll_remote():
+                        last_sent = now
+                        yield f"data: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=max(0.0, next_poll - loop.time()))
+                except asyncio.TimeoutError:
+                    if loop.time() - last_sent >= TASK_EVENTS_KEEPALIVE:
+                        last_sent = loop.time()
+                        yield ": keepalive\n\n"
+                    continue
+                last_sent = loop.time()
+                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            progress_bus.unsubscribe(username, queue)
+    
+    return StreamingResponse(generate(), media_type="text/event-stream")
+
 @app.get("/api/tasks")
 async def list_tasks(user: dict = Depends(get_current_user)):
-    tasks = db.get_tasks(user["username"])
+    tasks = await adb.get_tasks(user["username"])
     for task in tasks:
         task["task_id"] = task["id"]
         if task["id"] in tasks_memory:
-            task.update(tasks_memory[task["id"]])
+            task.update(task_snapshot(tasks_memory[task["id"]]))
     return {"tasks": tasks}
 
 # ========== 文章接口 ==========
@@ -583,95 +605,160 @@ def serialize_datetime(obj):
         return obj.isoformat()
     return obj
 
+def parse_list_fields(fields: Optional[str], allowed: tuple):
+    """解析列表接口的 fields 参数（逗号分隔），未指定时返回 None 表示全部摘要字段"""
+    if not fields:
+        return None
+    selected = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in selected if f not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"不支持的字段: {', '.join(unknown)}，可选: {', '.join(allowed)}")
+    return selected
+
+LIST_PAGE_DEFAULT = 50
+LIST_PAGE_MAX = 200
+
+def list_page_limit(limit: Optional[int], cursor: Optional[str], fields: Optional[str]):
+    """
+    列表每页条数；不带任何分页参数的旧客户端（static/ 中尚未重新构建的前端包）返回 None，即完整列表
+    新前端总会传 limit
+    """
+    if limit is None and cursor is None and fields is None:
+        return None
+    return max(1, min(limit or LIST_PAGE_DEFAULT, LIST_PAGE_MAX))
+
 @app.get("/api/articles")
-async def list_articles(user: dict = Depends(get_current_user)):
-    articles = db.get_articles(user["username"])
-    articles = serialize_datetime(articles)
-    return {"articles": articles}
+async def list_articles(limit: Optional[int] = None, cursor: Optional[str] = None, fields: Optional[str] = None,
+                        include_chapters: bool = False, user: dict = Depends(get_current_user)):
+    """文章列表（摘要字段，不含正文），用返回的 next_cursor 翻页；正文通过 /api/articles/{id} 获取"""
+    selected = parse_list_fields(fields, db.ARTICLE_LIST_FIELDS)
+    page_limit = list_page_limit(limit, cursor, fields)
+    try:
+        # 旧前端包在列表行上直接编辑正文，完整列表保留 content
+        articles, next_cursor = await adb.list_articles(
+            user["username"], page_limit, cursor, selected, include_chapters, with_content=page_limit is None
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"articles": articles, "next_cursor": next_cursor}
+
+@app.get("/api/search")
+async def search_articles(q: str, limit: int = 20, offset: int = 0, type: Optional[str] = None,
+                          user: dict = Depends(get_current_user)):
+    """跨文章/章节全文搜索，按相关度排序，返回高亮标题与摘要（高亮片段已做 HTML 转义）"""
+    limit = max(1, min(limit, 100))
+    results, total = await adb.search_articles(user["username"], q, limit, max(0, offset), type)
+    return {"results": serialize_datetime(results), "total": total}
 
 @app.get("/api/articles/{article_id}")
 async def get_article(article_id: str, user: dict = Depends(get_current_user)):
-    article = db.get_article(article_id)
+    article = await adb.get_article(article_id)
     if not article:
         raise HTTPException(status_code=404, detail="文章不存在")
     return {"article": serialize_datetime(article)}
 
 @app.get("/api/public/articles/{article_id}")
 async def get_public_article(article_id: str):
-    article = db.get_article(article_id)
+    article = await adb.get_article(article_id)
     if not article:
         raise HTTPException(status_code=404, detail="文章不存在")
     return {"article": serialize_datetime(article)}
 
 @app.put("/api/articles/{article_id}")
 async def update_article(article_id: str, request: ArticleUpdateRequest, user: dict = Depends(get_current_user)):
-    db.update_article(article_id, request.title, request.content)
-    article = db.get_article(article_id)
+    await adb.update_article(article_id, request.title, request.content)
+    article = await adb.get_article(article_id)
     return {"success": True, "article": article}
 
 @app.delete("/api/articles/{article_id}")
 async def delete_article(article_id: str, user: dict = Depends(get_current_user)):
-    db.delete_article(article_id)
+    try:
+        await adb.delete_article(article_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {"success": True}
 
 @app.post("/api/articles/batch-delete")
 async def batch_delete_articles(request: BatchDeleteRequest, user: dict = Depends(get_current_user)):
-    for aid in request.ids:
-        db.delete_article(aid)
+    try:
+        await adb.delete_articles(request.ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {"success": True, "deleted": len(request.ids)}
 
 # ========== 文档接口 ==========
 @app.get("/api/documents")
-async def list_documents(user: dict = Depends(get_current_user)):
-    documents = db.get_documents(user["username"])
-    return {"documents": documents}
+async def list_documents(limit: Optional[int] = None, cursor: Optional[str] = None, fields: Optional[str] = None,
+                         user: dict = Depends(get_current_user)):
+    """文档列表（章节只含标题与状态），用返回的 next_cursor 翻页"""
+    selected = parse_list_fields(fields, db.DOCUMENT_LIST_FIELDS)
+    try:
+        documents, next_cursor = await adb.list_documents(
+            user["username"], list_page_limit(limit, cursor, fields), cursor, selected
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"documents": documents, "next_cursor": next_cursor}
 
 @app.get("/api/documents/{doc_id}")
-async def get_document(doc_id: str, user: dict = Depends(get_current_user)):
-    document = db.get_document(doc_id)
+async def get_document(doc_id: str, include_content: bool = True, user: dict = Depends(get_current_user)):
+    """文档详情；include_content=false 时只返回章节引用，正文可按 article_id 通过 /api/articles/{id} 单独获取"""
+    document = await adb.get_document(doc_id, include_content)
     if not document:
         raise HTTPException(status_code=404, detail="文档不存在")
     return {"document": document}
 
 @app.delete("/api/documents/{doc_id}")
 async def delete_document(doc_id: str, user: dict = Depends(get_current_user)):
-    db.delete_articles_by_document(doc_id)
-    db.delete_document(doc_id)
+    await adb.delete_documents([doc_id])
     return {"success": True}
 
 @app.post("/api/documents/batch-delete")
 async def batch_delete_documents(request: BatchDeleteRequest, user: dict = Depends(get_current_user)):
-    for doc_id in request.ids:
-        db.delete_articles_by_document(doc_id)
-        db.delete_document(doc_id)
+    await adb.delete_documents(request.ids)
     return {"success": True, "deleted": len(request.ids)}
 
 # ========== AI问答接口 ==========
 @app.post("/api/ask")
 async def ask_question(request: AskQuestionRequest, user: dict = Depends(get_current_user)):
-    load_ai_config()
-    if not AI_CONFIG.get("api_key"):
+    ai_config = await config_service.aget_ai_config()
+    if not ai_config.get("api_key"):
         raise HTTPException(status_code=400, detail="请先配置API Key")
     
-    article = db.get_article(request.article_id)
+    article = await adb.get_article(request.article_id)
     if not article:
         raise HTTPException(status_code=404, detail="文章不存在")
     
     try:
         from agents.base_agent import BaseAgent
-        agent = BaseAgent("AI助手", "你是一个专业的学习助手，根据文章内容回答用户问题。回答要准确、简洁、有帮助。")
+        agent = BaseAgent("AI助手", "你是一个专业的学习助手，根据文章内容回答用户问题。回答要准确、简洁、有帮助。", ai_config)
         
+        question = " ".join(request.question.split())
+        # 只取与问题最相关的检索块；旧文章首次提问时补建索引
+        chunks = await adb.search_article_chunks(article['id'], question)
+        if not chunks and article.get('content'):
+            await adb.index_article(article)
+            chunks = await adb.search_article_chunks(article['id'], question)
+        excerpts = context.GAP_MARKER.join(
+            (f"### {c['heading']}\n{c['content']}" if c['heading'] and not c['content'].startswith('#') else c['content'])
+            for c in chunks
+        )
+        # 计数与切块是 CPU 密集的，长文章放到线程中执行
+        article_context = await asyncio.to_thread(
+            context.pack, excerpts, context.budget_for("ask"), question, ai_config.get("model")
+        )
         prompt = f"""请根据以下文章内容回答用户的问题。
 
 ## 文章内容
-{article['content'][:6000]}
+{article_context}
 
 ## 用户问题
-{request.question}
+{question}
 
 请给出准确、有帮助的回答："""
         
-        answer = agent.chat(prompt)
+        # 同一篇文章的相同问题并发提问时只调用一次模型
+        answer = await ask_flight.ado(make_flight_key("ask", request.article_id, prompt), agent.achat, prompt)
         return {"success": True, "answer": answer}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"回答失败: {str(e)}")
@@ -679,40 +766,44 @@ async def ask_question(request: AskQuestionRequest, user: dict = Depends(get_cur
 # ========== 笔记接口 ==========
 @app.get("/api/notes/{article_id}")
 async def get_notes(article_id: str, user: dict = Depends(get_current_user)):
-    notes = db.get_notes(article_id, user["username"])
+    notes = await adb.get_notes(article_id, user["username"])
     return {"notes": notes}
 
 @app.post("/api/notes")
 async def save_note(request: SaveNoteRequest, user: dict = Depends(get_current_user)):
-    note_id = db.create_note(request.article_id, request.question, request.answer, user["username"])
+    note_id = await adb.create_note(request.article_id, request.question, request.answer, user["username"])
     return {"success": True, "note_id": note_id}
 
 @app.delete("/api/notes/{note_id}")
 async def delete_note(note_id: int, user: dict = Depends(get_current_user)):
-    db.delete_note(note_id, user["username"])
+    await adb.delete_note(note_id, user["username"])
     return {"success": True}
 
 # ========== 面试题接口 ==========
 @app.get("/api/interview/{article_id}")
 async def get_interview_questions(article_id: str, user: dict = Depends(get_current_user)):
-    questions = db.get_interview_questions(article_id, user["username"])
+    questions = await adb.get_interview_questions(article_id, user["username"])
     return {"questions": questions}
 
 @app.post("/api/interview/generate")
 async def generate_interview_questions(request: GenerateInterviewRequest, user: dict = Depends(get_current_user)):
-    load_ai_config()
-    if not AI_CONFIG.get("api_key"):
+    ai_config = await config_service.aget_ai_config()
+    if not ai_config.get("api_key"):
         raise HTTPException(status_code=400, detail="请先配置API Key")
     
-    article = db.get_article(request.article_id)
+    article = await adb.get_article(request.article_id)
     if not article:
         raise HTTPException(status_code=404, detail="文章不存在")
     
+    # 没有具体问题，按标题挑选最相关的片段
+    article_context = await asyncio.to_thread(
+        context.pack, article['content'], context.budget_for("interview_generate"), article['title'], ai_config.get("model")
+    )
     prompt = f"""根据以下文章内容，生成{request.count}道高质量的求职面试题。
 
 文章标题：{article['title']}
 文章内容：
-{article['content'][:8000]}
+{article_context}
 
 要求：
 1. 面试题要覆盖文章的核心知识点
@@ -727,51 +818,37 @@ async def generate_interview_questions(request: GenerateInterviewRequest, user:
 ]"""
 
     try:
-        import httpx
-        api_base = AI_CONFIG.get('api_base', 'https://api.siliconflow.cn/v1')
-        api_key = AI_CONFIG.get('api_key', '')
-        model = AI_CONFIG.get('model', 'deepseek-ai/DeepSeek-V3')
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(
-                f"{api_base}/chat/completions",
-                headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
-                json={
-                    "model": model,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": 0.7,
-                    "max_tokens": 4096
-                }
-            )
-            result = response.json()
-            content = result["choices"][0]["message"]["content"]
-            
-            # 解析JSON
-            import re
-            json_match = re.search(r'\[[\s\S]*\]', content)
-            if json_match:
-                questions_data = json.loads(json_match.group())
-                created_ids = []
-                for q in questions_data:
-                    qid = db.create_interview_question(
-                        request.article_id, 
-                        q["question"], 
-                        q.get("reference_answer", ""),
-                        user["username"]
-                    )
-                    created_ids.append(qid)
-                return {"success": True, "count": len(created_ids)}
-            else:
-                raise HTTPException(status_code=500, detail="AI返回格式错误")
+        content = await llm_client.chat_completion(
+            [{"role": "user", "content": prompt}], temperature=0.7, max_tokens=4096, timeout=120.0, config=ai_config
+        )
+        
+        # 解析JSON
+        import re
+        json_match = re.search(r'\[[\s\S]*\]', content)
+        if json_match:
+            questions_data = json.loads(json_match.group())
+            created_ids = []
+            for q in questions_data:
+                qid = await adb.create_interview_question(
+                    request.article_id, 
+                    q["question"], 
+                    q.get("reference_answer", ""),
+                    user["username"]
+                )
+                created_ids.append(qid)
+            return {"success": True, "count": len(created_ids)}
+        else:
+            raise HTTPException(status_code=500, detail="AI返回格式错误")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"生成面试题失败: {str(e)}")
 
 @app.post("/api/interview/answer")
 async def answer_interview_question(request: AnswerInterviewRequest, user: dict = Depends(get_current_user)):
-    load_ai_config()
-    if not AI_CONFIG.get("api_key"):
+    ai_config = await config_service.aget_ai_config()
+    if not ai_config.get("api_key"):
         raise HTTPException(status_code=400, detail="请先配置API Key")
     
-    question = db.get_interview_question(request.question_id, user["username"])
+    question = await adb.get_interview_question(request.question_id, user["username"])
     if not question:
         raise HTTPException(status_code=404, detail="面试题不存在")
     
@@ -795,56 +872,45 @@ async def answer_interview_question(request: AnswerInterviewRequest, user: dict
 score为0-100分，feedback使用Markdown格式详细点评并给出更好的回答建议。"""
 
     try:
-        import httpx
-        api_base = AI_CONFIG.get('api_base', 'https://api.siliconflow.cn/v1')
-        api_key = AI_CONFIG.get('api_key', '')
-        model = AI_CONFIG.get('model', 'deepseek-ai/DeepSeek-V3')
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                f"{api_base}/chat/completions",
-                headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
-                json={
-                    "model": model,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": 0.7,
-                    "max_tokens": 2048
-                }
-            )
-            result = response.json()
-            content = result["choices"][0]["message"]["content"]
+        content = await llm_client.chat_completion(
+            [{"role": "user", "content": prompt}], temperature=0.7, max_tokens=2048, timeout=60.0, config=ai_config
+        )
+        
+        import re
+        json_match = re.search(r'\{[\s\S]*\}', content)
+        if json_match:
+            eval_data = json.loads(json_match.group())
+            score = eval_data.get("score", 0)
+            feedback = eval_data.get("feedback", "评估失败")
             
-            import re
-            json_match = re.search(r'\{[\s\S]*\}', content)
-            if json_match:
-                eval_data = json.loads(json_match.group())
-                score = eval_data.get("score", 0)
-                feedback = eval_data.get("feedback", "评估失败")
-                
-                db.update_interview_answer(request.question_id, request.answer, score, feedback, user["username"])
-                return {"success": True, "score": score, "feedback": feedback}
-            else:
-                raise HTTPException(status_code=500, detail="AI返回格式错误")
+            await adb.update_interview_answer(request.question_id, request.answer, score, feedback, user["username"])
+            return {"success": True, "score": score, "feedback": feedback}
+        else:
+            raise HTTPException(status_code=500, detail="AI返回格式错误")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"评估答案失败: {str(e)}")
 
 @app.post("/api/interview/regenerate/{question_id}")
 async def regenerate_interview_question(question_id: int, user: dict = Depends(get_current_user)):
-    load_ai_config()
-    if not AI_CONFIG.get("api_key"):
+    ai_config = await config_service.aget_ai_config()
+    if not ai_config.get("api_key"):
         raise HTTPException(status_code=400, detail="请先配置API Key")
     
-    old_question = db.get_interview_question(question_id, user["username"])
+    old_question = await adb.get_interview_question(question_id, user["username"])
     if not old_question:
         raise HTTPException(status_code=404, detail="面试题不存在")
     
-    article = db.get_article(old_question['article_id'])
+    article = await adb.get_article(old_question['article_id'])
     if not article:
         raise HTTPException(status_code=404, detail="文章不存在")
     
+    article_context = await asyncio.to_thread(
+        context.pack, article['content'], context.budget_for("interview_regenerate"), article['title'], ai_config.get("model")
+    )
     prompt = f"""根据以下文章内容，生成1道新的高质量面试题（不要与旧题目重复）。
 
 文章标题：{article['title']}
-文章内容摘要：{article['content'][:4000]}
+文章内容摘要：{article_context}
 
 旧题目（请生成不同的）：{old_question['question']}
 
@@ -852,44 +918,30 @@ async def regenerate_interview_question(question_id: int, user: dict = Depends(g
 {{"question": "新面试题", "reference_answer": "参考答案"}}"""
 
     try:
-        import httpx
-        api_base = AI_CONFIG.get('api_base', 'https://api.siliconflow.cn/v1')
-        api_key = AI_CONFIG.get('api_key', '')
-        model = AI_CONFIG.get('model', 'deepseek-ai/DeepSeek-V3')
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                f"{api_base}/chat/completions",
-                headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
-                json={
-                    "model": model,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "temperature": 0.8,
-                    "max_tokens": 1024
-                }
+        content = await llm_client.chat_completion(
+            [{"role": "user", "content": prompt}], temperature=0.8, max_tokens=1024, timeout=60.0, config=ai_config
+        )
+        
+        import re
+        json_match = re.search(r'\{[\s\S]*\}', content)
+        if json_match:
+            q_data = json.loads(json_match.group())
+            await adb.delete_interview_question(question_id, user["username"])
+            new_id = await adb.create_interview_question(
+                old_question['article_id'],
+                q_data["question"],
+                q_data.get("reference_answer", ""),
+                user["username"]
             )
-            result = response.json()
-            content = result["choices"][0]["message"]["content"]
-            
-            import re
-            json_match = re.search(r'\{[\s\S]*\}', content)
-            if json_match:
-                q_data = json.loads(json_match.group())
-                db.delete_interview_question(question_id, user["username"])
-                new_id = db.create_interview_question(
-                    old_question['article_id'],
-                    q_data["question"],
-                    q_data.get("reference_answer", ""),
-                    user["username"]
-                )
-                return {"success": True, "new_id": new_id, "question": q_data["question"], "reference_answer": q_data.get("reference_answer", "")}
-            else:
-                raise HTTPException(status_code=500, detail="AI返回格式错误")
+            return {"success": True, "new_id": new_id, "question": q_data["question"], "reference_answer": q_data.get("reference_answer", "")}
+        else:
+            raise HTTPException(status_code=500, detail="AI返回格式错误")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"重新生成失败: {str(e)}")
 
 @app.delete("/api/interview/{question_id}")
 async def delete_interview_question(question_id: int, user: dict = Depends(get_current_user)):
-    db.delete_interview_question(question_id, user["username"])
+    await adb.delete_interview_question(question_id, user["username"])
     return {"success": True}
 
 # ========== AI对话接口（流式） ==========
@@ -908,50 +960,49 @@ async def web_search(query: str) -> str:
     try:
         import urllib.parse
         search_url = f"https://html.duckduckgo.com/html/?q={urllib.parse.quote(query)}"
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            response = await client.get(search_url, headers={
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-            })
-            if response.status_code == 200:
-                from bs4 import BeautifulSoup
-                soup = BeautifulSoup(response.text, 'html.parser')
-                results = []
-                for result in soup.select('.result')[:10]:  # 获取10条结果
-                    title_elem = result.select_one('.result__title')
-                    snippet_elem = result.select_one('.result__snippet')
-                    link_elem = result.select_one('.result__a')
-                    if title_elem and snippet_elem:
-                        title = title_elem.get_text(strip=True)
-                        snippet = snippet_elem.get_text(strip=True)
-                        # 从DuckDuckGo重定向URL中提取真实URL
-                        raw_url = link_elem.get('href', '') if link_elem else ''
-                        url = ''
-                        if raw_url:
-                            if 'uddg=' in raw_url:
-                                # 解析 //duckduckgo.com/l/?uddg=https%3A%2F%2F... 格式
-                                try:
-                                    parsed = urllib.parse.urlparse(raw_url)
-                                    params = urllib.parse.parse_qs(parsed.query)
-                                    url = params.get('uddg', [''])[0]
-                                except:
-                                    url = raw_url
-                            elif raw_url.startswith('http'):
+        response = await llm_client.request("GET", search_url, timeout=15.0, headers={
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+        })
+        if response.status_code == 200:
+            from bs4 import BeautifulSoup
+            soup = BeautifulSoup(response.text, 'html.parser')
+            results = []
+            for result in soup.select('.result')[:10]:  # 获取10条结果
+                title_elem = result.select_one('.result__title')
+                snippet_elem = result.select_one('.result__snippet')
+                link_elem = result.select_one('.result__a')
+                if title_elem and snippet_elem:
+                    title = title_elem.get_text(strip=True)
+                    snippet = snippet_elem.get_text(strip=True)
+                    # 从DuckDuckGo重定向URL中提取真实URL
+                    raw_url = link_elem.get('href', '') if link_elem else ''
+                    url = ''
+                    if raw_url:
+                        if 'uddg=' in raw_url:
+                            # 解析 //duckduckgo.com/l/?uddg=https%3A%2F%2F... 格式
+                            try:
+                                parsed = urllib.parse.urlparse(raw_url)
+                                params = urllib.parse.parse_qs(parsed.query)
+                                url = params.get('uddg', [''])[0]
+                            except:
                                 url = raw_url
-                        # 格式: - 标题 (URL): 内容
-                        if url:
-                            results.append(f"- {title} ({url}): {snippet}")
-                        else:
-                            results.append(f"- {title}: {snippet}")
-                if results:
-                    return "\n".join(results)
+                        elif raw_url.startswith('http'):
+                            url = raw_url
+                    # 格式: - 标题 (URL): 内容
+                    if url:
+                        results.append(f"- {title} ({url}): {snippet}")
+                    else:
+                        results.append(f"- {title}: {snippet}")
+            if results:
+                return "\n".join(results)
         return ""
     except Exception as e:
         return ""
 
 @app.post("/api/chat/stream")
 async def chat_stream(request: ChatRequest, user: dict = Depends(get_current_user)):
-    load_ai_config()
-    if not AI_CONFIG.get("api_key"):
+    ai_config = await config_service.aget_ai_config()
+    if not ai_config.get("api_key"):
         raise HTTPException(status_code=400, detail="请先配置API Key")
     
     async def generate():
@@ -979,46 +1030,11 @@ async def chat_stream(request: ChatRequest, user: dict = Depends(get_current_use
             
             messages.append({"role": "user", "content": request.message})
             
-            api_base = AI_CONFIG.get('api_base', 'https://api.siliconflow.cn/v1')
-            api_key = AI_CONFIG.get('api_key', '')
-            model = AI_CONFIG.get('model', 'deepseek-ai/DeepSeek-V3')
-            
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                url = f"{api_base.rstrip('/')}/chat/completions"
-                async with client.stream(
-                    "POST",
-                    url,
-                    headers={
-                        "Authorization": f"Bearer {api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": model,
-                        "messages": messages,
-                        "stream": True,
-                        "temperature": 0.7,
-                        "max_tokens": 65536
-                    }
-                ) as response:
-                    if response.status_code != 200:
-                        error_text = await response.aread()
-                        yield f"data: {json.dumps({'error': f'API错误: {response.status_code}'})}"
-                        return
-                    
-                    async for line in response.aiter_lines():
-                        if line.startswith("data:"):
-                            data = line[5:].lstrip()
-                            if data == "[DONE]":
-                                break
-                            try:
-                                chunk = json.loads(data)
-                                if chunk.get("choices") and len(chunk["choices"]) > 0:
-                                    delta = chunk["choices"][0].get("delta", {})
-                                    content = delta.get("content") or delta.get("reasoning_content", "")
-                                    if content:
-                                        yield f"data: {json.dumps({'content': content})}\n\n"
-                            except json.JSONDecodeError:
-                                pass
+            async for content in llm_client.stream_chat_completion(messages, temperature=0.7, timeout=120.0, config=ai_config):
+                yield f"data: {json.dumps({'content': content})}\n\n"
+        except llm_client.LLMError as e:
+            yield f"data: {json.dumps({'error': str(e)})}"
+            return
         except httpx.TimeoutException:
             yield f"data: {json.dumps({'error': '请求超时，请重试'})}"
         except Exception as e:
@@ -1030,73 +1046,55 @@ async def chat_stream(request: ChatRequest, user: dict = Depends(get_current_use
 
 @app.post("/api/chat/image")
 async def generate_chat_image(request: ImageGenRequest, user: dict = Depends(get_current_user)):
-    load_ai_config()
-    if not AI_CONFIG.get("api_key"):
+    ai_config = await config_service.aget_ai_config()
+    if not ai_config.get("api_key"):
         raise HTTPException(status_code=400, detail="请先配置API Key")
     
     try:
-        base_url = AI_CONFIG.get("api_base", "https://api.siliconflow.cn/v1")
-        api_key = AI_CONFIG.get("api_key", "")
+        async def generate(prompt: str) -> str:
+            url = await llm_client.generate_image(prompt, timeout=90.0, config=ai_config)
+            return await asyncio.to_thread(image_store.mirror, url)
         
-        async with httpx.AsyncClient(timeout=90.0) as client:
-            response = await client.post(
-                f"{base_url.rstrip('/')}/images/generations",
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "black-forest-labs/FLUX.1-schnell",
-                    "prompt": request.prompt,
-                    "image_size": "1024x576",
-                    "num_inference_steps": 20
-                }
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("images") and len(data["images"]) > 0:
-                    return {"success": True, "url": data["images"][0].get("url", "")}
-                if data.get("data") and len(data["data"]) > 0:
-                    return {"success": True, "url": data["data"][0].get("url", "")}
-            
-            return {"success": False, "error": "图片生成失败"}
+        url = await image_cache.aget_or_generate(request.prompt, generate)
+        if url:
+            return {"success": True, "url": url}
+        return {"success": False, "error": "图片生成失败"}
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 # ========== 聊天记录接口 ==========
 @app.get("/api/conversations")
 async def list_conversations(user: dict = Depends(get_current_user)):
-    conversations = db.get_conversations(user["username"])
+    conversations = await adb.get_conversations(user["username"])
     return {"conversations": conversations}
 
 @app.post("/api/conversations")
 async def create_conversation(user: dict = Depends(get_current_user)):
     conv_id = str(uuid.uuid4())[:8]
-    db.create_conversation(conv_id, user["username"])
+    await adb.create_conversation(conv_id, user["username"])
     return {"success": True, "conversation_id": conv_id}
 
 @app.get("/api/conversations/{conv_id}")
 async def get_conversation(conv_id: str, user: dict = Depends(get_current_user)):
-    conv = db.get_conversation(conv_id, user["username"])
+    conv = await adb.get_conversation(conv_id, user["username"])
     if not conv:
         raise HTTPException(status_code=404, detail="对话不存在")
     return {"conversation": conv}
 
 @app.put("/api/conversations/{conv_id}")
 async def update_conversation(conv_id: str, request: dict, user: dict = Depends(get_current_user)):
-    db.update_conversation(conv_id, request.get("messages", []), request.get("title", ""))
+    await adb.update_conversation(conv_id, request.get("messages", []), request.get("title", ""))
     return {"success": True}
 
 @app.delete("/api/conversations/{conv_id}")
 async def delete_conversation(conv_id: str, user: dict = Depends(get_current_user)):
-    db.delete_conversation(conv_id, user["username"])
+    await adb.delete_conversation(conv_id, user["username"])
     return {"success": True}
 
 @app.post("/api/conversations/batch-delete")
 async def batch_delete_conversations(request: BatchDeleteRequest, user: dict = Depends(get_current_user)):
     for conv_id in request.ids:
-        db.delete_conversation(conv_id, user["username"])
+        await adb.delete_conversation(conv_id, user["username"])
     return {"success": True, "deleted": len(request.ids)}
 
 if __name__ == "__main__":
@@ -0,0 +1,56 @@
+"""
+数据库异步访问层
+database.py 基于 pymysql，所有函数都会阻塞；在事件循环里直接调用时，一条慢查询会卡住所有 SSE 连接。
+这里把调用放到专用线程池执行，线程数与连接池上限一致，查询在池满时排队而不会占满默认线程池；
+database.py 的每个公开函数都有同名的异步版本：
+
+    import async_db as adb
+    article = await adb.get_article(article_id)
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import database as db
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                max_workers = db.DB_POOL_CONFIG["pool_size"] + db.DB_POOL_CONFIG["max_overflow"]
+                _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+    return _executor
+
+
+async def run(fn, *args, **kwargs):
+    """在数据库线程池中执行阻塞函数 fn(*args, **kwargs)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(fn, *args, **kwargs))
+
+
+def shutdown():
+    """等待进行中的查询完成并关闭线程池（应用关闭时调用）"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def __getattr__(name: str):
+    """adb.xxx 返回 database.xxx 的异步包装（首次访问时生成并缓存）"""
+    fn = getattr(db, name, None)
+    if name.startswith("_") or not callable(fn) or isinstance(fn, type) or getattr(fn, "__module__", None) != db.__name__:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await run(fn, *args, **kwargs)
+
+    globals()[name] = wrapper
+    return wrapper
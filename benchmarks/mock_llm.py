@@ -0,0 +1,240 @@
+"""
+本地 OpenAI 兼容的模拟LLM服务
+支持 /chat/completions（含流式）与 /images/generations，可配置首Token延迟、生成速率、
+流式分块大小，以及按比例注入 500 / 429 错误（或超过并发上限时返回 429）
+
+用法:
+    python -m benchmarks.mock_llm --port 9100 --latency 0.5 --tokens-per-second 80 --rate-429 0.05
+"""
+import re
+import json
+import time
+import random
+import asyncio
+import argparse
+import threading
+from collections import Counter
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import uvicorn
+
+DEFAULT_SETTINGS = {
+    "latency": 0.3,             # 首Token延迟（秒）
+    "tokens_per_second": 100.0, # 生成速率
+    "chunk_tokens": 4,          # 流式输出每个分块的Token数
+    "response_tokens": 600,     # 普通文本回复的Token数（文章/章节/对话）
+    "image_latency": 1.0,       # 图片生成耗时（秒）
+    "error_rate": 0.0,          # 返回 500 的比例
+    "rate_429": 0.0,            # 返回 429 的比例
+    "retry_after": 1,           # 429 响应的 Retry-After（秒）
+    "max_inflight": 0,          # 并发请求超过该值时返回 429（0 表示不限制）
+}
+
+# 模拟文本按 2 个字符 ≈ 1 个Token 生成
+FILLER = "这是模拟生成的学习内容用于压测"
+
+
+class MockStats:
+    def __init__(self):
+        self.counts = Counter()
+        self.inflight = 0
+        self.peak_inflight = 0
+        self.tokens = 0
+        self._lock = threading.Lock()
+
+    def record(self, key: str, tokens: int = 0):
+        with self._lock:
+            self.counts[key] += 1
+            self.tokens += tokens
+
+    def enter(self) -> int:
+        with self._lock:
+            self.inflight += 1
+            self.peak_inflight = max(self.peak_inflight, self.inflight)
+            return self.inflight
+
+    def leave(self):
+        with self._lock:
+            self.inflight -= 1
+
+    def reset(self):
+        with self._lock:
+            self.counts.clear()
+            self.tokens = 0
+            self.peak_inflight = self.inflight
+
+    def to_dict(self) -> dict:
+        return {**self.counts, "tokens": self.tokens, "peak_inflight": self.peak_inflight}
+
+
+def _filler_tokens(count: int):
+    """产出 count 个模拟Token（带 Markdown 标题，保证文章配图逻辑能找到插入位置）"""
+    for i in range(count):
+        if i % 150 == 0:
+            yield f"\n\n## 第{i // 150 + 1}节 模拟小节\n\n"
+        else:
+            yield FILLER[(i * 2) % len(FILLER):(i * 2) % len(FILLER) + 2]
+
+
+def render_reply(prompt: str, response_tokens: int) -> list:
+    """按提示词类型返回可被业务代码解析的回复（面试题/评分JSON 或 Markdown 正文），以Token列表形式"""
+    if '"score"' in prompt:
+        text = json.dumps({"score": 80, "feedback": "### 评分：80分\n\n**优点：**\n- 模拟点评"}, ensure_ascii=False)
+    elif '"question": "新面试题"' in prompt:
+        text = json.dumps({"question": "模拟面试题", "reference_answer": "模拟参考答案"}, ensure_ascii=False)
+    elif '"question"' in prompt:
+        match = re.search(r"生成(\d+)道", prompt)
+        count = int(match.group(1)) if match else 5
+        text = json.dumps(
+            [{"question": f"模拟面试题{i + 1}", "reference_answer": "模拟参考答案"} for i in range(count)],
+            ensure_ascii=False
+        )
+    else:
+        return ["# 模拟文章标题\n"] + list(_filler_tokens(response_tokens))
+    return [text[i:i + 2] for i in range(0, len(text), 2)]
+
+
+def create_app(settings: dict = None) -> FastAPI:
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+    app = FastAPI(title="Mock LLM")
+    app.state.settings = settings
+    app.state.stats = MockStats()
+
+    def injected_error(endpoint: str, inflight: int):
+        """按配置返回注入的错误响应，不注入时返回 None"""
+        if settings["max_inflight"] and inflight > settings["max_inflight"]:
+            app.state.stats.record(f"{endpoint}:429")
+            return JSONResponse({"error": {"message": "too many concurrent requests"}}, status_code=429,
+                                headers={"Retry-After": str(settings["retry_after"])})
+        roll = random.random()
+        if roll < settings["rate_429"]:
+            app.state.stats.record(f"{endpoint}:429")
+            return JSONResponse({"error": {"message": "rate limited"}}, status_code=429,
+                                headers={"Retry-After": str(settings["retry_after"])})
+        if roll < settings["rate_429"] + settings["error_rate"]:
+            app.state.stats.record(f"{endpoint}:500")
+            return JSONResponse({"error": {"message": "injected error"}}, status_code=500)
+        return None
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats = app.state.stats
+        error = injected_error("chat", stats.enter())
+        if error is not None:
+            stats.leave()
+            return error
+        prompt = "\n".join(m.get("content") or "" for m in body.get("messages", []))
+        tokens = render_reply(prompt, settings["response_tokens"])
+        stats.record("chat", len(tokens))
+        created = int(time.time())
+
+        if not body.get("stream"):
+            try:
+                await asyncio.sleep(settings["latency"] + len(tokens) / settings["tokens_per_second"])
+            finally:
+                stats.leave()
+            return {
+                "id": "mock", "object": "chat.completion", "created": created, "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(prompt) // 2, "completion_tokens": len(tokens),
+                          "total_tokens": len(prompt) // 2 + len(tokens)},
+            }
+
+        async def event_stream():
+            try:
+                await asyncio.sleep(settings["latency"])
+                step = settings["chunk_tokens"]
+                for i in range(0, len(tokens), step):
+                    chunk = {
+                        "id": "mock", "object": "chat.completion.chunk", "created": created, "model": body.get("model"),
+                        "choices": [{"index": 0, "delta": {"content": "".join(tokens[i:i + step])}, "finish_reason": None}],
+                    }
+                    yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                    await asyncio.sleep(step / settings["tokens_per_second"])
+                yield "data: [DONE]\n\n"
+            finally:
+                stats.leave()
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+    @app.post("/v1/images/generations")
+    async def images_generations(request: Request):
+        await request.json()
+        stats = app.state.stats
+        inflight = stats.enter()
+        try:
+            error = injected_error("image", inflight)
+            if error is not None:
+                return error
+            stats.record("image")
+            await asyncio.sleep(settings["image_latency"])
+            return {"images": [{"url": f"https://mock.invalid/images/{random.getrandbits(48):012x}.png"}]}
+        finally:
+            stats.leave()
+
+    @app.get("/stats")
+    async def get_stats():
+        return app.state.stats.to_dict()
+
+    return app
+
+
+class ServerThread:
+    """在后台线程中运行 ASGI 应用（模拟LLM服务与被测API共用）"""
+
+    def __init__(self, app, host: str = "127.0.0.1", port: int = 0):
+        self.app = app
+        config = uvicorn.Config(app, host=host, port=port, log_level="warning", lifespan="on")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, name="bench-server", daemon=True)
+
+    @property
+    def url(self) -> str:
+        sock = self.server.servers[0].sockets[0]
+        host, port = sock.getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "ServerThread":
+        self.thread.start()
+        while not self.server.started:
+            if not self.thread.is_alive():
+                raise RuntimeError("服务启动失败")
+            time.sleep(0.05)
+        return self
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(5)
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser):
+    """模拟服务参数（benchmarks.run 复用）"""
+    parser.add_argument("--latency", type=float, default=DEFAULT_SETTINGS["latency"], help="首Token延迟（秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=DEFAULT_SETTINGS["tokens_per_second"], help="生成速率")
+    parser.add_argument("--chunk-tokens", type=int, default=DEFAULT_SETTINGS["chunk_tokens"], help="流式分块Token数")
+    parser.add_argument("--response-tokens", type=int, default=DEFAULT_SETTINGS["response_tokens"], help="正文回复Token数")
+    parser.add_argument("--image-latency", type=float, default=DEFAULT_SETTINGS["image_latency"], help="图片生成耗时（秒）")
+    parser.add_argument("--error-rate", type=float, default=DEFAULT_SETTINGS["error_rate"], help="500 错误比例")
+    parser.add_argument("--rate-429", type=float, default=DEFAULT_SETTINGS["rate_429"], help="429 错误比例")
+    parser.add_argument("--retry-after", type=int, default=DEFAULT_SETTINGS["retry_after"], help="429 的 Retry-After（秒）")
+    parser.add_argument("--max-inflight", type=int, default=DEFAULT_SETTINGS["max_inflight"], help="并发上限，超出返回 429")
+
+
+def settings_from_args(args) -> dict:
+    return {key: getattr(args, key) for key in DEFAULT_SETTINGS}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟LLM服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+    print(f"🧪 模拟LLM服务: http://{args.host}:{args.port}/v1")
+    uvicorn.run(create_app(settings_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+性能基准测试
+启动本地模拟LLM服务，按指定并发驱动文章/文档生成管线与 /api/chat/stream、面试题接口，
+输出 p50/p95/p99 延迟、首Token时间（TTFT）、吞吐量、数据库查询次数与上游请求统计
+
+默认使用独立数据库 learnflow_bench（会写入配置、用户和生成结果，不要指向生产库）
+
+用法:
+    python -m benchmarks.run --scenarios chat,interview-answer --concurrency 1,8,32 --requests 64
+    python -m benchmarks.run --scenarios document --concurrency 4 --requests 8 --chapters 8 --rate-429 0.05
+"""
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# 必须在导入 config / database 之前设置：独立数据库，API进程不启动内嵌任务工作线程（避免轮询计入查询数）
+os.environ.setdefault("MYSQL_DATABASE", "learnflow_bench")
+os.environ.setdefault("JOB_EMBEDDED_WORKERS", "0")
+
+import httpx
+from benchmarks.mock_llm import create_app as create_mock_app, ServerThread, add_mock_arguments, settings_from_args
+
+SCENARIOS = ["article", "document", "chat", "interview-generate", "interview-answer"]
+BENCH_USER = "bench"
+
+
+def percentile(values: list, p: float):
+    """最近秩百分位数"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+class Bench:
+    def __init__(self, args, mock: ServerThread):
+        self.args = args
+        self.mock = mock
+        self.api = None
+        self.token = None
+        self.article_id = None
+        self.question_id = None
+
+    # ---------- 准备 ----------
+    def setup(self):
+        import database as db
+        import config_service
+        import sessions
+        import migrations
+        from app import app
+
+        # 导入 database 不再建库建表，写入配置与用户前先执行迁移
+        migrations.migrate()
+        config_service.save({
+            "api_key": "bench-key",
+            "api_base": f"{self.mock.url}/v1",
+            "model": "mock-model",
+            "provider": "custom",
+        })
+        if not db.get_user(BENCH_USER):
+            db.create_user(BENCH_USER, "bench@example.com", "-")
+        self.token = sessions.issue_token(BENCH_USER)
+
+        self.article_id = f"bench-{uuid.uuid4().hex[:6]}"
+        db.create_article({
+            "id": self.article_id, "title": "基准测试文章", "content": "## 模拟小节\n" + "模拟内容" * 2000,
+            "topic": "基准测试", "type": "article", "user": BENCH_USER
+        })
+        self.api = ServerThread(app).start()
+
+    async def prepare_interview(self, client: httpx.AsyncClient):
+        """面试题回答场景需要先有题目"""
+        response = await client.post("/api/interview/generate", json={"article_id": self.article_id, "count": 1})
+        response.raise_for_status()
+        response = await client.get(f"/api/interview/{self.article_id}")
+        self.question_id = response.json()["questions"][0]["id"]
+
+    # ---------- 单次操作：返回 (是否成功, 首Token时间) ----------
+    async def op_article(self, client, i):
+        import database as db
+        from generation import run_article_generation
+        task_id = f"bench-{uuid.uuid4().hex[:8]}"
+        db.create_task({"id": task_id, "type": "article", "status": "running", "topic": f"基准测试{i}", "user": BENCH_USER})
+        await asyncio.to_thread(run_article_generation, task_id, f"基准测试{i}", "", BENCH_USER, False)
+        return True, None
+
+    async def op_document(self, client, i):
+        import database as db
+        from generation import run_document_generation
+        task_id = f"bench-{uuid.uuid4().hex[:8]}"
+        outline = {
+            "title": f"基准测试文档{i}", "description": "", "topic": "基准测试",
+            "chapters": [{"id": n + 1, "title": f"第{n + 1}章", "description": "模拟章节"} for n in range(self.args.chapters)]
+        }
+        db.create_task({"id": task_id, "type": "document", "status": "running", "topic": "基准测试",
+                        "user": BENCH_USER, "total": self.args.chapters})
+        await asyncio.to_thread(run_document_generation, task_id, outline, BENCH_USER, False)
+        return True, None
+
+    async def op_chat(self, client, i):
+        started = time.perf_counter()
+        ttft = None
+        ok = True
+        async with client.stream("POST", "/api/chat/stream", json={"message": f"问题{i}", "deep_think": False}) as response:
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                if '"content"' in line and ttft is None:
+                    ttft = time.perf_counter() - started
+                elif '"error"' in line:
+                    ok = False
+        return ok and response.status_code == 200, ttft
+
+    async def op_interview_generate(self, client, i):
+        response = await client.post("/api/interview/generate", json={"article_id": self.article_id, "count": 3})
+        return response.status_code == 200, None
+
+    async def op_interview_answer(self, client, i):
+        response = await client.post("/api/interview/answer", json={"question_id": self.question_id, "answer": f"回答{i}"})
+        return response.status_code == 200, None
+
+    # ---------- 执行 ----------
+    async def run_scenario(self, scenario: str, concurrency: int) -> dict:
+        import database as db
+        op = getattr(self, "op_" + scenario.replace("-", "_"))
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies, ttfts, failures = [], [], 0
+
+        async with httpx.AsyncClient(base_url=self.api.url, timeout=600,
+                                     headers={"Authorization": f"Bearer {self.token}"}) as client:
+            if scenario == "interview-answer" and self.question_id is None:
+                await self.prepare_interview(client)
+
+            async def one(i):
+                nonlocal failures
+                async with semaphore:
+                    started = time.perf_counter()
+                    try:
+                        ok, ttft = await op(client, i)
+                    except Exception as e:
+                        print(f"  ❌ {scenario} #{i}: {e}")
+                        ok, ttft = False, None
+                    latencies.append(time.perf_counter() - started)
+                    if ttft is not None:
+                        ttfts.append(ttft)
+                    if not ok:
+                        failures += 1
+
+            db.reset_query_stats()
+            self.mock.app.state.stats.reset()
+            started = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(self.args.requests)))
+            elapsed = time.perf_counter() - started
+
+        queries = db.get_query_stats()["queries"]
+        upstream = self.mock.app.state.stats.to_dict()
+        completed = self.args.requests - failures
+        return {
+            "scenario": scenario,
+            "concurrency": concurrency,
+            "requests": self.args.requests,
+            "failures": failures,
+            "elapsed": round(elapsed, 3),
+            "throughput": round(completed / elapsed, 3) if elapsed else None,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "ttft_p50": percentile(ttfts, 50),
+            "ttft_p95": percentile(ttfts, 95),
+            "db_queries": queries,
+            "db_queries_per_request": round(queries / self.args.requests, 1),
+            "upstream_tokens_per_second": round(upstream["tokens"] / elapsed, 1) if elapsed else None,
+            "upstream": upstream,
+        }
+
+    def shutdown(self):
+        if self.api:
+            self.api.stop()
+
+
+def format_seconds(value) -> str:
+    return "-" if value is None else f"{value * 1000:.0f}ms"
+
+
+def print_report(results: list):
+    header = f"{'场景':<20}{'并发':>6}{'失败':>6}{'吞吐/s':>9}{'p50':>10}{'p95':>10}{'p99':>10}{'TTFT50':>10}{'TTFT95':>10}{'SQL/请求':>10}{'上游429':>8}"
+    print("\n" + header)
+    print("-" * len(header))
+    for r in results:
+        upstream_429 = sum(v for k, v in r["upstream"].items() if k.endswith(":429"))
+        print(f"{r['scenario']:<20}{r['concurrency']:>6}{r['failures']:>6}{r['throughput']:>9}"
+              f"{format_seconds(r['p50']):>10}{format_seconds(r['p95']):>10}{format_seconds(r['p99']):>10}"
+              f"{format_seconds(r['ttft_p50']):>10}{format_seconds(r['ttft_p95']):>10}"
+              f"{r['db_queries_per_request']:>10}{upstream_429:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LearnFlow AI 性能基准测试")
+    parser.add_argument("--scenarios", default="chat,interview-answer", help=f"逗号分隔，可选: {','.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", default="1,8", help="逗号分隔的并发数列表")
+    parser.add_argument("--requests", type=int, default=16, help="每个场景/并发组合的请求数")
+    parser.add_argument("--chapters", type=int, default=5, help="document 场景每个文档的章节数")
+    parser.add_argument("--json", help="把结果写入 JSON 文件")
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景: {', '.join(unknown)}")
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    mock = ServerThread(create_mock_app(settings_from_args(args))).start()
+    bench = Bench(args, mock)
+    results = []
+    try:
+        bench.setup()
+        for scenario in scenarios:
+            for concurrency in levels:
+                print(f"▶ {scenario} 并发={concurrency} 请求数={args.requests}")
+                results.append(asyncio.run(bench.run_scenario(scenario, concurrency)))
+    finally:
+        bench.shutdown()
+        mock.stop()
+
+    print_report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.json}")
+
+
+if __name__ == "__main__":
+    main()
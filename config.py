@@ -21,6 +21,108 @@ IMAGE_CONFIG = {
     "model": os.getenv("IMAGE_MODEL", "black-forest-labs/FLUX.1-schnell"),
     "image_size": os.getenv("IMAGE_SIZE", "1024x576"),
     "num_inference_steps": int(os.getenv("IMAGE_STEPS", "20")),
+    "concurrency": int(os.getenv("IMAGE_CONCURRENCY", "4")),  # 同时生成的图片数（全进程共享）
+    "deferred": os.getenv("IMAGE_DEFERRED", "0") == "1",  # 1: 文章先保存，配图生成后再回填
+}
+
+# 生成图片本地存储（下载一次、按内容哈希去重，由 /api/images 提供长期缓存）
+IMAGE_STORE_CONFIG = {
+    "enabled": os.getenv("IMAGE_MIRROR", "1") == "1",
+    "dir": os.getenv("IMAGE_STORE_DIR", "data/images"),
+    "webp": os.getenv("IMAGE_WEBP", "0") == "1",  # 转码为 WebP（需要安装 Pillow）
+    "thumb_width": 480,  # ?thumb=1 缩略图最大边长（需要安装 Pillow）
+    "max_bytes": 20 * 1024 * 1024,
+}
+
+# 图片生成结果缓存（相同 模型+提示词+尺寸+步数 复用已本地化的图片）
+IMAGE_CACHE_CONFIG = {
+    "backend": os.getenv("IMAGE_CACHE_BACKEND", "memory"),  # memory / disk / none
+    "ttl": int(os.getenv("IMAGE_CACHE_TTL", str(30 * 24 * 3600))),
+    "max_entries": int(os.getenv("IMAGE_CACHE_MAX_ENTRIES", "2000")),
+    "disk_path": os.getenv("IMAGE_CACHE_PATH", "data/images/cache.sqlite3"),
+}
+
+# HTTP 连接池配置（异步LLM客户端共享）
+HTTP_CONFIG = {
+    "http2": os.getenv("HTTP2_ENABLED", "1") == "1",
+    "max_connections": int(os.getenv("HTTP_MAX_CONNECTIONS", "100")),
+    "max_keepalive_connections": int(os.getenv("HTTP_MAX_KEEPALIVE", "20")),
+    "max_connections_per_host": int(os.getenv("HTTP_MAX_PER_HOST", "32")),
+    "keepalive_expiry": 60.0,
+    "timeout": 300.0,
+    "connect_timeout": 30.0,
+}
+
+# 登录认证配置
+AUTH_CONFIG = {
+    # session: 令牌存数据库，进程内缓存解析结果；signed: HMAC签名的无状态令牌，校验不查库
+    # （signed 模式下旧令牌在有效期内不会因重新登录而失效）
+    "token_mode": os.getenv("AUTH_TOKEN_MODE", "session"),
+    "secret": os.getenv("JWT_SECRET", ""),
+    "token_ttl": int(os.getenv("AUTH_TOKEN_TTL", str(7 * 24 * 3600))),  # 签名令牌有效期（秒）
+    "cache_ttl": int(os.getenv("AUTH_CACHE_TTL", "300")),  # 令牌解析缓存时间（秒），多进程部署时旧令牌最多在此时间内仍有效
+    "cache_max_entries": 10000,
+}
+
+# 上游LLM限流配置（按 API地址 + API Key 共享）
+RATE_LIMIT_CONFIG = {
+    "requests_per_minute": int(os.getenv("LLM_RPM", "300")),
+    "tokens_per_minute": int(os.getenv("LLM_TPM", "500000")),  # 0 表示不限制Token数
+    "images_per_minute": int(os.getenv("LLM_IMAGES_PER_MINUTE", "20")),
+    "max_concurrency": int(os.getenv("LLM_MAX_CONCURRENCY", "32")),
+    "min_concurrency": 1,
+    "initial_concurrency": 8,
+    "max_retries": int(os.getenv("LLM_MAX_RETRIES", "4")),
+    "backoff_base": 1.0,
+    "backoff_max": 60.0,
+    "expected_output_tokens": 2000,  # 预估单次请求的输出Token数，响应返回 usage 后按实际修正
+}
+
+# 对话上下文配置（BaseAgent 发送前按Token预算裁剪对话历史）
+CONTEXT_CONFIG = {
+    "context_window": int(os.getenv("LLM_CONTEXT_WINDOW", "64000")),  # 模型上下文窗口（Token）
+    "reserve_output_tokens": int(os.getenv("LLM_RESERVE_OUTPUT_TOKENS", "8000")),  # 为输出预留的Token数
+    "history_tokens": int(os.getenv("LLM_HISTORY_TOKENS", "8000")),  # 对话历史最多占用的Token数
+    "max_turns": int(os.getenv("LLM_HISTORY_MAX_TURNS", "10")),  # 最多保留的历史轮数，0 表示只按Token限制
+    "policy": os.getenv("LLM_HISTORY_POLICY", "truncate"),  # truncate / summarize
+    "summary_chars": 200,  # summarize 策略下每条被丢弃消息保留的字符数
+    "chunk_tokens": 300,  # 参考资料切块大小
+    # 各类参考资料的Token预算（另受上下文窗口一半的限制）
+    "budgets": {
+        "article_reference": 3000,     # 文章生成的参考资料
+        "upload": 8000,                # 上传文件（所有文件合计）
+        "parse_file": 6000,            # 解析单个文档
+        "parse_url": 4000,             # 解析单个网页
+        "search_result": 1500,         # 单条搜索结果
+        "ask": 5000,                   # 文章问答
+        "interview_generate": 6000,    # 生成面试题
+        "interview_regenerate": 3000,  # 重新生成单道面试题
+    },
+}
+
+# 文章内容检索配置（/api/ask 按问题取最相关的块）
+RETRIEVAL_CONFIG = {
+    "chunk_chars": 800,  # 检索块大小（字符）
+    "top_k": int(os.getenv("RETRIEVAL_TOP_K", "6")),  # 每次提问取的块数
+    "k1": 1.5,  # BM25 参数
+    "b": 0.75,
+}
+
+# 跨文章搜索配置（/api/search）
+SEARCH_CONFIG = {
+    "title_weight": 3,       # 标题词项的权重（相当于在正文中出现的次数）
+    "min_match": 0.5,        # 文章至少命中的查询词项比例
+    "max_term_length": 32,
+    "snippet_chars": 160,    # 摘要片段长度
+    "backfill_batch": 50,    # 每次搜索最多为旧文章补建索引的篇数
+}
+
+# LLM响应缓存配置
+LLM_CACHE_CONFIG = {
+    "backend": os.getenv("LLM_CACHE_BACKEND", "memory"),  # memory / disk / mysql / none
+    "ttl": int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600))),
+    "max_entries": int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000")),
+    "disk_path": os.getenv("LLM_CACHE_PATH", "cache/llm_cache.sqlite3"),
 }
 
 # 文章生成配置
@@ -36,6 +138,20 @@ DOCUMENT_CONFIG = {
     "max_chapters": 15,
     "chapter_min_words": 800,
     "chapter_max_words": 2000,
+    "chapter_concurrency": int(os.getenv("CHAPTER_CONCURRENCY", "12")),  # 单个文档的章节并发数
+}
+
+# 任务队列配置
+JOB_CONFIG = {
+    "embedded_workers": int(os.getenv("JOB_EMBEDDED_WORKERS", "4")),  # API进程内的工作线程数，0 表示只由 worker.py 执行
+    "worker_processes": int(os.getenv("JOB_WORKER_PROCESSES", "2")),  # worker.py 默认进程数
+    "worker_threads": int(os.getenv("JOB_WORKER_THREADS", "2")),  # worker.py 每个进程的工作线程数
+    "lease_seconds": int(os.getenv("JOB_LEASE_SECONDS", "120")),
+    "heartbeat_interval": 30,
+    "poll_interval": 2.0,
+    "reap_interval": 60,
+    "max_attempts": int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+    "progress_flush_interval": float(os.getenv("JOB_PROGRESS_FLUSH_INTERVAL", "1.0")),  # 任务进度合并写库的间隔（秒）
 }
 
 # Agent 角色定义
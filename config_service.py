@@ -0,0 +1,111 @@
+"""
+AI配置服务
+缓存数据库 config 表中的配置并按版本号失效：本进程保存配置时立即失效，
+其他进程（API多副本 / worker.py）每隔 VERSION_CHECK_INTERVAL 秒比对一次版本号，变化时才重新加载；
+对外只提供只读快照，一次请求（一个Agent）内看到的配置始终一致
+"""
+import time
+import threading
+from types import MappingProxyType
+from config import AI_CONFIG
+
+VERSION_KEY = "config_version"
+VERSION_CHECK_INTERVAL = 30  # 秒
+
+_lock = threading.Lock()
+_raw = None  # config 表全部键值（只读）
+_ai_config = None  # AI调用配置快照（只读）
+_version = None
+_checked_at = 0.0
+
+
+def _build_ai_config(raw: dict, version) -> MappingProxyType:
+    """数据库配置覆盖环境变量中的默认值"""
+    ai_config = dict(AI_CONFIG)
+    for key in ("api_key", "api_base", "model"):
+        if raw.get(key):
+            ai_config[key] = raw[key]
+    ai_config["version"] = version
+    return MappingProxyType(ai_config)
+
+
+def _load():
+    """重新加载全部配置（需持有锁）"""
+    global _raw, _ai_config, _version, _checked_at
+    import database as db
+    raw = db.get_all_config() or {}
+    _version = raw.get(VERSION_KEY)
+    _raw = MappingProxyType(raw)
+    _ai_config = _build_ai_config(raw, _version)
+    _checked_at = time.monotonic()
+
+
+def _is_fresh() -> bool:
+    """缓存已加载且未到版本检查时间（不需要访问数据库）"""
+    return _raw is not None and time.monotonic() - _checked_at < VERSION_CHECK_INTERVAL
+
+
+def _refresh():
+    """缓存为空时加载；超过检查间隔时只查版本号，变化了才整体重新加载"""
+    global _checked_at
+    if _is_fresh():
+        return
+    with _lock:
+        if _raw is None:
+            _load()
+            return
+        if time.monotonic() - _checked_at < VERSION_CHECK_INTERVAL:
+            return
+        import database as db
+        try:
+            remote_version = db.get_config(VERSION_KEY)
+        except Exception as e:
+            print(f"检查配置版本失败: {e}")
+            remote_version = _version
+        if remote_version != _version:
+            _load()
+        else:
+            _checked_at = time.monotonic()
+
+
+def get_ai_config() -> MappingProxyType:
+    """当前AI调用配置的只读快照（api_key / api_base / model / temperature / max_tokens / version）"""
+    _refresh()
+    return _ai_config
+
+
+def get_all() -> MappingProxyType:
+    """config 表全部键值的只读快照"""
+    _refresh()
+    return _raw
+
+
+async def aget_ai_config() -> MappingProxyType:
+    """get_ai_config 的异步版本：需要访问数据库时放到数据库线程池，不阻塞事件循环"""
+    if not _is_fresh():
+        import async_db
+        await async_db.run(_refresh)
+    return _ai_config
+
+
+async def aget_all() -> MappingProxyType:
+    """get_all 的异步版本"""
+    if not _is_fresh():
+        import async_db
+        await async_db.run(_refresh)
+    return _raw
+
+
+def save(values: dict):
+    """写入配置并递增版本号，本进程立即失效，其他进程在下次版本检查时重新加载"""
+    import database as db
+    for key, value in values.items():
+        db.set_config(key, value)
+    db.set_config(VERSION_KEY, str(time.time_ns()))
+    invalidate()
+
+
+def invalidate():
+    global _raw
+    with _lock:
+        _raw = None
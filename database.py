@@ -4,15 +4,51 @@
 import pymysql
 from pymysql.cursors import DictCursor
 import json
+import base64
+import binascii
+import math
 import os
 import threading
-import queue
+import time
 from datetime import datetime
+from collections import Counter, deque
 from contextlib import contextmanager
 from dotenv import load_dotenv
+import retrieval
+from config import SEARCH_CONFIG
 
 load_dotenv()
 
+class QueryStats:
+    """SQL执行次数统计（供 /api/metrics 与 benchmarks 使用）"""
+    
+    def __init__(self):
+        self.queries = 0
+        self._lock = threading.Lock()
+    
+    def record(self):
+        with self._lock:
+            self.queries += 1
+    
+    def reset(self):
+        with self._lock:
+            self.queries = 0
+
+query_stats = QueryStats()
+
+class CountingCursor(DictCursor):
+    """每次 execute 计一次数据库往返（executemany 按实际发送的语句数计）"""
+    
+    def execute(self, query, args=None):
+        query_stats.record()
+        return super().execute(query, args)
+
+def get_query_stats():
+    return {"queries": query_stats.queries}
+
+def reset_query_stats():
+    query_stats.reset()
+
 # MySQL 配置
 DB_CONFIG = {
     'host': os.getenv('MYSQL_HOST', 'localhost'),
@@ -21,280 +57,267 @@ DB_CONFIG = {
     'password': os.getenv('MYSQL_PASSWORD', ''),
     'database': os.getenv('MYSQL_DATABASE', 'learnflow'),
     'charset': 'utf8mb4',
-    'cursorclass': DictCursor
+    'cursorclass': CountingCursor
 }
 
-# ========== 简易连接池实现 ==========
+# 连接池配置
+DB_POOL_CONFIG = {
+    'pool_size': int(os.getenv('MYSQL_POOL_SIZE', 5)),  # 常驻空闲连接上限
+    'max_overflow': int(os.getenv('MYSQL_POOL_MAX_OVERFLOW', 10)),  # 高峰期可额外创建的连接数
+    'timeout': float(os.getenv('MYSQL_POOL_TIMEOUT', 30)),  # 等待连接的最长秒数
+    'max_lifetime': int(os.getenv('MYSQL_POOL_MAX_LIFETIME', 1800)),  # 连接最长存活秒数（应小于 MySQL wait_timeout）
+    'health_check_idle': int(os.getenv('MYSQL_POOL_HEALTH_CHECK_IDLE', 30)),  # 空闲超过该秒数的连接取出时先 ping
+}
+
+# ========== 连接池实现 ==========
+class PoolTimeout(Exception):
+    """等待数据库连接超时"""
+
+class _Waiter:
+    """排队等待连接的调用方；entry 为移交的空闲连接 (conn, created_at, idle_since) 或 _CREATE（允许新建）"""
+    __slots__ = ("event", "entry")
+    
+    def __init__(self):
+        self.event = threading.Event()
+        self.entry = None
+
+_CREATE = object()
+
 class ConnectionPool:
-    """简易MySQL连接池"""
+    """
+    MySQL连接池
+    - 连接按需创建，不在启动时预建
+    - 只对空闲超过 health_check_idle 秒的连接 ping，正常请求不增加额外往返
+    - 存活超过 max_lifetime 的连接归还或取出时关闭重建
+    - 连接用尽时按到达顺序排队，归还的连接直接移交给最早的等待者
+    """
     
-    def __init__(self, config: dict, pool_size: int = 5, max_overflow: int = 10):
+    def __init__(self, config: dict, pool_size: int = 5, max_overflow: int = 10, timeout: float = 30,
+                 max_lifetime: int = 1800, health_check_idle: int = 30):
         self.config = config
         self.pool_size = pool_size
-        self.max_overflow = max_overflow
-        self._pool = queue.Queue(maxsize=pool_size)
-        self._current_size = 0
+        self.max_size = pool_size + max_overflow
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_idle = health_check_idle
+        self._idle = []  # [(conn, created_at, idle_since)]，后进先出，让多余连接自然老化
+        self._in_use = {}  # id(conn) -> created_at
+        self._waiters = deque()
+        self._size = 0  # 已创建（空闲 + 使用中 + 正在创建）的连接数
         self._lock = threading.Lock()
-        
-        # 预创建连接
-        for _ in range(pool_size):
-            try:
-                conn = self._create_connection()
-                self._pool.put(conn, block=False)
-                self._current_size += 1
-            except:
-                break
+        self._stats = {"checkouts": 0, "created": 0, "recycled": 0, "health_check_failures": 0,
+                       "timeouts": 0, "waits": 0, "wait_time": 0.0, "max_wait_time": 0.0}
     
     def _create_connection(self):
         """创建新连接"""
         return pymysql.connect(**self.config)
     
-    def _validate_connection(self, conn):
-        """验证连接是否有效"""
+    def _close(self, conn):
         try:
-            conn.ping(reconnect=True)
-            return True
-        except:
+            conn.close()
+        except Exception:
+            pass
+    
+    def _hand_off(self, entry) -> bool:
+        """把空闲连接或新建名额交给最早的等待者（需持有锁）"""
+        if not self._waiters:
             return False
+        waiter = self._waiters.popleft()
+        waiter.entry = entry
+        waiter.event.set()
+        return True
     
-    def get_connection(self):
-        """获取连接"""
-        # 尝试从池中获取
-        try:
-            conn = self._pool.get(block=False)
-            if self._validate_connection(conn):
-                return conn
-            # 连接无效，创建新的
-            conn = self._create_connection()
-            return conn
-        except queue.Empty:
-            pass
-        
-        # 池为空，尝试创建新连接
+    def _discard(self):
+        """一个连接已关闭：释放名额，有人排队时转给等待者新建（需持有锁）"""
+        if not self._hand_off(_CREATE):
+            self._size -= 1
+    
+    def get_connection(self, timeout: float = None):
+        """获取连接，等待超过 timeout 秒抛出 PoolTimeout"""
+        timeout = self.timeout if timeout is None else timeout
+        waiter = None
         with self._lock:
-            if self._current_size < self.pool_size + self.max_overflow:
-                self._current_size += 1
-                return self._create_connection()
+            entry = None
+            # 有人排队时新来的调用方不插队
+            if not self._waiters:
+                if self._idle:
+                    entry = self._idle.pop()
+                elif self._size < self.max_size:
+                    self._size += 1
+                    entry = _CREATE
+            if entry is None:
+                waiter = _Waiter()
+                self._waiters.append(waiter)
+        
+        if waiter is not None:
+            started = time.monotonic()
+            waiter.event.wait(timeout)
+            with self._lock:
+                waited = time.monotonic() - started
+                self._stats["waits"] += 1
+                self._stats["wait_time"] += waited
+                self._stats["max_wait_time"] = max(self._stats["max_wait_time"], waited)
+                if waiter.entry is None:
+                    self._waiters.remove(waiter)
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(f"等待数据库连接超时（{timeout}秒）")
+            entry = waiter.entry
         
-        # 等待连接释放
-        conn = self._pool.get(block=True, timeout=30)
-        if self._validate_connection(conn):
-            return conn
-        return self._create_connection()
-    
-    def release_connection(self, conn):
-        """释放连接回池"""
         try:
-            if self._validate_connection(conn):
-                self._pool.put(conn, block=False)
-            else:
+            conn, created_at = self._checkout(entry)
+        except BaseException:
+            with self._lock:
+                self._discard()
+            raise
+        with self._lock:
+            self._in_use[id(conn)] = created_at
+            self._stats["checkouts"] += 1
+        return conn
+    
+    def _checkout(self, entry):
+        """在锁外完成新建 / 过期回收 / 健康检查，返回 (conn, created_at)"""
+        now = time.monotonic()
+        if entry is not _CREATE:
+            conn, created_at, idle_since = entry
+            if now - created_at >= self.max_lifetime:
+                self._close(conn)
                 with self._lock:
-                    self._current_size -= 1
+                    self._stats["recycled"] += 1
+            elif now - idle_since < self.health_check_idle:
+                return conn, created_at
+            else:
                 try:
-                    conn.close()
-                except:
-                    pass
-        except queue.Full:
-            # 池满，直接关闭
-            with self._lock:
-                self._current_size -= 1
-            try:
-                conn.close()
-            except:
-                pass
+                    conn.ping(reconnect=False)
+                    return conn, created_at
+                except Exception:
+                    self._close(conn)
+                    with self._lock:
+                        self._stats["health_check_failures"] += 1
+        conn = self._create_connection()
+        with self._lock:
+            self._stats["created"] += 1
+        return conn, time.monotonic()
+    
+    def release_connection(self, conn, broken: bool = False):
+        """归还连接；broken 表示连接已不可用（网络错误、回滚失败等），直接关闭"""
+        now = time.monotonic()
+        with self._lock:
+            created_at = self._in_use.pop(id(conn), None)
+            if created_at is None:
+                return  # 不是本池借出的连接，或已归还过
+            expired = now - created_at >= self.max_lifetime
+            if not broken and not expired and conn.open:
+                entry = (conn, created_at, now)
+                if self._hand_off(entry):
+                    return
+                if len(self._idle) < self.pool_size:
+                    self._idle.append(entry)
+                    return
+            elif expired:
+                self._stats["recycled"] += 1
+            # 关闭：已损坏 / 已过期 / 空闲连接已满（高峰期多建的连接）
+            self._discard()
+        self._close(conn)
+    
+    def stats(self) -> dict:
+        with self._lock:
+            waits = self._stats["waits"]
+            return {
+                "size": self._size, "in_use": len(self._in_use), "idle": len(self._idle),
+                "waiting": len(self._waiters), "max_size": self.max_size,
+                **{k: v for k, v in self._stats.items() if k not in ("wait_time", "max_wait_time")},
+                "avg_wait_ms": round(self._stats["wait_time"] / waits * 1000, 2) if waits else 0.0,
+                "max_wait_ms": round(self._stats["max_wait_time"] * 1000, 2),
+            }
     
     def close_all(self):
-        """关闭所有连接"""
-        while not self._pool.empty():
-            try:
-                conn = self._pool.get(block=False)
-                conn.close()
-            except:
-                pass
-        self._current_size = 0
+        """关闭所有空闲连接（使用中的连接归还时再关闭）"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for conn, _, _ in idle:
+            self._close(conn)
 
 # 全局连接池
 _connection_pool = None
+_connection_pool_lock = threading.Lock()
 
 def get_pool():
-    """获取全局连接池"""
+    """获取全局连接池（首次使用时创建，不预建连接）"""
     global _connection_pool
     if _connection_pool is None:
-        _connection_pool = ConnectionPool(DB_CONFIG, pool_size=5, max_overflow=10)
+        with _connection_pool_lock:
+            if _connection_pool is None:
+                _connection_pool = ConnectionPool(DB_CONFIG, **DB_POOL_CONFIG)
     return _connection_pool
 
+def get_pool_stats():
+    return get_pool().stats()
+
 def get_db():
-    """获取数据库连接（从连接池）"""
+    """获取数据库连接（从连接池，用完需调用 get_pool().release_connection 归还）"""
     return get_pool().get_connection()
 
+# 连接已断开时的错误，归还时不再放回池中
+CONNECTION_ERRORS = (pymysql.err.OperationalError, pymysql.err.InterfaceError)
+
 @contextmanager
 def get_db_cursor():
-    """数据库游标上下文管理器（使用连接池）"""
+    """数据库游标上下文管理器（使用连接池），正常退出提交，异常回滚"""
     pool = get_pool()
     conn = pool.get_connection()
+    broken = False
     try:
-        cursor = conn.cursor()
-        yield cursor
+        with conn.cursor() as cursor:
+            yield cursor
         conn.commit()
-    except Exception as e:
-        conn.rollback()
-        raise e
+    except BaseException as e:
+        broken = isinstance(e, CONNECTION_ERRORS)
+        try:
+            conn.rollback()
+        except Exception:
+            broken = True
+        raise
     finally:
-        cursor.close()
-        pool.release_connection(conn)
+        pool.release_connection(conn, broken)
+
+# ========== 列表分页 ==========
+# 列表接口可选的字段（不含正文），id 与 created_at 总会返回（用于翻页游标）
+ARTICLE_LIST_FIELDS = ('id', 'title', 'topic', 'type', 'document_id', 'chapter_id', 'word_count', 'created_at', 'updated_at')
+DOCUMENT_LIST_FIELDS = ('id', 'title', 'description', 'topic', 'chapters', 'word_count', 'created_at')
 
-def init_db():
-    """初始化数据库表"""
-    # 先创建数据库（如果不存在）
+def _encode_cursor(row):
+    raw = f"{row['created_at'].isoformat()}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def _decode_cursor(cursor_token):
+    """解析翻页游标，返回 (created_at, id)；格式不对时抛出 ValueError"""
     try:
-        conn = pymysql.connect(
-            host=DB_CONFIG['host'],
-            port=DB_CONFIG['port'],
-            user=DB_CONFIG['user'],
-            password=DB_CONFIG['password'],
-            charset='utf8mb4'
-        )
-        cursor = conn.cursor()
-        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {DB_CONFIG['database']} CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci")
-        conn.commit()
-        cursor.close()
-        conn.close()
-    except Exception as e:
-        print(f"创建数据库失败: {e}")
-    
-    with get_db_cursor() as cursor:
-        # 用户表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                username VARCHAR(100) UNIQUE NOT NULL,
-                email VARCHAR(200),
-                password VARCHAR(255) NOT NULL,
-                token VARCHAR(255),
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
-        ''')
-        
-        # 文章表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS articles (
-                id VARCHAR(50) PRIMARY KEY,
-                title VARCHAR(500) NOT NULL,
-                content LONGTEXT,
-                topic VARCHAR(500),
-                type VARCHAR(50) DEFAULT 'article',
-                document_id VARCHAR(50),
-                chapter_id INT,
-                user VARCHAR(100) NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME,
-                INDEX idx_user (user),
-                INDEX idx_document (document_id),
-                INDEX idx_type (type)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
-        ''')
-        
-        # 文档表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS documents (
-                id VARCHAR(50) PRIMARY KEY,
-                title VARCHAR(500) NOT NULL,
-                description TEXT,
-                topic VARCHAR(500),
-                chapters LONGTEXT,
-                user VARCHAR(100) NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                INDEX idx_user (user)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
-        ''')
-        
-        # 大纲表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS outlines (
-                id VARCHAR(50) PRIMARY KEY,
-                title VARCHAR(500),
-                description TEXT,
-                topic VARCHAR(500),
-                chapters LONGTEXT,
-                links LONGTEXT,
-                enable_search TINYINT DEFAULT 0,
-                feedback TEXT,
-                user VARCHAR(100) NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                INDEX idx_user (user)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
-        ''')
-        
-        # 任务表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS tasks (
-                id VARCHAR(50) PRIMARY KEY,
-                type VARCHAR(50),
-                status VARCHAR(50),
-                topic VARCHAR(500),
-                user VARCHAR(100) NOT NULL,
-                current_step TEXT,
-                completed INT DEFAULT 0,
-                total INT DEFAULT 0,
-                error TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                INDEX idx_user (user),
-                INDEX idx_status (status)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
-        ''')
-        
-        # 笔记表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS notes (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                article_id VARCHAR(50) NOT NULL,
-                question TEXT,
-                answer LONGTEXT,
-                user VARCHAR(100) NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                INDEX idx_article (article_id),
-                INDEX idx_user (user)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
-        ''')
-        
-        # 配置表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS config (
-                `key` VARCHAR(100) PRIMARY KEY,
-                value TEXT
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
-        ''')
-        
-        # 面试题表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS interview_questions (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                article_id VARCHAR(50) NOT NULL,
-                question TEXT NOT NULL,
-                reference_answer LONGTEXT,
-                user_answer LONGTEXT,
-                score INT,
-                feedback LONGTEXT,
-                user VARCHAR(100) NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                answered_at DATETIME,
-                INDEX idx_article (article_id),
-                INDEX idx_user (user)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
-        ''')
-        
-        # 对话记录表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS conversations (
-                id VARCHAR(50) PRIMARY KEY,
-                title VARCHAR(500) DEFAULT '新对话',
-                messages LONGTEXT,
-                user VARCHAR(100) NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                INDEX idx_user (user)
-            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
-        ''')
+        created_at, _, row_id = base64.urlsafe_b64decode(cursor_token.encode('ascii')).decode('utf-8').partition('|')
+        return datetime.fromisoformat(created_at), row_id
+    except (UnicodeError, binascii.Error) as e:
+        raise ValueError(f'无效的翻页游标: {e}')
+
+def _list_page(cursor, table, columns, where, args, limit, cursor_token):
+    """按 (created_at, id) 倒序的键集分页，返回 (本页数据, 下一页游标)；limit 为 None 时返回全部"""
+    if limit is None:
+        cursor.execute(f'SELECT {", ".join(columns)} FROM {table} WHERE {where} ORDER BY created_at DESC, id DESC', args)
+        return cursor.fetchall(), None
+    if cursor_token:
+        created_at, row_id = _decode_cursor(cursor_token)
+        where += ' AND (created_at < %s OR (created_at = %s AND id < %s))'
+        args = (*args, created_at, created_at, row_id)
+    cursor.execute(
+        f'SELECT {", ".join(columns)} FROM {table} WHERE {where} ORDER BY created_at DESC, id DESC LIMIT %s',
+        (*args, limit + 1)
+    )
+    rows = cursor.fetchall()
+    next_cursor = _encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def _list_columns(fields, allowed):
+    fields = [f for f in (fields or allowed) if f in allowed]
+    return list(dict.fromkeys(['id', 'created_at', *fields]))
 
 # ========== 用户操作 ==========
 def get_user(username):
@@ -303,8 +326,9 @@ def get_user(username):
         return cursor.fetchone()
 
 def get_user_by_token(token):
+    """按登录令牌查用户（不返回密码字段，结果会被缓存在进程内）"""
     with get_db_cursor() as cursor:
-        cursor.execute('SELECT * FROM users WHERE token = %s', (token,))
+        cursor.execute('SELECT id, username, email, created_at FROM users WHERE token = %s', (token,))
         return cursor.fetchone()
 
 def create_user(username, email, password):
@@ -319,13 +343,24 @@ def update_user_token(username, token):
         cursor.execute('UPDATE users SET token = %s WHERE username = %s', (token, username))
 
 # ========== 文章操作 ==========
-def get_articles(user, include_chapters=False):
-    with get_db_cursor() as cursor:
-        if include_chapters:
-            cursor.execute('SELECT * FROM articles WHERE user = %s ORDER BY created_at DESC', (user,))
-        else:
-            cursor.execute('SELECT * FROM articles WHERE user = %s AND type != %s ORDER BY created_at DESC', (user, 'chapter'))
-        return cursor.fetchall()
+def list_articles(user, limit=50, cursor_token=None, fields=None, include_chapters=False, with_content=False):
+    """
+    文章列表（默认不含正文），按创建时间倒序键集分页
+
+    Returns:
+        (文章列表, 下一页游标)，没有更多数据时游标为 None
+    """
+    columns = [
+        'COALESCE(word_count, CHAR_LENGTH(content)) AS word_count' if c == 'word_count' else c
+        for c in _list_columns(fields, ARTICLE_LIST_FIELDS)
+    ]
+    if with_content:
+        columns.append('content')
+    where, args = 'user = %s', (user,)
+    if not include_chapters:
+        where, args = where + ' AND type != %s', (user, 'chapter')
+    with get_db_cursor() as cursor:
+        return _list_page(cursor, 'articles', columns, where, args, limit, cursor_token)
 
 def get_article(article_id):
     with get_db_cursor() as cursor:
@@ -334,66 +369,311 @@ def get_article(article_id):
 
 def create_article(article_data):
     with get_db_cursor() as cursor:
-        cursor.execute('''
-            INSERT INTO articles (id, title, content, topic, type, document_id, chapter_id, user, created_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ''', (
-            article_data['id'], article_data['title'], article_data.get('content', ''),
-            article_data.get('topic', ''), article_data.get('type', 'article'),
-            article_data.get('document_id'), article_data.get('chapter_id'),
-            article_data['user'], article_data.get('created_at', datetime.now())
-        ))
+        _insert_articles(cursor, [article_data])
+
+def _insert_articles(cursor, articles):
+    """在调用方的事务内批量写入文章（多行 INSERT）并建立检索索引"""
+    now = datetime.now()
+    cursor.executemany('''
+        INSERT INTO articles (id, title, content, topic, type, document_id, chapter_id, word_count, user, created_at)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+    ''', [(
+        a['id'], a['title'], a.get('content', ''), a.get('topic', ''), a.get('type', 'article'),
+        a.get('document_id'), a.get('chapter_id'), retrieval.count_words(a.get('content', '')),
+        a['user'], a.get('created_at', now)
+    ) for a in articles])
+    _index_articles(cursor, articles, replace=False)
 
 def update_article(article_id, title, content):
     with get_db_cursor() as cursor:
         cursor.execute(
-            'UPDATE articles SET title = %s, content = %s, updated_at = %s WHERE id = %s',
-            (title, content, datetime.now(), article_id)
+            'UPDATE articles SET title = %s, content = %s, word_count = %s, updated_at = %s WHERE id = %s',
+            (title, content, retrieval.count_words(content), datetime.now(), article_id)
         )
+        cursor.execute('SELECT user FROM articles WHERE id = %s', (article_id,))
+        row = cursor.fetchone()
+        if row:
+            _index_articles(cursor, [{'id': article_id, 'user': row['user'], 'title': title, 'content': content}])
 
-def delete_article(article_id):
-    with get_db_cursor() as cursor:
-        cursor.execute('DELETE FROM articles WHERE id = %s', (article_id,))
+def _in_clause(values):
+    return ', '.join(['%s'] * len(values))
 
-def delete_articles_by_document(document_id):
-    with get_db_cursor() as cursor:
-        cursor.execute('DELETE FROM articles WHERE document_id = %s', (document_id,))
+def _delete_index(cursor, where, args):
+    """删除文章对应的检索块与倒排索引，where 为 articles 表（别名 a）的过滤条件"""
+    for table in ('article_chunks', 'search_postings', 'search_docs'):
+        cursor.execute(f'DELETE t FROM {table} t JOIN articles a ON a.id = t.article_id WHERE {where}', args)
 
-# ========== 文档操作 ==========
-def get_documents(user):
+def delete_article(article_id):
+    delete_articles([article_id])
+
+def delete_articles(article_ids):
+    """
+    在一个事务内批量删除文章及其索引
+
+    章节文章被文档引用，只能随文档一起删除（delete_documents）；ids 中包含章节时抛出 ValueError，不删除任何文章
+    """
+    if not article_ids:
+        return
+    ids = list(article_ids)
+    with get_db_cursor() as cursor:
+        cursor.execute(f"SELECT id FROM articles WHERE id IN ({_in_clause(ids)}) AND type = 'chapter'", ids)
+        chapters = [row['id'] for row in cursor.fetchall()]
+        if chapters:
+            raise ValueError(f"章节属于学习文档，请删除所在文档: {', '.join(chapters)}")
+        _delete_index(cursor, f'a.id IN ({_in_clause(ids)})', ids)
+        cursor.execute(f'DELETE FROM articles WHERE id IN ({_in_clause(ids)})', ids)
+
+# ========== 文章检索 ==========
+def _index_articles(cursor, articles, replace=True):
+    """
+    重建文章的检索块与倒排索引（与文章写入在同一事务内，多篇文章合并为批量语句）
+
+    Args:
+        articles: 至少包含 id、user、title、content 的文章列表
+        replace: 是否先删除旧索引（新插入的文章不需要）
+    """
+    if replace:
+        ids = [a['id'] for a in articles]
+        cursor.execute(f'DELETE FROM article_chunks WHERE article_id IN ({_in_clause(ids)})', ids)
+        cursor.execute(f'DELETE FROM search_postings WHERE article_id IN ({_in_clause(ids)})', ids)
+    chunk_rows, posting_rows, doc_rows = [], [], []
+    for a in articles:
+        content = a.get('content') or ''
+        chunk_rows.extend(
+            (a['id'], seq, c['heading'][:500], c['content']) for seq, c in enumerate(retrieval.chunk_text(content))
+        )
+        counts, length = retrieval.document_terms(a['title'], content)
+        posting_rows.extend((a['user'], term, a['id'], tf) for term, tf in counts.items())
+        doc_rows.append((a['id'], a['user'], length))
+    if chunk_rows:
+        cursor.executemany(
+            'INSERT INTO article_chunks (article_id, seq, heading, content) VALUES (%s, %s, %s, %s)', chunk_rows
+        )
+    if posting_rows:
+        cursor.executemany(
+            'INSERT INTO search_postings (user, term, article_id, tf) VALUES (%s, %s, %s, %s)', posting_rows
+        )
+    cursor.executemany('REPLACE INTO search_docs (article_id, user, length) VALUES (%s, %s, %s)', doc_rows)
+
+def index_article(article):
+    """为旧文章补建检索索引"""
+    with get_db_cursor() as cursor:
+        _index_articles(cursor, [article])
+
+def _backfill_search(cursor, user):
+    """为尚未建立倒排索引的旧文章补建索引（每次最多 backfill_batch 篇）"""
+    cursor.execute('''
+        SELECT a.id, a.user, a.title, a.content FROM articles a
+        LEFT JOIN search_docs s ON s.article_id = a.id
+        WHERE a.user = %s AND s.article_id IS NULL LIMIT %s
+    ''', (user, SEARCH_CONFIG['backfill_batch']))
+    rows = cursor.fetchall()
+    if rows:
+        _index_articles(cursor, rows)
+
+def search_articles(user, query, limit=20, offset=0, article_type=None):
+    """
+    跨文章全文搜索（BM25 排序）
+
+    Returns:
+        (结果列表, 命中总数)，结果含标题高亮 title_highlight 与正文摘要 snippet
+    """
+    terms = retrieval.query_terms(query)
+    if not terms:
+        return [], 0
+    with get_db_cursor() as cursor:
+        _backfill_search(cursor, user)
+        cursor.execute('SELECT COUNT(*) AS n, AVG(length) AS avg_length FROM search_docs WHERE user = %s', (user,))
+        stats = cursor.fetchone()
+        cursor.execute(
+            f'SELECT p.term, p.article_id, p.tf, d.length FROM search_postings p '
+            f'JOIN search_docs d ON d.article_id = p.article_id '
+            f'WHERE p.user = %s AND p.term IN ({_in_clause(terms)})',
+            (user, *terms)
+        )
+        postings = cursor.fetchall()
+        
+        df = Counter(p['term'] for p in postings)
+        matched = Counter(p['article_id'] for p in postings)
+        scores = {}
+        avg_length = float(stats['avg_length'] or 1)
+        for p in postings:
+            weight = retrieval.inverse_document_frequency(df[p['term']], stats['n'])
+            scores[p['article_id']] = scores.get(p['article_id'], 0.0) + \
+                weight * retrieval.term_weight(p['tf'], p['length'], avg_length)
+        
+        # 中文按两字切分，只命中个别词项的文章多半不相关
+        required = max(1, math.ceil(len(terms) * SEARCH_CONFIG['min_match']))
+        candidates = [aid for aid, count in matched.items() if count >= required]
+        if article_type and candidates:
+            cursor.execute(
+                f'SELECT id FROM articles WHERE type = %s AND id IN ({_in_clause(candidates)})',
+                (article_type, *candidates)
+            )
+            candidates = [row['id'] for row in cursor.fetchall()]
+        candidates.sort(key=lambda aid: (-scores[aid], aid))
+        page = candidates[offset:offset + limit]
+        if not page:
+            return [], len(candidates)
+        
+        cursor.execute(
+            f'SELECT id, title, topic, type, document_id, chapter_id, created_at FROM articles WHERE id IN ({_in_clause(page)})',
+            page
+        )
+        articles = {row['id']: row for row in cursor.fetchall()}
+        # 摘要取自命中最多的检索块，不读取整篇正文
+        cursor.execute(
+            f'SELECT article_id, content FROM article_chunks WHERE article_id IN ({_in_clause(page)})',
+            page
+        )
+        best_chunks = {}
+        for chunk in cursor.fetchall():
+            text = chunk['content'].lower()
+            hits = sum(text.count(term) for term in terms)
+            if hits > best_chunks.get(chunk['article_id'], (-1, ''))[0]:
+                best_chunks[chunk['article_id']] = (hits, chunk['content'])
+    
+    results = []
+    for aid in page:
+        article = articles.get(aid)
+        if not article:
+            continue
+        results.append({
+            **article,
+            'score': round(scores[aid], 4),
+            'title_highlight': retrieval.highlight(article['title'], terms),
+            'snippet': retrieval.snippet(best_chunks.get(aid, (0, ''))[1], terms),
+        })
+    return results, len(candidates)
+
+def search_article_chunks(article_id, query, top_k=None):
+    """返回与问题最相关的检索块（按原文顺序）；文章尚未建立索引时返回空列表"""
     with get_db_cursor() as cursor:
-        cursor.execute('SELECT * FROM documents WHERE user = %s ORDER BY created_at DESC', (user,))
-        docs = []
-        for row in cursor.fetchall():
-            doc = dict(row)
-            doc['chapters'] = json.loads(doc['chapters']) if doc['chapters'] else []
-            docs.append(doc)
-        return docs
+        cursor.execute(
+            'SELECT seq, heading, content FROM article_chunks WHERE article_id = %s ORDER BY seq',
+            (article_id,)
+        )
+        chunks = cursor.fetchall()
+    return retrieval.bm25_rank(query, chunks, top_k)
 
-def get_document(doc_id):
+# ========== 文档操作 ==========
+def list_documents(user, limit=50, cursor_token=None, fields=None):
+    """
+    文档列表，按创建时间倒序键集分页；chapters 为章节引用（不含正文）
+
+    Returns:
+        (文档列表, 下一页游标)
+    """
+    columns = _list_columns(fields, DOCUMENT_LIST_FIELDS)
+    with get_db_cursor() as cursor:
+        docs, next_cursor = _list_page(cursor, 'documents', columns, 'user = %s', (user,), limit, cursor_token)
+    for doc in docs:
+        if 'chapters' in doc:
+            chapters = json.loads(doc['chapters']) if doc['chapters'] else []
+            # 迁移未完成的旧文档仍内嵌正文，列表中去掉
+            doc['chapters'] = [{k: v for k, v in ch.items() if k != 'content'} for ch in chapters]
+    return docs, next_cursor
+
+def chapter_article_id(doc_id, chapter_id):
+    """章节正文所在的 articles 行ID"""
+    return f"{doc_id}-{chapter_id}"
+
+def _chapter_refs(doc_id, chapters):
+    """文档只保存有序的章节引用（标题、状态、文章ID），正文保存在 type=chapter 的 articles 行"""
+    return [
+        {**{k: v for k, v in ch.items() if k != 'content'}, 'article_id': chapter_article_id(doc_id, ch['id'])}
+        for ch in chapters
+    ]
+
+def get_document(doc_id, include_content=True):
+    """获取文档；include_content 时从章节文章行组装正文（一次查询），否则只返回章节引用"""
     with get_db_cursor() as cursor:
         cursor.execute('SELECT * FROM documents WHERE id = %s', (doc_id,))
         row = cursor.fetchone()
-        if row:
-            doc = dict(row)
-            doc['chapters'] = json.loads(doc['chapters']) if doc['chapters'] else []
-            return doc
-        return None
-
-def create_document(doc_data):
+        if not row:
+            return None
+        doc = dict(row)
+        doc['chapters'] = json.loads(doc['chapters']) if doc['chapters'] else []
+        if include_content and any('content' not in ch for ch in doc['chapters']):
+            cursor.execute('SELECT chapter_id, content FROM articles WHERE document_id = %s', (doc_id,))
+            contents = {r['chapter_id']: r['content'] for r in cursor.fetchall()}
+            for ch in doc['chapters']:
+                if 'content' not in ch:
+                    ch['content'] = contents.get(ch['id']) or ''
+        return doc
+
+def _chapter_articles(doc_data):
+    """文档各章节对应的 type=chapter 文章行"""
+    return [{
+        'id': chapter_article_id(doc_data['id'], ch['id']), 'title': ch.get('title', ''),
+        'content': ch.get('content', ''), 'topic': doc_data.get('topic', ''), 'type': 'chapter',
+        'document_id': doc_data['id'], 'chapter_id': ch['id'], 'user': doc_data['user'],
+        'created_at': doc_data.get('created_at', datetime.now())
+    } for ch in doc_data.get('chapters', [])]
+
+def save_document(doc_data, task_id=None, **task_fields):
+    """
+    在一个事务内保存生成的文档：文档行、全部章节文章（多行 INSERT）及其检索索引，
+    并清理任务的章节检查点、更新任务状态（传入 task_id 时）
+    """
+    chapters = doc_data.get('chapters', [])
     with get_db_cursor() as cursor:
         cursor.execute('''
-            INSERT INTO documents (id, title, description, topic, chapters, user, created_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            INSERT INTO documents (id, title, description, topic, chapters, word_count, user, created_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
         ''', (
             doc_data['id'], doc_data['title'], doc_data.get('description', ''),
-            doc_data.get('topic', ''), json.dumps(doc_data.get('chapters', []), ensure_ascii=False),
+            doc_data.get('topic', ''), json.dumps(_chapter_refs(doc_data['id'], chapters), ensure_ascii=False),
+            sum(retrieval.count_words(ch.get('content', '')) for ch in chapters),
             doc_data['user'], doc_data.get('created_at', datetime.now())
         ))
-
-def delete_document(doc_id):
-    with get_db_cursor() as cursor:
-        cursor.execute('DELETE FROM documents WHERE id = %s', (doc_id,))
+        if chapters:
+            _insert_articles(cursor, _chapter_articles(doc_data))
+        if task_id:
+            cursor.execute('DELETE FROM task_chapters WHERE task_id = %s', (task_id,))
+            _update_task(cursor, task_id, task_fields)
+
+def migrate_document_chapters(batch_size=50):
+    """
+    把旧版文档 chapters 中内嵌的章节正文迁移为引用：
+    缺少对应章节文章行时先补建，再把 chapters 改写为引用列表（可重复执行）
+
+    Returns:
+        迁移的文档数
+    """
+    migrated = 0
+    while True:
+        with get_db_cursor() as cursor:
+            cursor.execute(
+                'SELECT id, topic, chapters, user, created_at FROM documents WHERE chapters LIKE %s LIMIT %s',
+                ('%"content":%', batch_size)
+            )
+            rows = cursor.fetchall()
+            for doc in rows:
+                chapters = json.loads(doc['chapters']) if doc['chapters'] else []
+                cursor.execute('SELECT chapter_id FROM articles WHERE document_id = %s', (doc['id'],))
+                existing = {r['chapter_id'] for r in cursor.fetchall()}
+                missing = [a for a in _chapter_articles({**doc, 'chapters': chapters}) if a['chapter_id'] not in existing]
+                if missing:
+                    _insert_articles(cursor, missing)
+                cursor.execute(
+                    'UPDATE documents SET chapters = %s, word_count = %s WHERE id = %s',
+                    (json.dumps(_chapter_refs(doc['id'], chapters), ensure_ascii=False),
+                     sum(retrieval.count_words(ch.get('content', '')) for ch in chapters), doc['id'])
+                )
+        migrated += len(rows)
+        if len(rows) < batch_size:
+            return migrated
+
+def delete_documents(doc_ids):
+    """在一个事务内批量删除文档及其章节文章、索引"""
+    if not doc_ids:
+        return
+    ids = list(doc_ids)
+    with get_db_cursor() as cursor:
+        _delete_index(cursor, f'a.document_id IN ({_in_clause(ids)})', ids)
+        cursor.execute(f'DELETE FROM articles WHERE document_id IN ({_in_clause(ids)})', ids)
+        cursor.execute(f'DELETE FROM documents WHERE id IN ({_in_clause(ids)})', ids)
 
 # ========== 大纲操作 ==========
 def get_outline(outline_id):
@@ -430,37 +710,159 @@ def update_outline(outline_id, chapters=None, feedback=None):
             cursor.execute('UPDATE outlines SET feedback = %s WHERE id = %s', (feedback, outline_id))
 
 # ========== 任务操作 ==========
+# 对外返回的任务字段（payload 含大纲与上传文件路径、租约字段仅供任务队列内部使用）
+TASK_PUBLIC_FIELDS = ('id', 'type', 'status', 'topic', 'user', 'current_step', 'completed', 'total', 'error', 'created_at')
+TASK_PUBLIC_COLUMNS = ', '.join(TASK_PUBLIC_FIELDS)
+
 def get_tasks(user):
     with get_db_cursor() as cursor:
-        cursor.execute('SELECT * FROM tasks WHERE user = %s ORDER BY created_at DESC', (user,))
+        cursor.execute(f'SELECT {TASK_PUBLIC_COLUMNS} FROM tasks WHERE user = %s ORDER BY created_at DESC', (user,))
         return cursor.fetchall()
 
-def get_task(task_id):
+def get_task(task_id, include_partial=False):
+    """任务状态，include_partial 时带上生成中的增量内容快照 {part: 已生成的文本}"""
+    columns = f'{TASK_PUBLIC_COLUMNS}, partial' if include_partial else TASK_PUBLIC_COLUMNS
     with get_db_cursor() as cursor:
-        cursor.execute('SELECT * FROM tasks WHERE id = %s', (task_id,))
-        return cursor.fetchone()
+        cursor.execute(f'SELECT {columns} FROM tasks WHERE id = %s', (task_id,))
+        task = cursor.fetchone()
+    if task and include_partial:
+        task['partial'] = json.loads(task['partial']) if task['partial'] else {}
+    return task
+
+def get_task_progress(user, task_ids=()):
+    """用户未结束的任务以及指定任务的进度（供任务事件SSE轮询其他进程执行的任务）"""
+    where, args = "status IN ('pending', 'running')", [user]
+    if task_ids:
+        where = f'({where} OR id IN ({_in_clause(task_ids)}))'
+        args.extend(task_ids)
+    with get_db_cursor() as cursor:
+        cursor.execute(
+            f'SELECT id, type, topic, status, current_step, completed, total, error FROM tasks WHERE user = %s AND {where}',
+            args
+        )
+        return cursor.fetchall()
 
 def create_task(task_data):
+    payload = task_data.get('payload')
     with get_db_cursor() as cursor:
         cursor.execute('''
-            INSERT INTO tasks (id, type, status, topic, user, current_step, completed, total, created_at)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            INSERT INTO tasks (id, type, status, topic, user, current_step, completed, total, payload, created_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
         ''', (
             task_data['id'], task_data['type'], task_data.get('status', 'pending'),
             task_data.get('topic', ''), task_data['user'], task_data.get('current_step', ''),
             task_data.get('completed', 0), task_data.get('total', 0),
+            json.dumps(payload, ensure_ascii=False) if payload is not None else None,
             task_data.get('created_at', datetime.now())
         ))
 
-ALLOWED_TASK_FIELDS = {'status', 'current_step', 'completed', 'total', 'error'}
+ALLOWED_TASK_FIELDS = {'status', 'current_step', 'completed', 'total', 'error', 'partial'}
 
 def update_task(task_id, **kwargs):
-    """更新任务状态（防SQL注入）"""
+    """更新任务状态（防SQL注入），多个字段合并为一条 UPDATE"""
     with get_db_cursor() as cursor:
-        for key, value in kwargs.items():
-            if key not in ALLOWED_TASK_FIELDS:
-                continue
-            cursor.execute(f'UPDATE tasks SET {key} = %s WHERE id = %s', (value, task_id))
+        _update_task(cursor, task_id, kwargs)
+
+def _update_task(cursor, task_id, fields):
+    """在调用方的事务内用一条 UPDATE 更新任务的多个字段（忽略不允许的字段）"""
+    fields = {k: v for k, v in fields.items() if k in ALLOWED_TASK_FIELDS}
+    if fields:
+        assignments = ', '.join(f'{k} = %s' for k in fields)
+        cursor.execute(f'UPDATE tasks SET {assignments} WHERE id = %s', (*fields.values(), task_id))
+
+# ========== 任务队列 ==========
+# 可被领取的任务：待执行，或执行中但租约已过期（工作进程崩溃/重启）
+CLAIMABLE_TASK_CONDITION = '''
+    payload IS NOT NULL AND attempts < %s AND
+    (status = 'pending' OR (status = 'running' AND lease_expires < NOW()))
+'''
+
+def claim_task(worker_id, lease_seconds, max_attempts):
+    """领取一个任务并加租约（乐观并发：条件UPDATE成功才算领取到）"""
+    with get_db_cursor() as cursor:
+        cursor.execute(
+            f'SELECT id FROM tasks WHERE {CLAIMABLE_TASK_CONDITION} ORDER BY created_at LIMIT 5',
+            (max_attempts,)
+        )
+        candidates = [row['id'] for row in cursor.fetchall()]
+        for task_id in candidates:
+            cursor.execute(f'''
+                UPDATE tasks SET status = 'running', lease_owner = %s,
+                    lease_expires = DATE_ADD(NOW(), INTERVAL %s SECOND), attempts = attempts + 1
+                WHERE id = %s AND {CLAIMABLE_TASK_CONDITION}
+            ''', (worker_id, lease_seconds, task_id, max_attempts))
+            if cursor.rowcount:
+                cursor.execute('SELECT * FROM tasks WHERE id = %s', (task_id,))
+                task = cursor.fetchone()
+                task['payload'] = json.loads(task['payload']) if task['payload'] else {}
+                return task
+        return None
+
+def heartbeat_task(task_id, worker_id, lease_seconds):
+    """续约，返回 False 表示租约已被其他工作者接管"""
+    with get_db_cursor() as cursor:
+        cursor.execute(
+            'UPDATE tasks SET lease_expires = DATE_ADD(NOW(), INTERVAL %s SECOND) WHERE id = %s AND lease_owner = %s',
+            (lease_seconds, task_id, worker_id)
+        )
+        return cursor.rowcount > 0
+
+def release_task(task_id, worker_id):
+    """任务执行完成，释放租约"""
+    with get_db_cursor() as cursor:
+        cursor.execute(
+            'UPDATE tasks SET partial = NULL, lease_owner = NULL, lease_expires = NULL WHERE id = %s AND lease_owner = %s',
+            (task_id, worker_id)
+        )
+
+def fail_task(task_id, worker_id, error, retry):
+    """任务执行失败：可重试则放回队列，否则标记失败"""
+    with get_db_cursor() as cursor:
+        cursor.execute('''
+            UPDATE tasks SET status = %s, error = %s, partial = NULL, lease_owner = NULL, lease_expires = NULL
+            WHERE id = %s AND lease_owner = %s
+        ''', ('pending' if retry else 'failed', error, task_id, worker_id))
+
+def fail_exhausted_tasks(max_attempts):
+    """租约过期且已用完重试次数的任务标记为失败"""
+    with get_db_cursor() as cursor:
+        cursor.execute('''
+            UPDATE tasks SET status = 'failed', error = '任务多次中断，已放弃', partial = NULL,
+                lease_owner = NULL, lease_expires = NULL
+            WHERE status = 'running' AND lease_expires < NOW() AND attempts >= %s
+        ''', (max_attempts,))
+        return cursor.rowcount
+
+def requeue_task(task_id, current_step):
+    """失败的任务重新放回队列（续传），重置重试次数"""
+    with get_db_cursor() as cursor:
+        cursor.execute('''
+            UPDATE tasks SET status = 'pending', attempts = 0, error = NULL, current_step = %s,
+                partial = NULL, lease_owner = NULL, lease_expires = NULL
+            WHERE id = %s AND status = 'failed'
+        ''', (current_step, task_id))
+        return cursor.rowcount > 0
+
+# ========== 文档生成检查点 ==========
+def get_chapter_checkpoints(task_id):
+    with get_db_cursor() as cursor:
+        cursor.execute('SELECT * FROM task_chapters WHERE task_id = %s ORDER BY chapter_id', (task_id,))
+        return cursor.fetchall()
+
+def save_chapter_checkpoint(task_id, chapter, **task_fields):
+    """保存章节检查点，同一事务内更新任务字段（如完成数）"""
+    with get_db_cursor() as cursor:
+        cursor.execute('''
+            INSERT INTO task_chapters (task_id, chapter_id, title, content, status, updated_at)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE title = VALUES(title), content = VALUES(content),
+                status = VALUES(status), updated_at = VALUES(updated_at)
+        ''', (task_id, chapter['id'], chapter['title'], chapter['content'], chapter['status'], datetime.now()))
+        _update_task(cursor, task_id, task_fields)
+
+def delete_chapter_checkpoints(task_id):
+    with get_db_cursor() as cursor:
+        cursor.execute('DELETE FROM task_chapters WHERE task_id = %s', (task_id,))
 
 # ========== 笔记操作 ==========
 def get_notes(article_id, user):
@@ -539,6 +941,35 @@ def get_all_config():
         print(f"获取配置失败: {e}")
         return {}
 
+# ========== LLM响应缓存 ==========
+def get_llm_cache(key):
+    with get_db_cursor() as cursor:
+        cursor.execute('SELECT value FROM llm_cache WHERE cache_key = %s AND expires_at > NOW()', (key,))
+        row = cursor.fetchone()
+        return row['value'] if row else None
+
+def set_llm_cache(key, value, ttl):
+    with get_db_cursor() as cursor:
+        cursor.execute('''
+            INSERT INTO llm_cache (cache_key, value, expires_at) VALUES (%s, %s, DATE_ADD(NOW(), INTERVAL %s SECOND))
+            ON DUPLICATE KEY UPDATE value = VALUES(value), expires_at = VALUES(expires_at)
+        ''', (key, value, ttl))
+
+def trim_llm_cache(max_entries):
+    """删除过期条目及超出上限的最旧条目，返回删除数"""
+    with get_db_cursor() as cursor:
+        deleted = cursor.execute('DELETE FROM llm_cache WHERE expires_at <= NOW()')
+        cursor.execute('SELECT COUNT(*) AS cnt FROM llm_cache')
+        overflow = cursor.fetchone()['cnt'] - max_entries
+        if overflow > 0:
+            deleted += cursor.execute('DELETE FROM llm_cache ORDER BY created_at LIMIT %s', (overflow,))
+        return deleted
+
+def count_llm_cache():
+    with get_db_cursor() as cursor:
+        cursor.execute('SELECT COUNT(*) AS cnt FROM llm_cache')
+        return cursor.fetchone()['cnt']
+
 # ========== 对话记录操作 ==========
 def get_conversations(user):
     with get_db_cursor() as cursor:
@@ -572,11 +1003,3 @@ def update_conversation(conv_id, messages, title=None):
 def delete_conversation(conv_id, user):
     with get_db_cursor() as cursor:
         cursor.execute('DELETE FROM conversations WHERE id = %s AND user = %s', (conv_id, user))
-
-# 初始化数据库
-try:
-    init_db()
-    print("✅ MySQL 数据库初始化成功")
-except Exception as e:
-    print(f"⚠️ MySQL 数据库初始化失败: {e}")
-    print("请确保 MySQL 服务已启动，并在 .env 文件中配置正确的数据库连接信息")
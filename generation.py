@@ -0,0 +1,331 @@
+"""
+后台生成任务
+文章/文档生成流水线，由任务队列的工作者（API进程内线程或 worker.py 独立进程）执行
+"""
+import os
+import uuid
+import asyncio
+from datetime import datetime
+from typing import List
+
+from agents import ArticleAgent, ChapterAgent, ContentParser, llm_client, rate_limiter, context
+from config import DOCUMENT_CONFIG
+from progress_bus import bus as progress_bus
+from singleflight import SingleFlight, make_key as make_flight_key
+from progress_writer import writer as progress_writer
+import database as db
+
+# 内存中的任务状态（用于实时更新）
+tasks_memory = {}
+TASK_MEMORY_MAX_SIZE = 100  # 最大缓存任务数
+
+def cleanup_tasks_memory():
+    """清理已完成的旧任务，防止内存泄漏"""
+    if len(tasks_memory) > TASK_MEMORY_MAX_SIZE:
+        completed_tasks = [k for k, v in tasks_memory.items() 
+                          if v.get('status') in ('completed', 'failed')]
+        # 删除最旧的一半已完成任务
+        for task_id in completed_tasks[:len(completed_tasks)//2]:
+            del tasks_memory[task_id]
+
+PROGRESS_FIELDS = ("type", "topic", "status", "current_step", "completed", "total", "error")
+
+def publish_progress(task_id: str):
+    """向任务所属用户的订阅连接推送最新进度"""
+    task = tasks_memory.get(task_id)
+    if task:
+        event = {"event": "progress", "task_id": task_id, **{k: task.get(k) for k in PROGRESS_FIELDS if k in task}}
+        progress_bus.publish(task.get("user"), event)
+
+def drop_partial(task_id: str):
+    """丢弃任务的增量内容（内存和待写入数据库的快照）"""
+    task = tasks_memory.get(task_id)
+    if task is not None:
+        task.pop("partial", None)
+    progress_writer.forget_partial(task_id)
+
+def fail_task(task_id: str, error: str, retry: bool):
+    """任务队列回调：记录失败（可重试时回到等待状态）"""
+    drop_partial(task_id)  # 重试时重新生成，增量内容不再有效
+    task = tasks_memory.get(task_id)
+    if task is None:
+        return
+    if retry:
+        task["status"] = "pending"
+        task["current_step"] = f"⚠️ 生成中断，等待重试: {error}"
+        publish_progress(task_id)
+        # 重试可能由其他进程（worker.py / 其他副本）领取，移出内存后进度查询与 SSE 改为读取数据库
+        tasks_memory.pop(task_id, None)
+        return
+    task["status"] = "failed"
+    task["error"] = error
+    publish_progress(task_id)
+    cleanup_tasks_memory()
+
+# ========== 后台任务生成 ==========
+MAX_RETRY_ATTEMPTS = 2  # 章节生成最大重试次数
+
+def partial_writer(task_id: str, part):
+    """返回把增量内容写入任务记录的回调（每次调用开始新的一段，重试时旧内容被替换）；
+    增量内容由 progress_writer 定期拼接成快照写入数据库，供其他进程的 SSE 连接读取"""
+    chunks = []
+    partial = tasks_memory[task_id].setdefault("partial", {})
+    partial[part] = chunks
+    progress_writer.watch_partial(task_id, partial)
+    return chunks.append
+
+async def generate_single_chapter(chapter: dict, outline: dict, enable_search: bool = False, task_id: str = None) -> dict:
+    """生成单个章节，带重试机制"""
+    last_error = None
+    for attempt in range(MAX_RETRY_ATTEMPTS + 1):
+        try:
+            agent = ChapterAgent()
+            on_delta = partial_writer(task_id, chapter["id"]) if task_id else None
+            content = await agent.agenerate_chapter(chapter, outline, enable_search, on_delta)
+            return {"id": chapter["id"], "title": chapter["title"], "content": content, "status": "success"}
+        except Exception as e:
+            last_error = e
+            if attempt < MAX_RETRY_ATTEMPTS:
+                await asyncio.sleep(rate_limiter.backoff_delay(attempt))  # 带抖动的指数退避，避免同时重试
+                continue
+    return {"id": chapter["id"], "title": chapter["title"], "content": f"生成失败: {str(last_error)}", "status": "failed"}
+
+async def generate_chapters(chapters: list, outline: dict, enable_search: bool, on_chapter_done=None, task_id: str = None) -> list:
+    """并发生成所有章节（协程共享异步连接池，不再占用线程池）；on_chapter_done 为协程函数，每章完成后调用"""
+    semaphore = asyncio.Semaphore(DOCUMENT_CONFIG["chapter_concurrency"])
+    
+    async def run_one(chapter: dict) -> dict:
+        async with semaphore:
+            result = await generate_single_chapter(chapter, outline, enable_search, task_id)
+        if on_chapter_done:
+            await on_chapter_done(result)
+        return result
+    
+    return await asyncio.gather(*(run_one(ch) for ch in chapters))
+
+# 相同文章请求（主题/描述/选项一致）合并为一次生成，每个任务各自保存一份
+article_flight = SingleFlight()
+_shared_partials = {}  # 合并键 -> 执行者任务的增量内容列表（跟随者直接共享同一个列表）
+
+def run_article_generation(task_id: str, topic: str, description: str, username: str, enable_search: bool, links: list = None, file_ids: list = None):
+    tasks_memory[task_id] = {"status": "running", "steps": [], "current_step": "🚀 开始生成文章...",
+                             "type": "article", "topic": topic, "user": username}
+    
+    def add_step(step: str):
+        tasks_memory[task_id]["steps"].append(step)
+        tasks_memory[task_id]["current_step"] = step
+        progress_writer.update(task_id, status="running", current_step=step)
+        publish_progress(task_id)
+    
+    def write_article() -> dict:
+        on_delta = partial_writer(task_id, "article")
+        _shared_partials[flight_key] = tasks_memory[task_id]["partial"]["article"]
+        try:
+            extra_context = ""
+            
+            # 处理上传的文件
+            if file_ids and len(file_ids) > 0:
+                add_step(f"📄 正在解析 {len(file_ids)} 个上传文件...")
+                file_content = process_uploaded_files(file_ids, f"{topic} {description}")
+                if file_content:
+                    extra_context += f"\n\n### 参考文件内容\n{file_content}"
+                    add_step("✅ 文件解析完成")
+            
+            if links and len(links) > 0:
+                add_step(f"🔗 正在解析 {len(links)} 个参考链接...")
+                parser = ContentParser()
+                link_results = []
+                for i, link in enumerate(links):
+                    add_step(f"📄 解析链接 ({i+1}/{len(links)})...")
+                    try:
+                        result = parser.parse_url(link, f"{topic} {description}")
+                        link_results.append(result)
+                    except Exception as e:
+                        add_step(f"⚠️ 链接解析失败: {link[:50]}...")
+                if link_results:
+                    add_step("📝 整合链接内容...")
+                    extra_context += parser.combine_sources(topic, link_results)
+            
+            if enable_search:
+                add_step("🌐 正在联网搜索相关资料...")
+                parser = ContentParser()
+                search_results = parser.web_search(f"{topic} {description}")
+                if search_results:
+                    add_step("📚 整理搜索结果...")
+                    for r in search_results:
+                        if isinstance(r, dict) and r.get('results'):
+                            results = context.pack(r['results'], context.budget_for("search_result"), f"{topic} {description}")
+                            extra_context += f"\n\n### 搜索资料\n{results}"
+            
+            add_step("✍️ AI正在撰写文章内容...")
+            return ArticleAgent().generate_article(topic, description, extra_context, on_delta=on_delta)
+        finally:
+            _shared_partials.pop(flight_key, None)
+    
+    flight_key = make_flight_key("article", topic, description, enable_search, links or [], file_ids or [])
+    try:
+        add_step("🚀 开始生成文章...")
+        shared_partial = _shared_partials.get(flight_key)
+        if shared_partial is not None:
+            tasks_memory[task_id].setdefault("partial", {})["article"] = shared_partial
+            progress_writer.watch_partial(task_id, tasks_memory[task_id]["partial"])
+            add_step("🤝 相同主题的文章正在生成，等待共享结果...")
+        result = article_flight.do(flight_key, write_article)
+        
+        add_step("✅ 文章生成完成，正在保存...")
+        article_id = str(uuid.uuid4())[:8]
+        article_data = {
+            "id": article_id, "title": result.get("title", topic), "content": result.get("content", ""),
+            "topic": topic, "type": "article", "user": username, "created_at": datetime.now().isoformat()
+        }
+        db.create_article(article_data)
+        
+        tasks_memory[task_id]["status"] = "completed"
+        tasks_memory[task_id]["current_step"] = "🎉 文章已保存到文章列表"
+        drop_partial(task_id)  # 正文已保存，不再保留增量内容
+        progress_writer.update(task_id, status="completed", current_step="🎉 文章已保存到文章列表")
+        publish_progress(task_id)
+        
+        # 延迟配图：文章已可阅读，图片生成后再回填，不占用文章生成的关键路径
+        if result.get("pending_images"):
+            try:
+                count = ArticleAgent().fill_pending_images(article_id, result["pending_images"])
+                print(f"文章 {article_id} 配图完成（{count}/{len(result['pending_images'])}）")
+            except Exception as e:
+                print(f"文章 {article_id} 配图失败: {e}")
+    finally:
+        cleanup_tasks_memory()  # 清理旧任务
+
+def run_document_generation(task_id: str, outline: dict, username: str, enable_search: bool):
+    """生成学习文档：每章完成即写入检查点，重试/续传时只生成缺失或失败的章节"""
+    chapters = outline.get("chapters", [])
+    total = len(chapters)
+    finished = {row["chapter_id"]: row for row in db.get_chapter_checkpoints(task_id) if row["status"] == "success"}
+    pending = [ch for ch in chapters if ch["id"] not in finished]
+    tasks_memory[task_id] = {"status": "running", "steps": [], "current_step": "🚀 开始生成文档...", "completed": len(finished), "total": total,
+                             "type": "document", "topic": outline.get("topic", ""), "user": username}
+    
+    def add_step(step: str):
+        tasks_memory[task_id]["steps"].append(step)
+        tasks_memory[task_id]["current_step"] = step
+        progress_writer.update(task_id, current_step=step)
+        publish_progress(task_id)
+    
+    add_step("🚀 开始生成学习文档...")
+    if finished:
+        add_step(f"♻️ 已恢复 {len(finished)} 个已完成章节，继续生成剩余 {len(pending)} 个章节...")
+    else:
+        add_step(f"📝 开始并发生成 {total} 个章节...")
+    
+    async def on_chapter_done(result: dict):
+        completed = tasks_memory[task_id]["completed"] + 1
+        tasks_memory[task_id]["completed"] = completed
+        # 写检查点放到线程中，不阻塞同一事件循环上其他章节的流式生成
+        await asyncio.to_thread(db.save_chapter_checkpoint, task_id, result, completed=completed)
+        if result["status"] == "success":
+            add_step(f"✅ 第{result['id']}章「{result['title']}」完成 ({completed}/{total})")
+        else:
+            add_step(f"❌ 第{result['id']}章「{result['title']}」生成失败 ({completed}/{total})")
+    
+    results = llm_client.run_sync(generate_chapters(pending, outline, enable_search, on_chapter_done, task_id)) if pending else []
+    
+    failed = [r for r in results if r["status"] != "success"]
+    if failed:
+        # 成功的章节已保存为检查点，重试或续传时只会重新生成失败的章节
+        raise RuntimeError(f"{len(failed)} 个章节生成失败: " + "、".join(f"第{r['id']}章" for r in failed))
+    
+    add_step("💾 正在保存文档...")
+    
+    # 文档ID沿用任务ID，保存后进程中断重试时不会重复创建文档
+    doc_id = task_id
+    restored = [{"id": row["chapter_id"], "title": row["title"], "content": row["content"], "status": row["status"]}
+                for row in finished.values()]
+    sorted_chapters = sorted(restored + results, key=lambda x: x["id"])
+    
+    final_step = "🎉 文档已保存到学习文档列表"
+    progress_writer.flush(task_id)  # 缓冲的进度先落库，不会在完成状态之后写入
+    if not db.get_document(doc_id, include_content=False):
+        doc_data = {
+            "id": doc_id, "title": outline.get("title", ""), "description": outline.get("description", ""),
+            "topic": outline.get("topic", ""), "chapters": sorted_chapters, "user": username,
+            "created_at": datetime.now()
+        }
+        # 文档、章节文章、检查点清理与任务状态在同一个事务内提交
+        db.save_document(doc_data, task_id, status="completed", current_step=final_step)
+    else:
+        db.delete_chapter_checkpoints(task_id)
+        progress_writer.update(task_id, status="completed", current_step=final_step)
+    
+    tasks_memory[task_id]["status"] = "completed"
+    tasks_memory[task_id]["current_step"] = final_step
+    drop_partial(task_id)
+    publish_progress(task_id)
+    cleanup_tasks_memory()  # 清理旧任务
+
+# ========== 任务队列处理函数 ==========
+def run_article_job(task: dict, payload: dict):
+    run_article_generation(
+        task["id"], payload.get("topic", task.get("topic", "")), payload.get("description", ""),
+        task["user"], payload.get("enable_search", False), payload.get("links", []), payload.get("file_ids", [])
+    )
+
+def run_document_job(task: dict, payload: dict):
+    run_document_generation(task["id"], payload["outline"], task["user"], payload.get("enable_search", True))
+
+JOB_HANDLERS = {
+    "article": run_article_job,
+    "document": run_document_job,
+}
+
+# ========== 文件上传处理 ==========
+UPLOAD_DIR = "uploads"
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+MAX_UPLOAD_CHARS = 500000  # 读取上限，仅防止超大文件占满内存；送入模型前再按Token预算挑选片段
+
+def parse_uploaded_file(file_path: str, filename: str) -> str:
+    """解析上传的文件内容"""
+    try:
+        ext = filename.lower().split('.')[-1]
+        
+        if ext in ('txt', 'md'):
+            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+                return f.read(MAX_UPLOAD_CHARS)
+        
+        elif ext == 'pdf':
+            try:
+                import PyPDF2
+                with open(file_path, 'rb') as f:
+                    reader = PyPDF2.PdfReader(f)
+                    text = ""
+                    for page in reader.pages[:20]:  # 最多20页
+                        text += page.extract_text() or ""
+                    return text[:MAX_UPLOAD_CHARS]
+            except ImportError:
+                return f"[PDF文件: {filename}，需要安装PyPDF2库]"
+        
+        elif ext in ('doc', 'docx'):
+            try:
+                import docx
+                doc = docx.Document(file_path)
+                text = "\n".join([para.text for para in doc.paragraphs])
+                return text[:MAX_UPLOAD_CHARS]
+            except ImportError:
+                return f"[Word文件: {filename}，需要安装python-docx库]"
+        
+        return f"[不支持的文件类型: {ext}]"
+    except Exception as e:
+        return f"[文件解析失败: {str(e)}]"
+
+def process_uploaded_files(file_ids: List[dict], query: str = "") -> str:
+    """处理上传的文件，提取内容（所有文件平分Token预算，过长的文件优先保留与 query 相关的片段）"""
+    files = [f for f in file_ids if isinstance(f, dict) and f.get('path')]
+    if not files:
+        return ""
+    budget = context.budget_for("upload") // len(files)
+    contents = []
+    for file_info in files:
+        content = parse_uploaded_file(file_info['path'], file_info.get('name', ''))
+        if content:
+            content = context.pack(content, budget, query)
+            contents.append(f"### 文件: {file_info.get('name', '未知')}\n{content}")
+    return "\n\n".join(contents)
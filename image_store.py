@@ -0,0 +1,139 @@
+"""
+图片资源存储
+生成的图片下载到本地磁盘一次，按内容哈希去重命名，由 /api/images/{name} 提供长期缓存；
+安装 Pillow 时可选转码为 WebP 并按需生成缩略图
+"""
+import os
+import io
+import hashlib
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from config import IMAGE_STORE_CONFIG
+
+URL_PREFIX = "/api/images/"
+CONTENT_TYPES = {
+    "image/png": "png",
+    "image/jpeg": "jpg",
+    "image/webp": "webp",
+    "image/gif": "gif",
+}
+MEDIA_TYPES = {ext: media for media, ext in CONTENT_TYPES.items()}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_maxsize=8)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def _to_webp(data: bytes):
+    """转码为 WebP（未安装 Pillow 或转码失败返回 None）"""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            out = io.BytesIO()
+            image.save(out, format="WEBP", quality=85)
+            return out.getvalue()
+    except Exception as e:
+        print(f"WebP转码失败: {e}")
+        return None
+
+
+def store(data: bytes, content_type: str) -> str:
+    """按内容哈希保存图片（已存在则直接复用），返回本地访问URL"""
+    ext = CONTENT_TYPES.get((content_type or "").split(";")[0].strip(), "png")
+    if IMAGE_STORE_CONFIG["webp"] and ext != "webp":
+        webp = _to_webp(data)
+        if webp:
+            data, ext = webp, "webp"
+    digest = hashlib.sha256(data).hexdigest()
+    name = f"{digest}.{ext}"
+    path = os.path.join(IMAGE_STORE_CONFIG["dir"], name)
+    if not os.path.exists(path):
+        os.makedirs(IMAGE_STORE_CONFIG["dir"], exist_ok=True)
+        # 先写临时文件再原子重命名，并发写入同一图片时不会读到半个文件
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return URL_PREFIX + name
+
+
+def mirror(url: str) -> str:
+    """下载上游临时图片URL到本地，失败或未启用时返回原URL"""
+    if not url or not IMAGE_STORE_CONFIG["enabled"] or url.startswith(URL_PREFIX):
+        return url
+    max_bytes = IMAGE_STORE_CONFIG["max_bytes"]
+    try:
+        # 流式读取，超过 max_bytes 立即放弃，不把超大响应整个读进内存
+        with _get_session().get(url, timeout=60, stream=True) as response:
+            if response.status_code != 200 or int(response.headers.get("Content-Length") or 0) > max_bytes:
+                return url
+            data = bytearray()
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                data += chunk
+                if len(data) > max_bytes:
+                    return url
+            content_type = response.headers.get("Content-Type", "")
+        return store(bytes(data), content_type)
+    except Exception as e:
+        print(f"图片本地化失败: {e}")
+        return url
+
+
+def exists(url: str) -> bool:
+    """本地图片URL对应的文件是否仍在磁盘上"""
+    if not url or not url.startswith(URL_PREFIX):
+        return False
+    return os.path.exists(os.path.join(IMAGE_STORE_CONFIG["dir"], os.path.basename(url)))
+
+
+def resolve(name: str, thumb: bool = False):
+    """返回 (文件路径, 媒体类型, ETag)；文件名不合法或不存在时返回 None"""
+    digest, _, ext = name.partition(".")
+    if len(digest) != 64 or not all(c in "0123456789abcdef" for c in digest) or ext not in MEDIA_TYPES:
+        return None
+    path = os.path.join(IMAGE_STORE_CONFIG["dir"], name)
+    if not os.path.exists(path):
+        return None
+    if thumb:
+        thumb_path = _thumbnail(path, digest)
+        if thumb_path:
+            return thumb_path, "image/webp", f'"{digest}-thumb"'
+    return path, MEDIA_TYPES[ext], f'"{digest}"'
+
+
+def _thumbnail(path: str, digest: str):
+    """按需生成缩略图（需要 Pillow），返回缩略图路径，无法生成时返回 None"""
+    thumb_path = os.path.join(IMAGE_STORE_CONFIG["dir"], "thumbs", f"{digest}.webp")
+    if os.path.exists(thumb_path):
+        return thumb_path
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    try:
+        os.makedirs(os.path.dirname(thumb_path), exist_ok=True)
+        with Image.open(path) as image:
+            image.thumbnail((IMAGE_STORE_CONFIG["thumb_width"], IMAGE_STORE_CONFIG["thumb_width"]))
+            tmp_path = f"{thumb_path}.{threading.get_ident()}.tmp"
+            image.save(tmp_path, format="WEBP", quality=80)
+        os.replace(tmp_path, thumb_path)
+        return thumb_path
+    except Exception as e:
+        print(f"生成缩略图失败: {e}")
+        return None
@@ -0,0 +1,134 @@
+"""
+持久化任务队列
+任务保存在 tasks 表中，工作者（API进程内线程或 worker.py 独立进程）通过租约领取任务并定期心跳续约；
+进程崩溃或重启后租约过期的任务会被重新领取，执行失败的任务按 JOB_CONFIG["max_attempts"] 重试
+"""
+import os
+import time
+import uuid
+import socket
+import threading
+import database as db
+from config import JOB_CONFIG
+from progress_writer import writer as progress_writer
+
+# 本进程入队时唤醒空闲的工作者，避免等待轮询间隔
+_wakeup = threading.Event()
+_embedded_workers = []
+
+
+def enqueue(task_data: dict, payload: dict):
+    """写入任务（连同执行参数）等待工作者领取"""
+    db.create_task({**task_data, "status": "pending", "payload": payload})
+    _wakeup.set()
+
+
+def requeue(task_id: str, current_step: str = "⏳ 等待续传...") -> bool:
+    """把失败的任务重新放回队列"""
+    if db.requeue_task(task_id, current_step):
+        _wakeup.set()
+        return True
+    return False
+
+
+class JobWorker:
+    """任务工作者：循环领取任务、执行、心跳续约"""
+
+    def __init__(self, handlers: dict, on_failure=None, worker_id: str = None):
+        self.handlers = handlers
+        self.on_failure = on_failure
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._stop = threading.Event()
+        self._last_reap = 0.0
+        self.thread = None
+
+    def stop(self):
+        self._stop.set()
+        _wakeup.set()
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            self._reap_exhausted()
+            try:
+                task = db.claim_task(self.worker_id, JOB_CONFIG["lease_seconds"], JOB_CONFIG["max_attempts"])
+            except Exception as e:
+                print(f"领取任务失败: {e}")
+                task = None
+            if task is None:
+                _wakeup.wait(JOB_CONFIG["poll_interval"])
+                _wakeup.clear()
+                continue
+            self.run_task(task)
+
+    def run_task(self, task: dict):
+        task_id = task["id"]
+        stop_heartbeat = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(task_id, stop_heartbeat), daemon=True).start()
+        try:
+            handler = self.handlers.get(task["type"])
+            if handler is None:
+                raise ValueError(f"未知任务类型: {task['type']}")
+            handler(task, task.get("payload") or {})
+        except Exception as e:
+            retry = task.get("attempts", 0) < JOB_CONFIG["max_attempts"]
+            print(f"任务 {task_id} 执行失败（第{task.get('attempts', 0)}次）: {e}")
+            # 先写完缓冲的进度，避免其中的 running 状态覆盖失败状态
+            progress_writer.flush(task_id)
+            try:
+                db.fail_task(task_id, self.worker_id, str(e), retry)
+            except Exception as db_error:
+                print(f"记录任务失败状态出错: {db_error}")
+            if self.on_failure:
+                self.on_failure(task_id, str(e), retry)
+        else:
+            progress_writer.flush(task_id)
+            try:
+                db.release_task(task_id, self.worker_id)
+            except Exception as e:
+                print(f"释放任务租约失败: {e}")
+        finally:
+            stop_heartbeat.set()
+
+    def _heartbeat(self, task_id: str, stop: threading.Event):
+        while not stop.wait(JOB_CONFIG["heartbeat_interval"]):
+            try:
+                if not db.heartbeat_task(task_id, self.worker_id, JOB_CONFIG["lease_seconds"]):
+                    print(f"任务 {task_id} 的租约已被其他工作者接管")
+                    return
+            except Exception as e:
+                print(f"任务心跳失败: {e}")
+
+    def _reap_exhausted(self):
+        """定期把重试次数用尽且租约过期的任务标记为失败"""
+        now = time.monotonic()
+        if now - self._last_reap < JOB_CONFIG["reap_interval"]:
+            return
+        self._last_reap = now
+        try:
+            db.fail_exhausted_tasks(JOB_CONFIG["max_attempts"])
+        except Exception as e:
+            print(f"清理过期任务失败: {e}")
+
+
+def start_workers(count: int) -> list:
+    """在当前进程中启动 count 个工作线程"""
+    from generation import JOB_HANDLERS, fail_task
+    workers = []
+    for i in range(count):
+        worker = JobWorker(JOB_HANDLERS, on_failure=fail_task)
+        worker.thread = threading.Thread(target=worker.run_forever, name=f"job-worker-{i}", daemon=True)
+        worker.thread.start()
+        workers.append(worker)
+    return workers
+
+
+def start_embedded_workers():
+    """API进程内启动工作线程（JOB_CONFIG["embedded_workers"] 为 0 时只入队，由 worker.py 执行）"""
+    if JOB_CONFIG["embedded_workers"] > 0 and not _embedded_workers:
+        _embedded_workers.extend(start_workers(JOB_CONFIG["embedded_workers"]))
+
+
+def stop_embedded_workers():
+    for worker in _embedded_workers:
+        worker.stop()
+    _embedded_workers.clear()
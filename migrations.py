@@ -0,0 +1,411 @@
+"""
+数据库结构迁移
+迁移按版本号顺序执行，已执行的版本记录在 schema_migrations 表，每个版本只执行一次；
+部署时显式执行 python migrations.py，或由 API / worker 启动时调用 ensure_schema()：
+结构已是最新时只有一次版本查询，多个进程同时启动时用 MySQL 命名锁保证只有一个进程在迁移
+
+用法:
+    python migrations.py            # 执行所有未执行的迁移
+    python migrations.py --status   # 查看当前版本与待执行的迁移
+"""
+import os
+import argparse
+import pymysql
+import database as db
+
+# 启动时是否自动执行迁移（关闭后需部署时手动执行 python migrations.py）
+AUTO_MIGRATE = os.getenv("DB_AUTO_MIGRATE", "true").lower() not in ("0", "false", "no")
+LOCK_NAME = "learnflow_schema_migrations"
+LOCK_TIMEOUT = 60  # 秒
+
+# 库或 schema_migrations 表不存在（尚未迁移过）
+UNKNOWN_DATABASE = 1049
+NO_SUCH_TABLE = 1146
+
+
+def _ensure_column(cursor, table, column, definition):
+    """字段不存在时追加（CREATE TABLE IF NOT EXISTS 不会修改已有表）"""
+    cursor.execute(
+        'SELECT COUNT(*) AS cnt FROM information_schema.COLUMNS '
+        'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s',
+        (table, column)
+    )
+    if not cursor.fetchone()['cnt']:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+def _ensure_index(cursor, table, index, columns):
+    """索引不存在时创建"""
+    cursor.execute(
+        'SELECT COUNT(*) AS cnt FROM information_schema.STATISTICS '
+        'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s',
+        (table, index)
+    )
+    if not cursor.fetchone()['cnt']:
+        cursor.execute(f'ALTER TABLE {table} ADD INDEX {index} ({columns})')
+
+
+# ========== 迁移 ==========
+# 1 为当前完整结构（全新安装只需这一步）；之后的迁移用于升级由旧版本创建的库，对新库不做任何修改
+def _initial_schema(cursor):
+    # 用户表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            username VARCHAR(100) UNIQUE NOT NULL,
+            email VARCHAR(200),
+            password VARCHAR(255) NOT NULL,
+            token VARCHAR(255),
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_token (token)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    ''')
+
+    # 文章表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS articles (
+            id VARCHAR(50) PRIMARY KEY,
+            title VARCHAR(500) NOT NULL,
+            content LONGTEXT,
+            topic VARCHAR(500),
+            type VARCHAR(50) DEFAULT 'article',
+            document_id VARCHAR(50),
+            chapter_id INT,
+            word_count INT,
+            user VARCHAR(100) NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME,
+            INDEX idx_user (user),
+            INDEX idx_user_created (user, created_at, id),
+            INDEX idx_document (document_id),
+            INDEX idx_type (type)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    ''')
+
+    # 文章检索块表（保存文章时重建，/api/ask 按问题取最相关的块）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS article_chunks (
+            article_id VARCHAR(50) NOT NULL,
+            seq INT NOT NULL,
+            heading VARCHAR(500),
+            content MEDIUMTEXT,
+            PRIMARY KEY (article_id, seq)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    ''')
+
+    # 跨文章搜索的倒排索引（按用户聚簇，查询只扫描该用户的词项）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS search_postings (
+            user VARCHAR(100) NOT NULL,
+            term VARCHAR(32) NOT NULL,
+            article_id VARCHAR(50) NOT NULL,
+            tf INT NOT NULL,
+            PRIMARY KEY (user, term, article_id),
+            INDEX idx_article (article_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_bin
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS search_docs (
+            article_id VARCHAR(50) PRIMARY KEY,
+            user VARCHAR(100) NOT NULL,
+            length INT NOT NULL,
+            INDEX idx_user (user)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    ''')
+
+    # 文档表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS documents (
+            id VARCHAR(50) PRIMARY KEY,
+            title VARCHAR(500) NOT NULL,
+            description TEXT,
+            topic VARCHAR(500),
+            chapters LONGTEXT,
+            word_count INT,
+            user VARCHAR(100) NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_user (user),
+            INDEX idx_user_created (user, created_at, id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    ''')
+
+    # 大纲表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS outlines (
+            id VARCHAR(50) PRIMARY KEY,
+            title VARCHAR(500),
+            description TEXT,
+            topic VARCHAR(500),
+            chapters LONGTEXT,
+            links LONGTEXT,
+            enable_search TINYINT DEFAULT 0,
+            feedback TEXT,
+            user VARCHAR(100) NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_user (user)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    ''')
+
+    # 任务表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tasks (
+            id VARCHAR(50) PRIMARY KEY,
+            type VARCHAR(50),
+            status VARCHAR(50),
+            topic VARCHAR(500),
+            user VARCHAR(100) NOT NULL,
+            current_step TEXT,
+            completed INT DEFAULT 0,
+            total INT DEFAULT 0,
+            error TEXT,
+            payload LONGTEXT,
+            attempts INT DEFAULT 0,
+            lease_owner VARCHAR(100),
+            lease_expires DATETIME,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_user (user),
+            INDEX idx_status (status)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    ''')
+
+    # 文档生成检查点表（每章完成即保存，用于续传）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS task_chapters (
+            task_id VARCHAR(50) NOT NULL,
+            chapter_id INT NOT NULL,
+            title VARCHAR(500),
+            content LONGTEXT,
+            status VARCHAR(20),
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (task_id, chapter_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    ''')
+
+    # 笔记表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS notes (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            article_id VARCHAR(50) NOT NULL,
+            question TEXT,
+            answer LONGTEXT,
+            user VARCHAR(100) NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_article (article_id),
+            INDEX idx_user (user)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    ''')
+
+    # 配置表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS config (
+            `key` VARCHAR(100) PRIMARY KEY,
+            value TEXT
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    ''')
+
+    # LLM响应缓存表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            cache_key CHAR(64) PRIMARY KEY,
+            value LONGTEXT,
+            expires_at DATETIME NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_expires (expires_at)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    ''')
+
+    # 面试题表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS interview_questions (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            article_id VARCHAR(50) NOT NULL,
+            question TEXT NOT NULL,
+            reference_answer LONGTEXT,
+            user_answer LONGTEXT,
+            score INT,
+            feedback LONGTEXT,
+            user VARCHAR(100) NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            answered_at DATETIME,
+            INDEX idx_article (article_id),
+            INDEX idx_user (user)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    ''')
+
+    # 对话记录表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS conversations (
+            id VARCHAR(50) PRIMARY KEY,
+            title VARCHAR(500) DEFAULT '新对话',
+            messages LONGTEXT,
+            user VARCHAR(100) NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_user (user)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    ''')
+
+
+def _users_token_index(cursor):
+    # 每个请求都按令牌查用户
+    _ensure_index(cursor, 'users', 'idx_token', 'token')
+
+
+def _task_queue_columns(cursor):
+    _ensure_column(cursor, 'tasks', 'payload', 'LONGTEXT')
+    _ensure_column(cursor, 'tasks', 'attempts', 'INT DEFAULT 0')
+    _ensure_column(cursor, 'tasks', 'lease_owner', 'VARCHAR(100)')
+    _ensure_column(cursor, 'tasks', 'lease_expires', 'DATETIME')
+
+
+def _list_pagination(cursor):
+    # 列表字数字段与 (user, created_at, id) 分页索引
+    for table in ('articles', 'documents'):
+        _ensure_column(cursor, table, 'word_count', 'INT')
+        _ensure_index(cursor, table, 'idx_user_created', 'user, created_at, id')
+
+
+def _document_chapter_refs(cursor):
+    # 旧版文档的 chapters 内嵌了章节正文，迁移为引用（分批提交，使用自己的连接）
+    migrated = db.migrate_document_chapters()
+    if migrated:
+        print(f"✅ 已迁移 {migrated} 个文档的章节存储")
+
+
+def _article_chunks_mediumtext(cursor):
+    # TEXT 上限 65535 字节，中文块按字数切分后仍可能接近上限；
+    # 新库在 initial_schema 中已是 MEDIUMTEXT，这里只影响旧库
+    cursor.execute('ALTER TABLE article_chunks MODIFY content MEDIUMTEXT')
+
+
+def _task_partial(cursor):
+    # 生成中的增量内容快照（JSON {part: 文本}），供其他进程的 SSE 连接读取
+    _ensure_column(cursor, 'tasks', 'partial', 'LONGTEXT')
+
+
+# (版本号, 名称, 迁移函数)，只能追加，不能修改已发布的版本
+MIGRATIONS = [
+    (1, "initial_schema", _initial_schema),
+    (2, "users_token_index", _users_token_index),
+    (3, "task_queue_columns", _task_queue_columns),
+    (4, "list_pagination", _list_pagination),
+    (5, "document_chapter_refs", _document_chapter_refs),
+    (6, "article_chunks_mediumtext", _article_chunks_mediumtext),
+    (7, "task_partial", _task_partial),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+# ========== 执行 ==========
+def _create_database():
+    """创建数据库（如果不存在）"""
+    conn = pymysql.connect(
+        host=db.DB_CONFIG['host'],
+        port=db.DB_CONFIG['port'],
+        user=db.DB_CONFIG['user'],
+        password=db.DB_CONFIG['password'],
+        charset='utf8mb4'
+    )
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                f"CREATE DATABASE IF NOT EXISTS {db.DB_CONFIG['database']} CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci"
+            )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def current_version() -> int:
+    """已执行的最高版本号（库或版本表不存在时为 0）"""
+    try:
+        with db.get_db_cursor() as cursor:
+            cursor.execute('SELECT MAX(version) AS version FROM schema_migrations')
+            return cursor.fetchone()['version'] or 0
+    except (pymysql.err.OperationalError, pymysql.err.ProgrammingError) as e:
+        if e.args and e.args[0] in (UNKNOWN_DATABASE, NO_SUCH_TABLE):
+            return 0
+        raise
+
+
+def migrate() -> list:
+    """
+    执行所有未执行的迁移
+
+    Returns:
+        本次执行的迁移名称列表
+    """
+    _create_database()
+    conn = db.get_db()
+    pool = db.get_pool()
+    try:
+        # 命名锁绑定在这个连接上，持锁期间其他进程的迁移会等待
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT GET_LOCK(%s, %s) AS locked', (LOCK_NAME, LOCK_TIMEOUT))
+            if not cursor.fetchone()['locked']:
+                raise RuntimeError(f"等待迁移锁超时（{LOCK_TIMEOUT}秒），可能有其他进程正在迁移")
+        try:
+            with db.get_db_cursor() as cursor:
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version INT PRIMARY KEY,
+                        name VARCHAR(100) NOT NULL,
+                        applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+                ''')
+                cursor.execute('SELECT version FROM schema_migrations')
+                applied = {row['version'] for row in cursor.fetchall()}
+
+            executed = []
+            for version, name, migration in MIGRATIONS:
+                if version in applied:
+                    continue
+                print(f"🔧 执行数据库迁移 {version}: {name}")
+                # DDL 会隐式提交，迁移本身需可重复执行；版本记录在迁移成功后写入
+                with db.get_db_cursor() as cursor:
+                    migration(cursor)
+                with db.get_db_cursor() as cursor:
+                    cursor.execute('INSERT INTO schema_migrations (version, name) VALUES (%s, %s)', (version, name))
+                executed.append(name)
+            return executed
+        finally:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT RELEASE_LOCK(%s)', (LOCK_NAME,))
+    finally:
+        pool.release_connection(conn)
+
+
+def ensure_schema():
+    """启动钩子：版本已是最新时直接返回；否则按 AUTO_MIGRATE 执行迁移或给出提示"""
+    try:
+        version = current_version()
+        if version >= LATEST_VERSION:
+            return
+        if not AUTO_MIGRATE:
+            print(f"⚠️ 数据库结构版本 {version} 落后于 {LATEST_VERSION}，请执行 python migrations.py")
+            return
+        executed = migrate()
+        print(f"✅ MySQL 数据库迁移完成（{len(executed)} 项，当前版本 {LATEST_VERSION}）")
+    except Exception as e:
+        print(f"⚠️ MySQL 数据库初始化失败: {e}")
+        print("请确保 MySQL 服务已启动，并在 .env 文件中配置正确的数据库连接信息")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LearnFlow AI 数据库迁移")
+    parser.add_argument("--status", action="store_true", help="只查看当前版本与待执行的迁移")
+    args = parser.parse_args()
+
+    if args.status:
+        version = current_version()
+        print(f"当前版本: {version}，最新版本: {LATEST_VERSION}")
+        for pending_version, name, _ in MIGRATIONS:
+            if pending_version > version:
+                print(f"  待执行 {pending_version}: {name}")
+        return
+    executed = migrate()
+    print(f"✅ 执行了 {len(executed)} 项迁移，当前版本 {LATEST_VERSION}" if executed else "数据库结构已是最新")
+
+
+if __name__ == "__main__":
+    main()
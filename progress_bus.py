@@ -0,0 +1,71 @@
+"""
+任务进度事件总线
+后台生成线程发布进度事件，SSE 连接按用户订阅（一个连接即可覆盖该用户的所有任务）
+"""
+import asyncio
+import threading
+
+SUBSCRIBER_QUEUE_SIZE = 1000  # 单个订阅者最多积压的事件数
+
+
+class ProgressBus:
+    """进程内的发布/订阅总线，发布方可以是任意线程，订阅方运行在主事件循环"""
+
+    def __init__(self):
+        self._loop = None
+        self._subscribers = {}  # username -> set[asyncio.Queue]
+        self._lock = threading.Lock()
+
+    def bind_loop(self, loop):
+        """绑定主事件循环（应用启动时调用）"""
+        self._loop = loop
+
+    def subscribe(self, user: str) -> asyncio.Queue:
+        """订阅某个用户的全部任务事件（需在事件循环中调用）"""
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(user, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user: str, queue: asyncio.Queue):
+        with self._lock:
+            queues = self._subscribers.get(user)
+            if queues:
+                queues.discard(queue)
+                if not queues:
+                    del self._subscribers[user]
+
+    def has_subscribers(self, user: str) -> bool:
+        return bool(self._subscribers.get(user))
+
+    def publish(self, user: str, event: dict):
+        """发布事件（线程安全，无订阅者时直接丢弃）"""
+        if self._loop is None or not user or not self.has_subscribers(user):
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._dispatch(user, event)
+        else:
+            try:
+                self._loop.call_soon_threadsafe(self._dispatch, user, event)
+            except RuntimeError:
+                pass  # 事件循环已关闭
+
+    def _dispatch(self, user: str, event: dict):
+        with self._lock:
+            queues = list(self._subscribers.get(user, ()))
+        for queue in queues:
+            if queue.full():
+                # 消费过慢时丢弃最旧的事件，进度事件只关心最新状态
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    pass
+            queue.put_nowait(event)
+
+
+# 全局事件总线
+bus = ProgressBus()
@@ -0,0 +1,118 @@
+"""
+任务进度的合并写入（write-behind）
+生成线程调用 update() 只把字段合并进内存缓冲区后立即返回，不等待 MySQL；
+后台线程每隔 JOB_CONFIG["progress_flush_interval"] 秒把每个任务的待写字段合并成一条 UPDATE，
+任务进入终态（completed / failed）时立即触发写入；flush(task_id) 可同步写完某个任务的缓冲。
+生成中的增量内容通过 watch_partial() 登记，每次写入时若有新内容，拼接成快照随同一条 UPDATE 写入 partial 列
+"""
+import json
+import atexit
+import threading
+import database as db
+from config import JOB_CONFIG
+
+TERMINAL_STATUS = ("completed", "failed")
+
+
+class ProgressWriter:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._pending = {}  # task_id -> 待写字段（后写的覆盖先写的）
+        self._partials = {}  # task_id -> [增量内容 {part: chunks}, 已写入快照的签名]
+        self._lock = threading.Lock()
+        # 同一时间只有一个线程在写，保证同一任务的先后两批更新按顺序落库
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.updates = 0   # update() 调用次数
+        self.writes = 0    # 实际执行的 UPDATE 次数
+        self.errors = 0
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="progress-writer", daemon=True)
+                    self._thread.start()
+
+    def update(self, task_id: str, **fields):
+        """合并任务字段，稍后写入（终态立即唤醒后台线程）"""
+        with self._lock:
+            self._pending.setdefault(task_id, {}).update(fields)
+            self.updates += 1
+        self._ensure_thread()
+        if fields.get("status") in TERMINAL_STATUS:
+            self._wake.set()
+
+    def watch_partial(self, task_id: str, partial: dict):
+        """登记任务的增量内容 {part: chunks}（生成线程只追加，不在这里拷贝），有新内容时随进度写入"""
+        with self._lock:
+            self._partials[task_id] = [partial, None]
+        self._ensure_thread()
+
+    def forget_partial(self, task_id: str):
+        """任务结束或重试：不再写入增量内容"""
+        with self._lock:
+            self._partials.pop(task_id, None)
+
+    def _partial_snapshots(self, task_id: str = None) -> dict:
+        """有新内容的任务 -> (JSON 快照, 增量内容, 签名)；签名按 (part, chunks 对象, 分段数) 判断是否有变化"""
+        with self._lock:
+            if task_id is None:
+                watched = list(self._partials.items())
+            else:
+                watched = [(task_id, self._partials[task_id])] if task_id in self._partials else []
+        snapshots = {}
+        for watched_id, (partial, written) in watched:
+            parts = list(partial.items())
+            signature = tuple((part, id(chunks), len(chunks)) for part, chunks in parts)
+            if signature != written:
+                text = {str(part): "".join(chunks) for part, chunks in parts}
+                snapshots[watched_id] = (json.dumps(text, ensure_ascii=False), partial, signature)
+        return snapshots
+
+    def flush(self, task_id: str = None):
+        """同步写入缓冲的更新（task_id 为 None 时写入全部任务）"""
+        with self._flush_lock:
+            with self._lock:
+                if task_id is None:
+                    batch, self._pending = self._pending, {}
+                else:
+                    fields = self._pending.pop(task_id, None)
+                    batch = {task_id: fields} if fields else {}
+            snapshots = self._partial_snapshots(task_id)
+            for pending_id, (snapshot, _, _) in snapshots.items():
+                batch[pending_id] = {**batch.get(pending_id, {}), "partial": snapshot}
+            for pending_id, fields in batch.items():
+                try:
+                    db.update_task(pending_id, **fields)
+                    self.writes += 1
+                except Exception as e:
+                    self.errors += 1
+                    print(f"写入任务进度失败: {e}")
+                    fields.pop("partial", None)  # 快照不放回，下次写入时重新生成
+                    if fields:
+                        with self._lock:
+                            # 放回缓冲区，期间的新更新优先
+                            self._pending[pending_id] = {**fields, **self._pending.get(pending_id, {})}
+                    continue
+                if pending_id in snapshots:
+                    _, partial, signature = snapshots[pending_id]
+                    with self._lock:
+                        watched = self._partials.get(pending_id)
+                        if watched is not None and watched[0] is partial:
+                            watched[1] = signature
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def stats(self) -> dict:
+        return {"pending": len(self._pending), "partials": len(self._partials),
+                "updates": self.updates, "writes": self.writes, "errors": self.errors}
+
+
+writer = ProgressWriter(JOB_CONFIG["progress_flush_interval"])
+atexit.register(writer.flush)
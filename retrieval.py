@@ -0,0 +1,195 @@
+"""
+文章内容检索
+保存文章时按小节/段落切块并建立索引（article_chunks 表），提问时用 BM25 只取最相关的若干块；
+同时维护跨文章的倒排索引（search_postings / search_docs 表），供 /api/search 排序与高亮；
+纯本地计算，不依赖网络或向量模型
+"""
+import re
+import html
+import math
+from collections import Counter
+from config import RETRIEVAL_CONFIG, SEARCH_CONFIG
+
+ASCII_WORD = re.compile(r"[a-z0-9_]+")
+CJK_RUN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff]+")
+CJK_CHAR = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff]")
+SENTENCE_END = re.compile(r"(?<=[。！？!?；;\n])|(?<=\. )")
+MAX_HEADING_CHARS = 200  # article_chunks.heading 为 VARCHAR(500)
+
+
+def tokenize(text: str) -> list:
+    """检索用分词：英文/数字按单词（小写），中文按相邻两字切分（单字词保留单字）"""
+    text = (text or "").lower()
+    terms = ASCII_WORD.findall(text)
+    for run in CJK_RUN.findall(text):
+        if len(run) == 1:
+            terms.append(run)
+        else:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def chunk_text(text: str, chunk_chars: int = None) -> list:
+    """
+    把 Markdown 正文切成检索块
+
+    Returns:
+        [{"heading": 所属小节标题, "content": 块内容}]，标题总是开启新块，超长段落按句子拆分（超长句子按字数硬切）
+    """
+    chunk_chars = chunk_chars or RETRIEVAL_CONFIG["chunk_chars"]
+    chunks = []
+    heading, current = "", []
+
+    def flush():
+        if current:
+            chunks.append({"heading": heading, "content": "\n\n".join(current)})
+            current.clear()
+
+    for paragraph in re.split(r"\n\s*\n", text or ""):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if paragraph.startswith("#"):
+            flush()
+            heading = paragraph.split("\n", 1)[0].lstrip("#").strip()[:MAX_HEADING_CHARS]
+        pieces = [paragraph]
+        if len(paragraph) > chunk_chars:
+            pieces, piece = [], ""
+            for sentence in SENTENCE_END.split(paragraph):
+                # 没有句末标点的超长句子按字数硬切，保证每块不超过 chunk_chars
+                while len(sentence) > chunk_chars:
+                    if piece:
+                        pieces.append(piece)
+                        piece = ""
+                    pieces.append(sentence[:chunk_chars])
+                    sentence = sentence[chunk_chars:]
+                if piece and len(piece) + len(sentence) > chunk_chars:
+                    pieces.append(piece)
+                    piece = ""
+                piece += sentence
+            if piece:
+                pieces.append(piece)
+        for piece in pieces:
+            if current and sum(len(p) for p in current) + len(piece) > chunk_chars:
+                flush()
+            current.append(piece)
+    flush()
+    return chunks
+
+
+def inverse_document_frequency(df: int, total: int) -> float:
+    """BM25 的 IDF（加 1 保证非负）"""
+    return math.log(1 + (total - df + 0.5) / (df + 0.5))
+
+
+def term_weight(freq: int, length: int, avg_length: float) -> float:
+    """BM25 的词频饱和与长度归一化部分"""
+    k1, b = RETRIEVAL_CONFIG["k1"], RETRIEVAL_CONFIG["b"]
+    return freq * (k1 + 1) / (freq + k1 * (1 - b + b * length / (avg_length or 1)))
+
+
+def bm25_rank(query: str, chunks: list, top_k: int = None) -> list:
+    """
+    按 BM25 给块打分，返回最相关的 top_k 个块（按原文顺序）
+
+    Args:
+        query: 用户问题
+        chunks: [{"seq": 序号, "heading": ..., "content": ...}]
+        top_k: 返回块数，默认取 RETRIEVAL_CONFIG["top_k"]
+
+    问题与所有块都不相关时返回开头的 top_k 块
+    """
+    top_k = top_k or RETRIEVAL_CONFIG["top_k"]
+    if len(chunks) <= top_k:
+        return list(chunks)
+    query_terms = set(tokenize(query))
+    # 标题参与打分：块里没写出小节名时也能按小节命中
+    term_freqs = [Counter(tokenize(f"{c.get('heading', '')}\n{c['content']}")) for c in chunks]
+    lengths = [sum(tf.values()) for tf in term_freqs]
+    avg_length = sum(lengths) / len(lengths) or 1
+
+    idf = {}
+    for term in query_terms:
+        df = sum(1 for tf in term_freqs if term in tf)
+        if df:
+            idf[term] = inverse_document_frequency(df, len(chunks))
+
+    scores = []
+    for index, tf in enumerate(term_freqs):
+        scores.append(sum(
+            weight * term_weight(tf[term], lengths[index], avg_length)
+            for term, weight in idf.items() if term in tf
+        ))
+
+    ranked = sorted(range(len(chunks)), key=lambda i: (-scores[i], i))[:top_k]
+    return [chunks[i] for i in sorted(ranked)]
+
+
+# ---------- 跨文章搜索 ----------
+def document_terms(title: str, content: str):
+    """倒排索引用的词频：标题词项按 title_weight 加权，返回 (Counter, 文档长度)"""
+    max_len = SEARCH_CONFIG["max_term_length"]
+    counts = Counter(term[:max_len] for term in tokenize(content))
+    for term in tokenize(title):
+        counts[term[:max_len]] += SEARCH_CONFIG["title_weight"]
+    return counts, sum(counts.values())
+
+
+def query_terms(query: str) -> list:
+    """查询词项（去重，保持顺序）"""
+    max_len = SEARCH_CONFIG["max_term_length"]
+    return list(dict.fromkeys(term[:max_len] for term in tokenize(query)))
+
+
+def _match_spans(text: str, terms: list) -> list:
+    """text 中所有命中词项的 (起, 止) 区间（已合并重叠）"""
+    lowered = text.lower()
+    spans = []
+    for term in terms:
+        start = lowered.find(term)
+        while start != -1:
+            spans.append((start, start + len(term)))
+            start = lowered.find(term, start + 1)
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def highlight(text: str, terms: list) -> str:
+    """转义 HTML 后用 <mark> 标出命中的词项"""
+    text = text or ""
+    parts, last = [], 0
+    for start, end in _match_spans(text, terms):
+        parts.append(html.escape(text[last:start]))
+        parts.append(f"<mark>{html.escape(text[start:end])}</mark>")
+        last = end
+    parts.append(html.escape(text[last:]))
+    return "".join(parts)
+
+
+def snippet(text: str, terms: list, width: int = None) -> str:
+    """截取命中最密集处附近的一段文字并高亮"""
+    width = width or SEARCH_CONFIG["snippet_chars"]
+    text = " ".join((text or "").split())
+    spans = _match_spans(text, terms)
+    if not spans:
+        return highlight(text[:width], terms) + ("…" if len(text) > width else "")
+    # 选窗口内命中数最多的起点
+    best_start, best_hits = spans[0][0], 0
+    for start, _ in spans:
+        hits = sum(1 for s, _ in spans if start <= s < start + width)
+        if hits > best_hits:
+            best_start, best_hits = start, hits
+    begin = max(0, best_start - width // 4)
+    end = min(len(text), begin + width)
+    return ("…" if begin else "") + highlight(text[begin:end], terms) + ("…" if end < len(text) else "")
+
+
+def count_words(text: str) -> int:
+    """字数统计：中文按字、英文/数字按单词"""
+    text = text or ""
+    return len(CJK_CHAR.findall(text)) + len(ASCII_WORD.findall(text.lower()))
@@ -0,0 +1,164 @@
+"""
+登录会话
+令牌 -> 用户 的进程内TTL缓存（登录时主动失效该用户的旧令牌），
+可选 signed 模式：HMAC签名的无状态令牌，校验无需任何I/O
+"""
+import hmac
+import json
+import time
+import base64
+import secrets
+import hashlib
+import threading
+from collections import OrderedDict
+from config import AUTH_CONFIG
+import database as db
+import async_db
+
+
+class SessionCache:
+    """令牌解析结果的LRU + TTL缓存，支持按用户名失效"""
+
+    def __init__(self, max_entries: int, ttl: int):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # token -> (expires_at, user)
+        self._by_user = {}  # username -> {token, ...}
+        self._lock = threading.Lock()
+
+    def get(self, token: str):
+        with self._lock:
+            item = self._data.get(token)
+            if item and item[0] > time.monotonic():
+                self._data.move_to_end(token)
+                self.hits += 1
+                return item[1]
+            if item:
+                self._discard(token)
+            self.misses += 1
+            return None
+
+    def set(self, token: str, user: dict):
+        with self._lock:
+            self._discard(token)
+            self._data[token] = (time.monotonic() + self.ttl, user)
+            self._by_user.setdefault(user["username"], set()).add(token)
+            while len(self._data) > self.max_entries:
+                self._discard(next(iter(self._data)))
+
+    def invalidate_user(self, username: str):
+        with self._lock:
+            for token in list(self._by_user.get(username, ())):
+                self._discard(token)
+
+    def _discard(self, token: str):
+        """删除一个令牌（需持有锁）"""
+        item = self._data.pop(token, None)
+        if item:
+            tokens = self._by_user.get(item[1]["username"])
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self._by_user[item[1]["username"]]
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+_cache = SessionCache(AUTH_CONFIG["cache_max_entries"], AUTH_CONFIG["cache_ttl"])
+
+
+def _signed_mode() -> bool:
+    if AUTH_CONFIG["token_mode"] != "signed":
+        return False
+    if not AUTH_CONFIG["secret"]:
+        print("⚠️ AUTH_TOKEN_MODE=signed 但未设置 JWT_SECRET，退回数据库令牌")
+        AUTH_CONFIG["token_mode"] = "session"
+        return False
+    return True
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload: str) -> str:
+    digest = hmac.new(AUTH_CONFIG["secret"].encode(), payload.encode(), hashlib.sha256).digest()
+    return _b64encode(digest)
+
+
+def _issue_signed(username: str) -> str:
+    payload = _b64encode(json.dumps(
+        {"u": username, "exp": int(time.time()) + AUTH_CONFIG["token_ttl"], "n": secrets.token_hex(4)},
+        separators=(",", ":")
+    ).encode())
+    return f"{payload}.{_sign(payload)}"
+
+
+def _verify_signed(token: str):
+    """校验签名令牌，返回用户信息；格式不对或签名/有效期不通过返回 None"""
+    payload, _, signature = token.partition(".")
+    if not signature or not hmac.compare_digest(signature, _sign(payload)):
+        return None
+    try:
+        data = json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+    if data.get("exp", 0) < time.time():
+        return None
+    return {"username": data["u"]}
+
+
+def issue_token(username: str) -> str:
+    """登录：生成新令牌写入数据库，并让该用户已缓存的旧令牌立即失效"""
+    token = _issue_signed(username) if _signed_mode() else secrets.token_hex(32)
+    db.update_user_token(username, token)
+    _cache.invalidate_user(username)
+    return token
+
+
+def resolve(token: str):
+    """解析令牌对应的用户，无效时返回 None"""
+    if not token:
+        return None
+    if _signed_mode() and "." in token:
+        return _verify_signed(token)
+    user = _cache.get(token)
+    if user is not None:
+        return user
+    user = db.get_user_by_token(token)
+    if user:
+        _cache.set(token, user)
+    return user
+
+
+async def aresolve(token: str):
+    """resolve 的异步版本：签名令牌与缓存命中直接返回，需要查库时放到数据库线程池"""
+    if not token:
+        return None
+    if _signed_mode() and "." in token:
+        return _verify_signed(token)
+    user = _cache.get(token)
+    if user is not None:
+        return user
+    return await async_db.run(resolve, token)
+
+
+def invalidate_user(username: str):
+    _cache.invalidate_user(username)
+
+
+def get_stats() -> dict:
+    return {"mode": AUTH_CONFIG["token_mode"], **_cache.stats()}
@@ -0,0 +1,82 @@
+"""
+单飞（single-flight）请求合并
+同一个 key 的并发调用只真正执行一次，其余调用等待并共享同一个结果（或异常）；
+线程与协程可以混用：结果通过 concurrent.futures.Future 传递
+"""
+import json
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import Future
+
+
+def normalize(text: str) -> str:
+    """合并键用的文本归一化：去首尾空白、折叠连续空白、忽略大小写"""
+    return " ".join((text or "").split()).casefold()
+
+
+def make_key(*parts) -> str:
+    """由若干参数生成合并键（字符串参数先归一化）"""
+    normalized = [normalize(p) if isinstance(p, str) else p for p in parts]
+    raw = json.dumps(normalized, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    def __init__(self):
+        self._calls = {}  # key -> Future
+        self._lock = threading.Lock()
+        self.leaders = 0    # 实际执行的次数
+        self.followers = 0  # 被合并（共享结果）的次数
+
+    def _join(self, key):
+        """返回 (future, 是否由本次调用执行)"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.followers += 1
+                return future, False
+            future = self._calls[key] = Future()
+            self.leaders += 1
+            return future, True
+
+    def _finish(self, key, future: Future, result=None, error: BaseException = None):
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn, *args, **kwargs):
+        """同步调用：fn(*args, **kwargs)"""
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    async def ado(self, key, coro_fn, *args, **kwargs):
+        """异步调用：await coro_fn(*args, **kwargs)"""
+        future, leader = self._join(key)
+        if not leader:
+            # shield：跟随者被取消时不影响执行者和其他跟随者
+            return await asyncio.shield(asyncio.wrap_future(future))
+        try:
+            result = await coro_fn(*args, **kwargs)
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def stats(self) -> dict:
+        return {"in_flight": self.in_flight(), "leaders": self.leaders, "followers": self.followers}
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 与 benchmarks/run.py 一致：从仓库根目录导入后端模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
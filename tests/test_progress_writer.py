@@ -0,0 +1,51 @@
+"""
+进度合并写入：增量内容有变化时才拼接成快照，随进度写入同一条 UPDATE
+"""
+import json
+
+import database as db
+from progress_writer import ProgressWriter
+
+
+def test_partial_snapshot_written_only_when_changed(monkeypatch):
+    writes = []
+    monkeypatch.setattr(db, "update_task", lambda task_id, **fields: writes.append((task_id, fields)))
+    writer = ProgressWriter(interval=60)
+    chunks = []
+    writer.watch_partial("t1", {"article": chunks})
+
+    chunks.extend(["第一段", "第二段"])
+    writer.update("t1", current_step="✍️ 写作中")
+    writer.flush()
+    assert len(writes) == 1
+    assert writes[0][1]["current_step"] == "✍️ 写作中"
+    assert json.loads(writes[0][1]["partial"]) == {"article": "第一段第二段"}
+
+    writer.flush()  # 没有新内容，不写入
+    assert len(writes) == 1
+
+    chunks.append("第三段")
+    writer.flush("t1")
+    assert json.loads(writes[1][1]["partial"]) == {"article": "第一段第二段第三段"}
+
+    writer.forget_partial("t1")
+    chunks.append("第四段")
+    writer.flush()
+    assert len(writes) == 2
+
+
+def test_failed_partial_write_is_retried(monkeypatch):
+    calls = []
+
+    def update_task(task_id, **fields):
+        calls.append(fields)
+        if len(calls) == 1:
+            raise RuntimeError("连接断开")
+
+    monkeypatch.setattr(db, "update_task", update_task)
+    writer = ProgressWriter(interval=60)
+    writer.watch_partial("t1", {1: ["章节内容"]})
+    writer.flush()
+    writer.flush()
+    assert [json.loads(c["partial"]) for c in calls] == [{"1": "章节内容"}, {"1": "章节内容"}]
+    assert writer.errors == 1
@@ -0,0 +1,79 @@
+"""
+AIMD 并发控制：只有正常响应才加性增，429 / 5xx / 超时乘性减，4xx 不调整
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from agents import llm_client, rate_limiter
+
+
+def _limiter(initial=8):
+    return rate_limiter.ProviderLimiter(rpm=1000, tpm=0, max_concurrency=32, min_concurrency=1, initial_concurrency=initial)
+
+
+def _run_slot(limiter, status=None, error=None):
+    async def run():
+        async with rate_limiter.aslot(limiter) as outcome:
+            if error is not None:
+                raise error
+            if status == 200:
+                outcome["succeeded"] = True
+            elif status >= 500:
+                outcome["failed"] = True
+    try:
+        asyncio.run(run())
+    except Exception:
+        pass
+
+
+def test_only_success_increases_limit():
+    limiter = _limiter()
+    _run_slot(limiter, status=200)
+    assert limiter.limit > 8
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"status": 503},
+    {"error": httpx.ReadTimeout("timed out")},
+    {"error": httpx.ConnectError("connection refused")},
+    {"error": llm_client.LLMError("API错误: 502", 502)},
+])
+def test_server_errors_and_timeouts_decrease_limit(kwargs):
+    limiter = _limiter()
+    _run_slot(limiter, **kwargs)
+    assert limiter.limit == 4
+    assert limiter.failed == 1
+    assert limiter.paused_until == 0.0
+
+
+def test_client_errors_leave_limit_unchanged():
+    limiter = _limiter()
+    _run_slot(limiter, error=llm_client.LLMError("API错误: 400", 400))
+    _run_slot(limiter, error=llm_client.LLMError("AI API返回空响应"))
+    assert limiter.limit == 8
+    assert limiter.failed == 0
+
+
+def test_chat_completion_5xx_retry_is_not_counted_as_success(monkeypatch):
+    limiter = _limiter()
+    responses = iter([
+        httpx.Response(503),
+        httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}], "usage": {"total_tokens": 10}}),
+    ])
+
+    async def request(method, url, **kwargs):
+        return next(responses)
+
+    monkeypatch.setattr(llm_client, "request", request)
+    monkeypatch.setattr(llm_client, "_limiter_for", lambda config, kind="chat": limiter)
+    monkeypatch.setattr(rate_limiter, "backoff_delay", lambda attempt, retry_after=None: 0)
+
+    content = asyncio.run(llm_client.chat_completion(
+        [{"role": "user", "content": "hi"}], config={"api_key": "k", "api_base": "http://llm.test/v1"}
+    ))
+    assert content == "ok"
+    assert limiter.failed == 1
+    assert limiter.limit == pytest.approx(4 + 1 / 4)
+    assert limiter.in_flight == 0
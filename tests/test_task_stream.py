@@ -0,0 +1,87 @@
+"""
+任务进度 SSE：任务重试后由其他进程领取时，/api/task/{id}/stream 转为读取数据库并以 done 结束；
+其他进程写入的增量快照以 delta/reset 事件推送
+"""
+import json
+import asyncio
+
+import app
+import async_db as adb
+import generation
+
+
+def _events(chunks):
+    return [json.loads(c[len("data: "):]) for c in chunks if c.startswith("data: ")]
+
+
+def test_stream_ends_with_done_after_retry_claimed_out_of_process(monkeypatch):
+    task_id = "t-retry"
+    user = {"username": "alice"}
+    generation.tasks_memory[task_id] = {"status": "running", "steps": [], "current_step": "✍️ 写作中",
+                                        "type": "article", "topic": "x", "user": "alice"}
+    # 重试后由 worker.py 领取：数据库里依次是执行中、已完成
+    rows = iter([
+        {"id": task_id, "user": "alice", "status": "running", "current_step": "🚀 重新生成", "completed": 0, "total": 0, "error": None},
+        {"id": task_id, "user": "alice", "status": "completed", "current_step": "🎉 完成", "completed": 0, "total": 0, "error": None},
+    ])
+    last = {}
+
+    async def get_task(tid, include_partial=False):
+        last.update(next(rows, last))
+        return dict(last)
+
+    monkeypatch.setattr(adb, "get_task", get_task, raising=False)
+    monkeypatch.setattr(app, "TASK_DB_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(app, "TASK_STREAM_INTERVAL", 0.01)
+
+    async def run():
+        response = await app.stream_task(task_id, user)
+        chunks = []
+
+        async def consume():
+            async for chunk in response.body_iterator:
+                chunks.append(chunk)
+
+        consumer = asyncio.create_task(consume())
+        await asyncio.sleep(0.05)
+        generation.fail_task(task_id, "连接中断", retry=True)
+        await asyncio.wait_for(consumer, timeout=5)
+        return chunks
+
+    events = _events(asyncio.run(run()))
+    assert task_id not in generation.tasks_memory
+    assert events[-1] == {"type": "done", "status": "completed", "error": None}
+    assert any(e.get("current_step") == "🚀 重新生成" for e in events)
+
+
+def test_stream_sends_partial_snapshots_from_db(monkeypatch):
+    task_id = "t-remote"
+    user = {"username": "alice"}
+    generation.tasks_memory.pop(task_id, None)
+    base = {"id": task_id, "user": "alice", "status": "running", "current_step": "✍️ 写作中", "completed": 0, "total": 0, "error": None}
+    rows = iter([
+        {**base, "partial": {"article": "第一段"}},
+        {**base, "partial": {"article": "第一段第二段"}},
+        {**base, "partial": {"article": "重写"}},  # 重试后重新生成
+        {**base, "status": "completed", "partial": {}},
+    ])
+
+    async def get_task(tid, include_partial=False):
+        # 权限检查只读状态，轮询时带上增量快照
+        return next(rows) if include_partial else dict(base)
+
+    monkeypatch.setattr(adb, "get_task", get_task, raising=False)
+    monkeypatch.setattr(app, "TASK_DB_POLL_INTERVAL", 0.01)
+
+    async def run():
+        response = await app.stream_task(task_id, user)
+        return [chunk async for chunk in response.body_iterator]
+
+    events = [e for e in _events(asyncio.run(run())) if e["type"] in ("delta", "reset", "done")]
+    assert events == [
+        {"type": "delta", "part": "article", "content": "第一段"},
+        {"type": "delta", "part": "article", "content": "第二段"},
+        {"type": "reset", "part": "article"},
+        {"type": "delta", "part": "article", "content": "重写"},
+        {"type": "done", "status": "completed", "error": None},
+    ]
@@ -0,0 +1,53 @@
+"""
+独立任务工作进程
+与 API 分开部署、单独扩容文章/文档生成能力
+
+用法:
+    python worker.py                          # 使用 JOB_CONFIG 中的进程数/线程数
+    python worker.py --processes 4 --threads 2
+"""
+import argparse
+import multiprocessing
+import signal
+from config import JOB_CONFIG
+
+
+def run_worker_process(threads: int):
+    """单个工作进程：启动若干工作线程并常驻"""
+    import job_queue
+    workers = job_queue.start_workers(threads)
+    # 收到 SIGTERM 后不再领取新任务，等当前任务执行完再退出
+    signal.signal(signal.SIGTERM, lambda *_: [w.stop() for w in workers])
+    try:
+        for worker in workers:
+            while worker.thread.is_alive():
+                worker.thread.join(1)
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LearnFlow AI 任务工作进程")
+    parser.add_argument("--processes", type=int, default=JOB_CONFIG["worker_processes"], help="工作进程数")
+    parser.add_argument("--threads", type=int, default=JOB_CONFIG["worker_threads"], help="每个进程的工作线程数")
+    args = parser.parse_args()
+
+    import migrations
+    migrations.ensure_schema()
+    print(f"🛠️ 启动 {args.processes} 个工作进程，每个进程 {args.threads} 个工作线程")
+    processes = [
+        multiprocessing.Process(target=run_worker_process, args=(args.threads,), name=f"learnflow-worker-{i}")
+        for i in range(args.processes)
+    ]
+    for p in processes:
+        p.start()
+    try:
+        for p in processes:
+            p.join()
+    except KeyboardInterrupt:
+        for p in processes:
+            p.terminate()
+
+
+if __name__ == "__main__":
+    main()